@@ -0,0 +1,143 @@
+"""
+GIS setup for Hillslope River Routing Model (HRR): all steps in one run
+
+Runs Step0 through Step7 with the parameters below and skips the steps whose inputs, parameters
+and script are unchanged since their last run (hrrPipeline.py), e.g. a new land cover dataset
+reruns only the land cover part of Step4.1, Step4.2 and Step5.
+Each step keeps its own other parameters; the ones set here replace those in the script.
+Every step and its sub steps are timed into logFile (hrrLog.py), summed up at the end.
+
+Hydro-Geo-Spatial Research Lab
+Website: http://www.northeastern.edu/beighley/home/
+"""
+
+import os, os.path
+import hrrPipeline, hrrLog
+
+#####***** Input parameters CHANGE AS NEEDED *****#####
+gisSpace = r"C:\Research\Scale_RC_aveVel_0316\HRRSetup\1000\GISworking2" # GIS working folder (Step1b to Step4)
+txtSpace = r"C:\Research\Scale_RC_aveVel_0316\HRRSetup\1000\HRRtxt2" # Folder for the model text and bin files (Step5 to Step7)
+
+fdirg = r"C:\Research\NASA_Decomp\Ohio_GIS_basic\fdirm_ohio" # Flow direction of the region, made before
+facca = r"C:\Research\NASA_Decomp\Amazon\fdiracc\facca1" # Flow accumulation larger than the region, made before
+srtm = r"C:\Research\NASA_Decomp\Amazon\fdiracc\srtm41a1" # DEM larger than the region, made before
+faccg = r"C:\Research\NASA_Decomp\Ohio_GIS_basic\faccm_ohio" # Flow accumulation of the region (Step0)
+demg = r"C:\Research\NASA_Decomp\Ohio_GIS_basic\dem_oh_wgs" # DEM of the region (Step0)
+demg_m = r"C:\Research\NASA_Decomp\Ohio_GIS_basic\dem_ohio" # DEM of the region in meters (Step1a)
+projection = r"C:\Research\HRR_0326\2.1\2.1\Lambert Azimuthal Eq Area N America (Flood).prj" # meters
+
+unit = 'Degree' # Unit for DEM grid, Meter or Degree
+cellSize = 0.00083333333 # Grid size of fdir/DEM, Meters or decimal degrees
+A_thrhld = 1000 # Threshold area for stream network tips, sqkm
+region = 'OH' # two letters represent simulated basin
+zone = '02' # two numbers represent the model run
+
+ksatFolder = r"C:\Research\HRR_0326\GlobalData\GlobalData\k_s" # Folder of the k_s nc files
+thetaFolder = r"C:\Research\HRR_0326\GlobalData\GlobalData\theta_s" # Folder of the theta_s nc files
+lcPath = r"C:\Research\HRR_0326\GlobalData\GlobalData\LandCover2012" # Folder of the global land cover rasters
+lcName = 'lc2012' # Land cover raster in lcPath
+
+fortSpace = r"C:\Research\HRR_0326\2.1\2.1\MetCC" # Folder with the met grids (<name>_Grid.shp)
+gridList = ['TRMM'] # Met grids for Step6
+makebinsSpace = r"C:\Research\Amazon\AM_AG_GIS\HRR_g\makebins" # Step7: makebins folder (input_P_ET.txt, Fortran exe)
+datasets = [ # Step7: [met grid, met time series file (engine python only), records repeat, scale, bin file]
+    ["TRMM", None, 1, 1.0, "P.bin"],
+    ]
+
+stateFile = os.path.join (gisSpace, 'RunSteps_state.json') # keys of the last run of each step
+force = [] # names of steps to run even when unchanged, e.g. ['Step5']
+dryRun = False # True: only list the steps that would run
+logFile = os.path.join (gisSpace, 'RunSteps_log.jsonl') # timings of the steps (JSON lines, appended), None for none
+#####****************************#####
+
+
+def gis (name):
+    return os.path.join (gisSpace, name)
+
+
+def txt (name):
+    return os.path.join (txtSpace, name)
+
+
+def stages ():
+    """ The steps, in run order, with their parameters, inputs and outputs """
+    place = region + zone
+    hrr3 = gis ('HRR_Table3_' + place + '.dbf')
+    soils = ['ksat_hm_cm_d.asc', 'theta.asc', 'soilD_m.asc']
+    soilsp = [gis (os.path.splitext (n)[0] + 'p') for n in soils]
+    lc = lcName + '_ex'
+    return [
+        hrrPipeline.stage ('Step0', 'Step0_InputGrids_21.py',
+                           {'fdirg': fdirg, 'facca': facca, 'srtm41a': srtm, 'demg': demg, 'faccg': faccg},
+                           inputs = [fdirg, facca, srtm], outputs = [demg, faccg]),
+        hrrPipeline.stage ('Step1a', 'Step1a_DEMm_21.py',
+                           {'demg': demg, 'demg_m': demg_m, 'projection': projection},
+                           inputs = [demg, projection], outputs = [demg_m]),
+        hrrPipeline.stage ('Step1b', 'Step1b_GlobalFlood_21.py',
+                           {'unit': unit, 'DEMcellSize': cellSize, 'targetWorkspace': gisSpace,
+                            'flowAccumulation': faccg, 'drainageDirection': fdirg, 'A_thrhld': A_thrhld},
+                           inputs = [faccg, fdirg],
+                           outputs = [gis ('Streams.shp'), gis ('Catchments.shp'), gis ('Watersheds'), gis ('lfpstr.shp')]),
+        hrrPipeline.stage ('Step2', 'Step2_HRR_Geo_21.py',
+                           {'cellSize': cellSize, 'targetWorkspace': gisSpace, 'flowAcc': faccg,
+                            'region': region, 'zone': zone, 'projection': projection},
+                           inputs = [gis ('Streams.shp'), gis ('Catchments.shp'), gis ('lfpstr.shp'), faccg, projection],
+                           outputs = [hrr3, gis ('lfpstrd.shp')]),
+        # Step3 and Step4.2/4.3 add their fields to HRR_Table3 in place: they need Step2, Step5 reads
+        # the table with all their fields
+        hrrPipeline.stage ('Step3', 'Step3_HRRslope_21.py',
+                           {'drainageDirection': fdirg, 'targetWorkspace': gisSpace, 'DemRas': demg_m,
+                            'hrr3': os.path.basename (hrr3)},
+                           inputs = [fdirg, demg_m, gis ('Catchments.shp'), gis ('lfpstrd.shp')],
+                           outputs = [hrr3], needs = ['Step2']),
+        hrrPipeline.stage ('Step4.0', 'Step4.0_soildata.py',
+                           {'ksatFolder': ksatFolder, 'thetaFolder': thetaFolder, 'targetWorkspace': gisSpace,
+                            'writeAscii': True},
+                           inputs = [ksatFolder, thetaFolder, gis ('Catchments.shp')],
+                           outputs = [gis (n) for n in soils]),
+        # Step4.1 twice, soils and land cover, so a new land cover dataset leaves the soils alone
+        hrrPipeline.stage ('Step4.1_soils', 'Step4.1_Proj_UseFdir_21.py',
+                           {'targetWorkspace': gisSpace, 'drainageDirection': fdirg, 'rast_global': [],
+                            'rast_cat': soils},
+                           inputs = [gis (n) for n in soils] + [fdirg], outputs = soilsp),
+        hrrPipeline.stage ('Step4.1_lc', 'Step4.1_Proj_UseFdir_21.py',
+                           {'targetWorkspace': gisSpace, 'drainageDirection': fdirg, 'global_rastPath': lcPath,
+                            'rast_global': [lcName], 'rast_cat': [lc], 'nearest_cat': [lc]},
+                           inputs = [os.path.join (lcPath, lcName), fdirg], outputs = [gis (lc), gis (lc + 'p')]),
+        hrrPipeline.stage ('Step4.2', 'Step4.2_HRR_LC_21.py',
+                           {'drainageDirection': fdirg, 'targetWorkspace': gisSpace, 'rastPath': gisSpace,
+                            'hrr3': os.path.basename (hrr3)},
+                           inputs = [gis (lc + 'p'), gis ('Watersheds')], outputs = [hrr3], needs = ['Step2']),
+        hrrPipeline.stage ('Step4.3', 'Step4.3_HRR_Soils_21.py',
+                           {'drainageDirection': fdirg, 'targetWorkspace': gisSpace, 'rastPath': gisSpace,
+                            'nativePath': gisSpace, 'hrr3': os.path.basename (hrr3)},
+                           inputs = soilsp + [gis (n) for n in soils] + [gis ('Watersheds')],
+                           outputs = [hrr3], needs = ['Step2']),
+        hrrPipeline.stage ('Step5', 'Step5_HRRtoText_21.py',
+                           {'outputPath': txtSpace, 'hrr': hrr3},
+                           inputs = [hrr3],
+                           outputs = [txt ('channels.txt'), txt ('planes.txt'), txt ('output_calibration.txt')]),
+        # the met overlay needs the catchments and the HRR IDs of Step2 only
+        hrrPipeline.stage ('Step6', 'Step6_HRR_Met_21.py',
+                           {'zone': zone, 'region': region, 'outputSpace': txtSpace, 'fortSpace': fortSpace,
+                            'hrr': hrr3, 'catchments': gis ('Catchments.shp'), 'gridList': gridList},
+                           inputs = [gis ('Catchments.shp')] + [os.path.join (fortSpace, g + '_Grid.shp') for g in gridList],
+                           outputs = [txt ('Grid_overlay_{}.txt'.format (g)) for g in gridList], needs = ['Step2']),
+        # the Fortran exe writes the bin files where main_P_ET_v1_GCM.f90 says, so no outputs are declared
+        hrrPipeline.stage ('Step7', 'Step7_makebins.py',
+                           {'binSpace': txtSpace, 'makebinsSpace': makebinsSpace, 'datasets': datasets},
+                           inputs = [txt ('Grid_overlay_{}.txt'.format (d[0])) for d in datasets]
+                                    + [os.path.join (makebinsSpace, 'input_P_ET.txt'), os.path.join (makebinsSpace, 'makebins.exe')]),
+        ]
+
+
+def main ():
+    hrrLog.configure (logFile)
+    start = len (hrrLog.readLog (logFile)) if logFile and os.path.exists (logFile) else 0
+    ran = hrrPipeline.runStages (stages (), stateFile, force, dryRun)
+    print ('Steps run: ' + (', '.join (ran) if ran else 'none'))
+    if logFile and os.path.exists (logFile) and not dryRun:
+        hrrLog.report (hrrLog.readLog (logFile)[start:])
+
+if __name__ == "__main__":
+    main ()
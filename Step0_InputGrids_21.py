@@ -3,6 +3,7 @@
 
 # Import arcpy module
 import arcpy
+import hrrRaster, hrrLog
 
 import sys
 print sys.maxsize
@@ -21,9 +22,22 @@ srtm41a = "C:\\Research\\NASA_Decomp\\Amazon\\fdiracc\\srtm41a1" #larger than re
 demg = "C:\\Research\\Amazon\\AM_AG_GIS\\grids\\dem1" #region's facc, will be created in the step
 faccg = "C:\\Research\\Amazon\\AM_AG_GIS\\grids\\facc1" #region's facc, will be created in the step
 
+# Also copy fdir, facc and DEM to tiled stores (<grid>_tiles folders). Only Step3 reads them (DEM store,
+# numpy engine: slope tile by tile); Step1b needs fdir and facc whole, and Steps 4.2/4.3 make their own stores
+# (tileFolder), so leave off unless the DEM is too large
+makeTiles = False
+tileSize = 2048 # cells per tile side
+
 # Process: Extract by Mask
 arcpy.env.snapRaster = "fdirg"
-arcpy.gp.ExtractByMask_sa(facca, fdirg, faccg)
-arcpy.gp.ExtractByMask_sa(srtm41a, fdirg, demg)
+with hrrLog.step('ExtractByMask facc'):
+    arcpy.gp.ExtractByMask_sa(facca, fdirg, faccg)
+with hrrLog.step('ExtractByMask dem'):
+    arcpy.gp.ExtractByMask_sa(srtm41a, fdirg, demg)
 
+if makeTiles:
+    for grid, dtype in [(fdirg, 'int32'), (faccg, 'float64'), (demg, 'float32')]:
+        with hrrLog.step('rasterToTiles ' + grid):
+            hrrRaster.rasterToTiles(grid, grid + '_tiles', dtype, tileSize)
 
+hrrLog.report()
@@ -3,6 +3,7 @@
 
 # Import arcpy module
 import arcpy
+import hrrLog
 
 arcpy.CheckOutExtension("Spatial")
 arcpy.env.overwriteOutput = True
@@ -16,6 +17,7 @@ projection = r"C:\Research\HRR_0326\2.1\2.1\Lambert Azimuthal Eq Area N America
 
 # Process: Project Raster
 # change "90 90" if input dem is not 3 sec resolution; 90 90 represents output pixel size in meters
-arcpy.ProjectRaster_management(demg, demg_m, projection, "BILINEAR", "90 90")
+with hrrLog.step('ProjectRaster ' + demg):
+    arcpy.ProjectRaster_management(demg, demg_m, projection, "BILINEAR", "90 90")
 
-print('Done!')
+hrrLog.report()
@@ -15,8 +15,8 @@ Email: zhao.yua@husky.neu.edu
 import arcpy, os.path
 from arcpy import env
 from arcpy.sa import *
-from operator import itemgetter, attrgetter
 import sys
+import hrrFlow, hrrRaster, hrrSweep, hrrZonal, hrrLog
 
 arcpy.ResetEnvironments()
 
@@ -46,6 +46,18 @@ A_thrhold_lfp = 1.0
 # number of pixels, determined by user (please check lfpstr.shp in GIS after)
 # Mostly will not need to change below
 num_tip = 10.0                                            
+
+# Engine for stream links and watersheds: 'numpy' (hrrFlow.py, no Spatial Analyst needed)
+# or 'arcpy' (StreamLink and Watershed tools)
+engine = 'numpy'
+
+# numpy engine: more threshold areas (sqkm) built from the same flow routing pass, e.g. [1, 10, 100].
+# Stream links, watersheds, lfp grids and HRR unit tables of each go to targetWorkspace\sweep\A<area>,
+# with the map of every catchment to the one holding it at the next larger area (hrrSweep.py).
+# A_thrhld is added to the list and is the network used for the rest of this step (its MAX facc and
+# upd come from the sweep). The other areas get no Streams/Catchments shapefiles, so Step2 cannot run
+# on them as they are: rerun this step with A_thrhld set to the chosen area.
+sweepThresholds = []
                                                         
 #####****************************#####
 
@@ -54,10 +66,12 @@ if unit == 'Meter':
 	lngThreshold = int(A_thrhld/(DEMcellSize*0.001)/(DEMcellSize*0.001)) + 1
 	lfpThreshold = int(A_thrhold_lfp/(DEMcellSize*0.001)/(DEMcellSize*0.001)) + 1
 	lfptip = num_tip*DEMcellSize
+	cellKm = DEMcellSize*0.001
 elif unit == 'Degree':
 	lngThreshold = int(A_thrhld/(DEMcellSize*60*60*30*0.001)/(DEMcellSize*60*60*30*0.001)) + 1
 	lfpThreshold = int(A_thrhold_lfp/(DEMcellSize*60*60*30*0.001)/(DEMcellSize*60*60*30*0.001)) + 1
 	lfptip = num_tip*DEMcellSize
+	cellKm = DEMcellSize*60*60*30*0.001
 else:
     print 'Error: Units are not set'
     sys.exit()
@@ -92,61 +106,119 @@ if isGDB != "FileSystem":
     maxFacc = maxFacc [:-4]
     rivPt = rivPt [:-4]
 
-# Execute and Save Stream Grid file of all streams in catchments greater than lngThreshold
-outFlowAccumulationRC = Raster(flowAccumulation) >= lngThreshold
-outFlowAccumulationRC.save(strGrid)
-print 'Stream Grid grid created successfully'
+if engine == 'numpy':
+    # Stream links and watersheds from one ordering of the fdir grid
+    with hrrLog.step('read fdir and facc', unit = 'cells'):
+        fdirArr, fdirHdr = hrrRaster.readRaster(drainageDirection, int)
+        faccArr, faccHdr = hrrRaster.readRaster(flowAccumulation)
+        fdirMask = hrrRaster.nodataMask(fdirArr, fdirHdr) & hrrRaster.nodataMask(faccArr, faccHdr)
+        hrrLog.count(fdirArr.size)
+    if sweepThresholds:
+        # All threshold areas from one routing pass; the upd grid of goal 2 comes with it
+        areas = sorted(set(sweepThresholds + [A_thrhld]))
+        cells = [int(a/cellKm/cellKm) + 1 for a in areas]
+        with hrrLog.step('sweep', fdirArr.size, 'cells'):
+            route, levels = hrrSweep.sweep(fdirArr, faccArr, cells, lfpThreshold, DEMcellSize, DEMcellSize,
+                                           fdirMask, faccHdr['NODATA_value'])
+        names = dict(zip(cells, ['A' + str(a) for a in areas]))
+        with hrrLog.step('write sweep ' + ', '.join([str(a) for a in areas]) + ' sqkm', len(levels), 'levels'):
+            hrrSweep.writeSweep(os.path.join(targetWorkspace, 'sweep'), route, levels, fdirHdr,
+                                [names[level['threshold']] for level in levels], lfptip)
+        level = [l for l in levels if l['threshold'] == lngThreshold][0]
+        linkArr, basinArr = level['link'], level['basin']
+        updArr = route['upd'].reshape(fdirArr.shape)
+        zonal = hrrSweep.levelZonal(level) # COUNT and MAX of facc, MAX of upd of the A_thrhld catchments
+        del route, levels, level
+    else:
+        with hrrLog.step('streamNetwork', fdirArr.size, 'cells'):
+            linkArr, basinArr = hrrFlow.streamNetwork(fdirArr, faccArr, lngThreshold, fdirMask)
+
+    linkHdr = dict(fdirHdr, NODATA_value = 0)
+    with hrrLog.step('write ' + streamLink, linkArr.size, 'cells'):
+        hrrRaster.writeRaster(os.path.join(targetWorkspace, streamLink), linkArr, linkHdr)
+else:
+    # Execute and Save Stream Grid file of all streams in catchments greater than lngThreshold
+    with hrrLog.step('stream grid'):
+        outFlowAccumulationRC = Raster(flowAccumulation) >= lngThreshold
+        outFlowAccumulationRC.save(strGrid)
 
-# Execute and Save Stream Link Grid
-outStreamLink = StreamLink(strGrid, drainageDirection)
-outStreamLink.save(streamLink)
-print 'Stream link grid created successfully'
+    # Execute and Save Stream Link Grid
+    with hrrLog.step('StreamLink'):
+        outStreamLink = StreamLink(strGrid, drainageDirection)
+        outStreamLink.save(streamLink)
 
 # Execute Stream to Feature
-StreamToFeature(streamLink, drainageDirection, streams, "NO_SIMPLIFY")
-print 'Derived streams feature class created successfully'
+with hrrLog.step('StreamToFeature'):
+    StreamToFeature(streamLink, drainageDirection, streams, "NO_SIMPLIFY")
 
 # Execute and Save Watershed Grid
-outWatershed = Watershed(drainageDirection, streamLink)
-outWatershed.save(watershed)
-print 'Watershed grid created successfully'
+if engine == 'numpy':
+    with hrrLog.step('write ' + watershed, basinArr.size, 'cells'):
+        hrrRaster.writeRaster(os.path.join(targetWorkspace, watershed), basinArr, linkHdr)
+    del linkArr
+else:
+    with hrrLog.step('Watershed'):
+        outWatershed = Watershed(drainageDirection, streamLink)
+        outWatershed.save(watershed)
 
 # Convert watershed grid to polygons
-arcpy.RasterToPolygon_conversion(watershed, catchmentsAll, "NO_SIMPLIFY", "VALUE")
-print 'Watershed grid converted to polygons successfully'
+with hrrLog.step('RasterToPolygon'):
+    arcpy.RasterToPolygon_conversion(watershed, catchmentsAll, "NO_SIMPLIFY", "VALUE")
 
 # Dissolve Watershed polygons
-arcpy.Dissolve_management(catchmentsAll, catchments, "GRIDCODE")
-print 'Watershed polygons dissolved successfully'
+with hrrLog.step('Dissolve'):
+    arcpy.Dissolve_management(catchmentsAll, catchments, "GRIDCODE")
 
-arcpy.RasterToPoint_conversion (streamLink, rivPt, "VALUE")
-print 'Created stream link point file'
+with hrrLog.step('RasterToPoint'):
+    arcpy.RasterToPoint_conversion (streamLink, rivPt, "VALUE")
 
-arcpy.sa.ZonalStatisticsAsTable (catchments, "GRIDCODE", flowAccumulation, maxFacc, "DATA", "MAXIMUM" )
-print 'Max Flow Accumulation table created'
+if engine != 'numpy':
+    # With the numpy engine the MaxFAcc table is made together with the lfp table (Goal 2)
+    with hrrLog.step('ZonalStatisticsAsTable facc'):
+        arcpy.sa.ZonalStatisticsAsTable (catchments, "GRIDCODE", flowAccumulation, maxFacc, "DATA", "MAXIMUM" )
 
 #####*****Goal 2*****#####
-print 'Create upd raster'
-fdir1 = SetNull(flowAccumulation <= lfpThreshold,drainageDirection)
-downl = FlowLength(fdir1, "DOWNSTREAM", "")
-upl = FlowLength(fdir1, "UPSTREAM", "")
-upd = downl + upl
-
-print 'zonal'
-ZonalStatisticsAsTable(catchments, "GRIDCODE", upd, lfpTable, "DATA", "MAXIMUM")
-arcpy.JoinField_management (catchments, "GRIDCODE", lfpTable, "GRIDCODE")
-
-print 'Get maxfl raster'
-arcpy.PolygonToRaster_conversion(catchments, "MAX", maxfl, "CELL_CENTER", "NONE", DEMcellSize)
-
-print 'Get LFP raster'
-lfp = (upd + lfptip) > maxfl 
+if engine == 'numpy':
+    # Upstream and downstream flow length in one ordering of the masked fdir grid
+    if not sweepThresholds:
+        with hrrLog.step('updLength', fdirArr.size, 'cells'):
+            updArr = hrrFlow.updLength(fdirArr, faccArr, lfpThreshold, DEMcellSize, DEMcellSize, fdirMask)
+    del fdirArr, fdirMask
+    upd = os.path.join(targetWorkspace, "upd")
+    with hrrLog.step('write upd', updArr.size, 'cells'):
+        hrrRaster.writeRaster(upd, updArr, dict(fdirHdr, NODATA_value = -1))
+    upd = Raster(upd)
+else:
+    with hrrLog.step('FlowLength'):
+        fdir1 = SetNull(flowAccumulation <= lfpThreshold,drainageDirection)
+        downl = FlowLength(fdir1, "DOWNSTREAM", "")
+        upl = FlowLength(fdir1, "UPSTREAM", "")
+        upd = downl + upl
+
+if engine == 'numpy':
+    # MAX facc and MAX upd per catchment in one pass over the watershed labels (the sweep has them)
+    if not sweepThresholds:
+        with hrrLog.step('zonalStats facc upd', basinArr.size, 'cells'):
+            zonal = hrrZonal.zonalStats(basinArr, {'facc': faccArr, 'upd': updArr}, ['COUNT', 'MAX'],
+                                        {'facc': faccHdr['NODATA_value'], 'upd': -1})
+    del basinArr, faccArr, updArr
+    hrrZonal.saveTable(maxFacc, hrrZonal.subTable(zonal, ['facc_COUNT', 'facc_MAX'],
+                                                  {'facc_COUNT': 'COUNT', 'facc_MAX': 'MAX'}))
+    hrrZonal.saveTable(lfpTable, hrrZonal.subTable(zonal, ['upd_MAX'], {'upd_MAX': 'MAX'}))
+else:
+    with hrrLog.step('ZonalStatisticsAsTable upd'):
+        ZonalStatisticsAsTable(catchments, "GRIDCODE", upd, lfpTable, "DATA", "MAXIMUM")
+with hrrLog.step('JoinField ' + lfpTable):
+    arcpy.JoinField_management (catchments, "GRIDCODE", lfpTable, "GRIDCODE")
 
-#lfp.save(outlfp) #LFP grid
+with hrrLog.step('maxfl raster'):
+    arcpy.PolygonToRaster_conversion(catchments, "MAX", maxfl, "CELL_CENTER", "NONE", DEMcellSize)
 
 #Create LFP feature shapefile
-print 'make raster to feature'
-lfpR = SetNull(lfp, lfp, "Value = 0")
-arcpy.RasterToPolyline_conversion(lfpR, lfp_str,"ZERO","","NO_SIMPLIFY","")
+with hrrLog.step('LFP raster to feature'):
+    lfp = (upd + lfptip) > maxfl
+    #lfp.save(outlfp) #LFP grid
+    lfpR = SetNull(lfp, lfp, "Value = 0")
+    arcpy.RasterToPolyline_conversion(lfpR, lfp_str,"ZERO","","NO_SIMPLIFY","")
 
-print 'Success!'
+hrrLog.report()
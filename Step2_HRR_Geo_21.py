@@ -9,6 +9,9 @@ Parts:
 3. Takes HRR table, catchments shapefile projected, streams shapefile projected. Add fields to catchments (Area sqkm) and streams (Length km) and CumA Sqkm.
    Fill first two from joined fields. Cum A from variation of CumA HRR.
 
+All three parts work on one in-memory table (hrrTable.py, a column per field), joined by grid code.
+HRR_Table3 is written to disk once at the end.
+
 Hydro-Geo-Spatial Research Lab
 Website: http://www.northeastern.edu/beighley/home/
 By: Yuanhao Zhao
@@ -16,10 +19,8 @@ Email: zhao.yua@husky.neu.edu
 """
 
 import arcpy, os.path
-from arcpy import env
-from arcpy.sa import *
-
-from operator import itemgetter, attrgetter
+import hrrTopo, hrrTable, hrrParallel, hrrLog
+import numpy as np
 
 arcpy.env.overwriteOutput = True
 arcpy.CheckOutExtension("Spatial")
@@ -32,9 +33,12 @@ region = 'OH' #two letters represent simulated bas
 zone = '02' #two numbers represent the model run
 projection = r"C:\Research\HRR_0326\2.1\2.1\Lambert Azimuthal Eq Area N America (Flood).prj" #shapefiles need to be projected in meters
 projected = 'false' #True if streams and catchments already projected in meters
+saveTables = False #True to also write HRR_Table1 (after first pass) and HRR_Table2 (before part 2)
+numProcs = 1 #Processes for part 1, split by watershed (WID); 1 runs serially, 0 uses all cores
 #####*************************************************************************************************#####
 
 #####**** do not change any of the below *************************************************************#####
+@hrrLog.step ('Step2')
 def main (): 
     arcpy.env.workspace = targetWorkspace
 
@@ -60,63 +64,64 @@ def main ():
     if isGDB != "FileSystem":
         newTableFinal = "HRR_Table2_" + place
         newTable = "HRR_Table1_" + place
+        hrr3  = "HRR_Table3_" + place
     else:
         newTableFinal = "HRR_Table2_" + place + ".dbf"
         newTable = "HRR_Table1_" + place + ".dbf"
-        
-    arcpy.CopyRows_management (streamsFC, newTable)
-    joinTable (newTable, maxFacc)
+        hrr3 = "HRR_Table3_" + place + ".dbf"
 
-    addFieldsTable (newTable)
-    deleteFields (newTable)
-    fillZeroes (newTable)
+    with hrrLog.step ('read ' + streamsFC):
+        hrr = hrrTable.fromArc (streamsFC, skip = ['AREA', 'GRID_COD_1', 'SHAPE_LENG'])
+        joinTable (hrr, maxFacc)
+        hrrLog.count (hrrTable.numRows (hrr))
 
-    buildChannels (newTable, 1)
-    cumArea (newTable)
-    assignWID (newTable)
-    arcpy.Copy_management (newTable, newTableFinal)
+    addFieldsTable (hrr)
 
-    buildChannels (newTableFinal, 2)
-    cumArea (newTableFinal)
-    assignWID (newTableFinal)
+    if numProcs != 1:
+        # Watersheds processed in a process pool, same result as the serial run
+        hrr, topo = buildNetworkParallel (hrr, numProcs)
+    else:
+        topo = buildChannels (hrr, 1)
+        cumArea (hrr, topo)
+        assignWID (hrr, topo)
+        if saveTables:
+            hrrTable.writeArc (hrr, newTable)
 
-    relateHRR (newTableFinal)
+        topo = buildChannels (hrr, 2)
+        cumArea (hrr, topo)
+        assignWID (hrr, topo)
 
-    arcpy.AddField_management(newTableFinal, "Error", "FLOAT")
-    expression = 'float(!CumArea!*1.0 - !MAX!) / float (!CumArea!)'
-    arcpy.CalculateField_management (newTableFinal, 'ERROR', expression, 'PYTHON')
-    print "Error calculated"
+        relateHRR (hrr, topo)
 
-    #####***** Part2 *****#####
-    desc = arcpy.Describe(targetWorkspace)
-    isGDB = desc.workspaceType # FileSystem if not GDB, else type of GDB.
-    if isGDB != "FileSystem":
-       hrr3  = "HRR_Table3_" + region + zone
-    else:
-       hrr3 = "HRR_Table3_" + region + zone + ".dbf"
+    # Error = (CumArea - MAX) / CumArea
+    hrr["Error"] = ((hrr["CumArea"] * 1.0 - hrr["MAX"]) / hrr["CumArea"]).astype (np.float32)
+    if saveTables:
+        hrrTable.writeArc (hrr, newTableFinal)
 
-    arcpy.Copy_management (newTableFinal, hrr3)
-    arcpy.Intersect_analysis([LFP,catch], lfpits)
+    #####***** Part2 *****#####
+    with hrrLog.step ('Intersect ' + LFP):
+        arcpy.Intersect_analysis([LFP,catch], lfpits)
 
-    arcpy.Dissolve_management(lfpits, StrDis, "GRIDCODE", "", "MULTI_PART", "DISSOLVE_LINES")
+    with hrrLog.step ('Dissolve ' + lfpits):
+        arcpy.Dissolve_management(lfpits, StrDis, "GRIDCODE", "", "MULTI_PART", "DISSOLVE_LINES")
 
-    print 'Pjoject to meters'
     if (str(projected) == 'false') or (projected == False):
-            print "Projecting streams and catchments"
-            arcpy.Project_management(StrDis, lfp_m, projection)
+            with hrrLog.step ('Project ' + StrDis):
+                arcpy.Project_management(StrDis, lfp_m, projection)
+    else:
+            lfp_m = StrDis
 
     #calculate the channel length, add to the HRR3 table
-    print 'Calculate LFP'
-    fillFieldsLFP (hrr3, lfp_m)
+    fillFieldsLFP (hrr, lfp_m)
 
     #####***** Part3 *****#####
     if (str (projected) == 'false') or (projected == False):
-        print "Projecting streams and catchments"
         catch, streamsFC = projectFCs (catch, streamsFC, projection, targetWorkspace)
             
-    fillFields (hrr3, catch, streamsFC, region, zone)
+    fillFields (hrr, topo, catch, streamsFC, region, zone)
 
-    print 'Success'
+    with hrrLog.step ('write ' + hrr3, hrrTable.numRows (hrr)):
+        hrrTable.writeArc (hrr, hrr3)
 
 def checkGC (table):
     """ Returns correct Grid Code field. Can be either GRIDCODE or GRID_CODE """
@@ -128,14 +133,15 @@ def checkGC (table):
         elif f.name.upper() == "GRIDCODE":
             return "GRIDCODE"
 
-def joinTable (streamstable, table):
-    """Joins streams shapefile to MaxFAcc on Grid Code, for max FAcc by stream/catchment."""
+def joinTable (hrr, table):
+    """Joins MaxFAcc to streams on Grid Code, for max FAcc by stream/catchment."""
     fields = ['COUNT', 'MAX']
     gcTable = checkGC (table) # Get correct grid code name
-    gcStream = checkGC (streamstable)
-    arcpy.JoinField_management(streamstable, gcStream, table, gcTable, fields)
+    gcStream = hrrTable.gridCodeField (hrr)
+    stats = arcpy.da.TableToNumPyArray (table, [gcTable] + fields, null_value = 0)
+    hrrTable.joinColumns (hrr, gcStream, stats[gcTable], dict ((f, stats[f]) for f in fields))
 
-def addFieldsTable (table):
+def addFieldsTable (hrr):
     """Add new fields"""
     #HRR_ID is the ID in order of sort from low MAX to high MAX
     # WID is watershed ID
@@ -143,295 +149,105 @@ def addFieldsTable (table):
     # NumUp is the number of watersheds directly upstream
     # Up1, Up2, Up3 are grid codes of watersheds directly upstream
     # CumArea is the cumulative area of the upstream watersheds.
-    fieldNames = [["HRR_ID", "LONG"], ["WID", "LONG"], ["Down_ID","LONG"], ["NumUp","SHORT"], ["Up1ID","LONG"],
-                  ["Up2ID", "LONG"], ["Up3ID", "LONG"], ["Up4ID", "LONG"], ["CumArea", "FLOAT"]
+    fieldNames = [["HRR_ID", np.int32], ["WID", np.int32], ["Down_ID", np.int32], ["NumUp", np.int16], ["Up1ID", np.int32],
+                  ["Up2ID", np.int32], ["Up3ID", np.int32], ["Up4ID", np.int32], ["CumArea", np.float32]
                  ]
+    n = hrrTable.numRows (hrr)
+    # Zero is the default value
     for f in fieldNames:
-        arcpy.AddField_management (table, f[0], f[1])
-
-def deleteFields (table):
-    """ Delete unneeded fields"""
-    fieldNames = ['AREA', 'GRID_COD_1', 'SHAPE_LENG']
-    for f in fieldNames:
-        arcpy.DeleteField_management (table, f)
-
-def fillZeroes (table):
-    """ Fill zeroes into columns where zero is the default value """
-    fieldNames = ["NumUp", "Up1ID", "Up2ID", "Up3ID", "Up4ID", "WID"]
-    for f in fieldNames:
-        arcpy.CalculateField_management (table, f, 0)
+        hrr[f[0]] = np.zeros (n, dtype = f[1])
 
-def buildChannels (table, n):
+@hrrLog.step ('buildChannels')
+def buildChannels (hrr, n):
     #Build channels- associate from-to nodes with Grid Codes up and downstream,
     #associate watershed values."""
+    #Topology is held per unit (hrrTopo.py); any number of upstream units is kept,
+    #the first four in sort order go to Up1ID..Up4ID. Returns the topology.
+
+    gcNewTable = hrrTable.gridCodeField (hrr)
+    hrrLog.count (hrrTable.numRows (hrr))
+
+    if n == 1:
+        sortKeys = [hrr["MAX"]] # Sort on MAX
+    else:
+        sortKeys = [hrr["WID"], hrr["CumArea"]] #sort on WID, then CumArea
 
-    numRec = int (arcpy.GetCount_management (table).getOutput (0))
-    ##NumRec needs to be at least highest number found in from/to, because to and from nodes labels can be > number of records.
-    numRec += numRec*10
-
-    gcNewTable = checkGC (table)
-
-    toFrom =[0 for x in range (numRec)] #List where record number n is the from value
-    fromTo = [0 for x in range (numRec)] #List where record number n is the to value
-    sink = [0 for x in range (numRec)] #List to hold values for all records that are sinks or outlets.
-    downID = [-1 for x in range (numRec)]
-    numUp = [0 for x in range (numRec)]
-    up1 = [0 for x in range (numRec)]
-    up2 = [0 for x in range (numRec)]
-    up3 = [0 for x in range (numRec)]
-    up4 = [0 for x in range (numRec)]
-    hrr = [0 for x in range (numRec)]
-    dict = {} #Will contain {grCode:[0 downID, 1 numUp, 2 up1, 3 up2, 4 up3, 5 sink, 6 hrr]}
-
-    print 'new table grid code is', gcNewTable
-    fields = [gcNewTable, "MAX", "FROM_NODE", "TO_NODE", "HRR_ID", "DOWN_ID", "NUMUP", \
-              "Up1ID", "Up2ID", "Up3ID", "Up4ID", 'WID', 'CumArea']
-
-    with arcpy.da.SearchCursor (table, fields) as cursor:
-        # Stores all records referenced to grCode in a list of dictionaries.
-        for row in cursor:
-            grCode = row[0]
-            dict[grCode] =[0 for x in range (5)]
-
-        #Sorts cursor by MAX
-        cursor.reset ()
-
-        #Fills toFrom
-        for row in cursor:
-            fromID = int (row[2]) #From_Node
-            grCode = row[0]
-            # index fromID = grCode
-            toFrom [fromID] = grCode #c #ToFrom goes current from node to current grid code.
-
-        cursor.reset ()
-
-        #Fills fromTo
-
-        m = 1 #sink num
-        # Sort records
-        if n == 1:
-            cursor = sorted (cursor, key = itemgetter (1)) # Sort on MAX
-        else:
-            # cursor = sorted (cursor, key = itemgetter (10,11)) #sort on WID, then CumArea
-            cursor = sorted (cursor, key = itemgetter (11,12)) #sort on WID, then CumArea
-
-        for row in cursor:
-            grCode = row[0]
-            toID = int (row[3]) #To_Node
-
-            k = toFrom [toID] #k = grid code at the To_Node
-            if k == 0:
-                fromTo [grCode] = 0 #There is no down unit
-                sink [grCode] = m #This is a sink or terminus.
-                m +=1
-            else:
-                fromTo [grCode] = k #Row ID for the down unit (dpfaf)
-                sink [grCode] = 0 #This is not a sink or terminus.
-
-        #Fills column downValue
-
-    # Sort records
-        for row in cursor:
-            grCode = row[0]
-            downID [grCode] = fromTo [grCode] #Assigns DownID
-
-        if n == 1:
-            print "n = 1, sort on MAX"
-            cursor = sorted (cursor, key = itemgetter (1)) # Sort on MAX
-        else:
-            print "n != 1, sort on WID & CumArea"
-            #cursor = sorted (cursor, key = itemgetter (10,11)) #sort on WID, then CumArea
-            cursor = sorted (cursor, key = itemgetter (11,12)) #sort on WID, then CumArea
-        #Fills upID values. Next two loops are where data MUST be sorted by area (MAX)
-        c = 1
-        for row in cursor:
-            grCode = row[0]
-            dstr = downID [grCode]
-            hrr[grCode] = c
-            if up1[dstr] == 0: #If up1 at the next downstream is 0
-                up1 [dstr] = grCode #upID1 at row num downID = current row (c)
-                numUp [dstr] = 1
-            elif up1[dstr] > 0:
-                if up2 [dstr] == 0:
-                    up2 [dstr] = grCode
-                    numUp [dstr] = 2
-                elif up3 [dstr] == 0:
-                    up3 [dstr] = grCode
-                    numUp [dstr]= 3
-                elif up4 [dstr] == 0:
-                    up4 [dstr] = grCode
-                    numUp [dstr]= 4
-                elif dstr > 0:
-                    numUp = 9999
-                    print (str (dstr) + "has more than 4 watersheds flowing into it")
-            c +=1
-
-        # Sort records
-        # fills dictionary with values for use in update cursor.
-        for row in cursor:
-            grCode = row[0]
-            dict[grCode] = [downID[grCode], numUp[grCode], up1[grCode], up2[grCode],\
-                            up3[grCode], up4[grCode], sink[grCode], hrr[grCode]]
-        print "Channels determined"
-
-
-    #Update rows
-    with arcpy.da.UpdateCursor (table, fields) as cursor:
-        for row in cursor:
-            grCode = row[0]
-            row [4] = dict [grCode][7]
-            row [5] = dict [grCode][0]
-            row [6] = dict [grCode][1]
-            row [7] = dict [grCode][2]
-            row [8] = dict [grCode][3]
-            row [9] = dict [grCode][4]
-            row [10] = dict [grCode][5]
-            row [11] = dict [grCode][6]
-            cursor.updateRow (row)
-    print "Channels Built"
-    if cursor:
-        del cursor
-
-def cumArea (table):
+    topo = hrrTopo.buildTopology (hrr[gcNewTable], hrr["FROM_NODE"], hrr["TO_NODE"], sortKeys)
+    grCodes = topo['gridCode']
+    upIDs = hrrTopo.upColumns (topo, grCodes, 4)
+
+    for i in np.nonzero (topo['numUp'] > 4)[0]:
+        hrrLog.warning (str (grCodes[i]) + " has more than 4 watersheds flowing into it")
+
+    hrr["HRR_ID"][:] = topo['hrr']
+    hrr["Down_ID"][:] = hrrTopo.downValues (topo, grCodes)
+    hrr["NumUp"][:] = topo['numUp']
+    for k in range (4):
+        hrr["Up" + str (k + 1) + "ID"][:] = upIDs[:, k]
+    hrr["WID"][:] = topo['sink'] # outlets only, filled upstream by assignWID
+    return topo
+
+@hrrLog.step ('cumArea')
+def cumArea (hrr, topo):
     """ Calculates cumulative area of watershed at current catchment for each catchment in a watershed"""
-    gcNewTable = checkGC (table)
-    fields = [gcNewTable, "COUNT", "UP1ID", "UP2ID", "UP3ID", "UP4ID", "CumArea", "HRR_ID"]
-    numRec = int (arcpy.GetCount_management (table).getOutput (0))
-    numRec += numRec*10
-    #numRec += numRec/3
-
-    countL = [0 for x in range (numRec)] #List of all areas in Count field
-    sumArea = [0 for x in range (numRec)]
-
-    with arcpy.da.SearchCursor (table, fields) as cursor:
-        # Makes a list of all areas in order of Grid Code
-        for row in cursor:
-            id = row[0]
-            countL [id] = row[1]
-        cursor.reset()
-        #Sort on HRR_ID
-
-        cursor = sorted (cursor, key = lambda row:row[7])
-        # get all cumulative areas
-        for row in cursor:
-            # sumArea = area in count field + area in each Up field.
-            id = row [0]
-            sumArea[id] = countL [row[0]] + countL [row[2]]  + countL [row[3]] \
-                          + countL [row[4]] + countL [row[5]]
-            countL[id] = sumArea [id]
-
-    print "Cumulative area determined"
-
-    with arcpy.da.UpdateCursor (table, fields) as cursor:
-        for row in cursor:
-            id = row[0]
-            row[6] = sumArea [id]
-            cursor.updateRow (row)
-
-    print "Cumulative Area entered"
-
-    if cursor:
-        del cursor
-
-
-def assignWID (table):
-    """ Assigns watershed ID to each catchment"""
-    gcNewTable = checkGC (table)
-    fields = [gcNewTable,  "UP1ID", "UP2ID", "UP3ID", "UP4ID", "WID", "HRR_ID"]
-    numRec = int (arcpy.GetCount_management (table).getOutput (0))
-    numRec += numRec*10
-
-    wid = [0 for x in range (numRec)]
-
-    with arcpy.da.SearchCursor (table, fields) as cursor:
-
-        # Makes a list of all areas in order of Grid Code
-        for row in cursor:
-            id = row[0]
-            wid [id] = row[5]
-
-        cursor.reset()
-
-        #Sort on HRR_ID
-        cursor = sorted (cursor, key = lambda row:row[6], reverse = True)
-
-        for row in cursor:
-            # fills list with appropriate watersheds.
-            id = row[0]
-            up1 = row[1]
-            up2 = row[2]
-            up3 = row[3]
-            up4 = row[4]
-
-            if up1 > 0:
-                wid[up1] = wid[id]
-            if up2 > 0:
-                wid[up2] = wid[id]
-            if up3 > 0:
-                wid[up3] = wid[id]
-            if up4 > 0:
-                wid[up4] = wid[id]
-
-        print "WID determined"
-
-    #updates WID column in table
-    with arcpy.da.UpdateCursor (table, fields) as cursor:
-        for row in cursor:
-            id = row[0]
-            row [5] = wid[id]
-            cursor.updateRow (row)
-
-        print "WID entered"
-
-    if cursor:
-        del cursor
-
-def relateHRR (table):
+    # sumArea = area in count field + area of all units upstream
+    hrr["CumArea"][:] = hrrTopo.accumulate (topo['down'], hrr["COUNT"])
+    hrrLog.count (len (topo['down']))
+
+@hrrLog.step ('assignWID')
+def assignWID (hrr, topo):
+    """ Assigns watershed ID to each catchment. Returns (wids, ptr, units) unit ranges per WID (see hrrTopo.widRanges)."""
+    # outlets hold their sink number in WID (buildChannels), every unit takes its outlet's
+    hrr["WID"][:] = hrrTopo.assignWID (topo['down'], hrr["WID"])
+    hrrLog.count (len (topo['down']))
+    return hrrTopo.widRanges (hrr["WID"], topo['order'])
+
+@hrrLog.step ('relateHRR')
+def relateHRR (hrr, topo):
     """ Relates up and down IDs on HRRID instead of Grid Code"""
-    gcNewTable = checkGC (table) # Get correct grid code name
-    fields = [ gcNewTable,  "HRR_ID", "UP1ID", "UP2ID", "UP3ID", "UP4ID", "DOWN_ID"]
-
-    with arcpy.da.SearchCursor (table, fields) as cursor:
-        allCodes = {} # dictionary relating grid codes to HRRID
-        for row in cursor:
-            # {grid code: hrr}
-            allCodes[row[0]] = row[1]
-
-        cursor.reset()
-        allCodes[0] = 0 # Takes care of entries with no up or down ID.
-
-    # update table replaceing grid code with HRRID in up and down IDs
-    with arcpy.da.UpdateCursor (table, fields) as cursor:
-        for row in cursor:
-            # up1 = allCodes[grid code from up1 column]= HRR at that column
-            row[2] = allCodes[row[2]]#up1
-            row[3] = allCodes[row[3]]#up2
-            row[4] = allCodes[row[4]]#up3
-            row[5] = allCodes[row[5]]#up4
-            row[6] = allCodes[row[6]]#down
-            cursor.updateRow (row)
-
-
-#Adds fields to feature class
-def addFields (fc, fieldList):
-    """ Adds fields in a list of fields"""
-    for field in fieldList:
-        print "Adding field " + field + " to " + fc
-        arcpy.AddField_management (fc, field, "FLOAT", "", "", "", "", "NULLABLE", "NON_REQUIRED", "")
-
-
-def fillFieldsLFP (hrr3, stream):   
-    fieldsTable = ["Lc_LFP_km"]
-    addFields (stream, fieldsTable)    #channel length by LFP
-    
-    #Update new fields
-    print "Updating simple fields"
-    arcpy.CalculateField_management (stream, "Lc_LFP_km", "!SHAPE.LENGTH!/1000", "PYTHON")
-    
-    newGC = checkGC (hrr3)
-    strGC = checkGC (stream)
-    
-    arcpy.JoinField_management (hrr3, newGC, stream, strGC, "Lc_LFP_km")
+    hrrID = hrr["HRR_ID"]
+    upIDs = hrrTopo.upColumns (topo, hrrID, 4)
+    for k in range (4):
+        hrr["Up" + str (k + 1) + "ID"][:] = upIDs[:, k]
+    hrr["Down_ID"][:] = hrrTopo.downValues (topo, hrrID)
+
+def networkBatch (job):
+    """ Part 1 for a batch of whole watersheds, IDs shifted to their place in the full table """
+    hrr, idOffset, widOffset = job
+    topo = buildChannels (hrr, 1)
+    cumArea (hrr, topo)
+    assignWID (hrr, topo)
+    topo = buildChannels (hrr, 2)
+    cumArea (hrr, topo)
+    assignWID (hrr, topo)
+    relateHRR (hrr, topo)
+
+    hrr["HRR_ID"] += idOffset
+    hrr["WID"] += widOffset
+    for f in ["Down_ID", "Up1ID", "Up2ID", "Up3ID", "Up4ID"]:
+        hrr[f][hrr[f] > 0] += idOffset
+    return hrr
+
+@hrrLog.step ('buildNetworkParallel')
+def buildNetworkParallel (hrr, procs):
+    """ Part 1 split by watershed over a process pool. Returns (table, topo with down only)."""
+    gc = hrrTable.gridCodeField (hrr)
+    # WID of the serial run: outlets numbered in order of MAX
+    topo = hrrTopo.buildTopology (hrr[gc], hrr["FROM_NODE"], hrr["TO_NODE"], [hrr["MAX"]])
+    wid = hrrTopo.assignWID (topo['down'], topo['sink'])
+    hrrLog.count (wid.size)
+
+    with hrrLog.step ('runByWatershed', int (wid.max ()), 'watersheds'):
+        hrr = hrrParallel.runByWatershed (networkBatch, hrr, wid, procs)
+    return hrr, {'down': hrrTopo.downFromIDs (hrr["HRR_ID"], hrr["Down_ID"])}
+
+
+@hrrLog.step ('fillFieldsLFP')
+def fillFieldsLFP (hrr, stream):   
+    """ Channel length by LFP, km """
+    codes, length = hrrTable.geometryColumn (stream, "SHAPE@LENGTH", 0.001)
+    hrrTable.joinColumns (hrr, hrrTable.gridCodeField (hrr), codes, {"Lc_LFP_km": length.astype (np.float32)})
+    hrrLog.count (codes.size)
 
 
 def prjNames (workspace):
@@ -454,93 +270,43 @@ def projectFCs (catch, stream, prj, workspace):
     c_m, s_m = prjNames (workspace)
     m = c_m, s_m, "Projecting catchments and streams, in ProjectFCs"
    
-    arcpy.Project_management(catch, c_m, prj)
-    arcpy.Project_management(stream, s_m, prj)
+    with hrrLog.step ('Project ' + catch):
+        arcpy.Project_management(catch, c_m, prj)
+    with hrrLog.step ('Project ' + stream):
+        arcpy.Project_management(stream, s_m, prj)
     return c_m, s_m
 
-def cumFields (table, count, cumulative ):
-   """ Calculates cumulative area of each catchment and all catchments upstream in sqkm. """
-   fields = [count, "UP1ID", "UP2ID", "UP3ID", "UP4ID", cumulative, "HRR_ID"]
-
-   countArea = [0] #List of all areas in Count field. HRR IDs start at 1, so 0 is a filler. If no HRRID listed, area is 0.
-   sumArea = {} #dictionart of cumulative sum of all areas.
-
-   with arcpy.da.SearchCursor (table, fields) as cursor:
-
-       #Sort on HRR_ID
-       cursor = sorted (cursor, key = lambda row:row[6])
-
-       # Makes a list of all areas at list index HRRID
-       for row in cursor:
-           countArea.append (row[0])
-
-       # get all cumulative areas
-       for row in cursor:
-           # sumArea = area in count field + area in each Up field.
-           id = row [6]
-           # sumArea  = area at currentHRRID + area in HRRID in up1 + area in HRRID in up2  + Aaea in HRRID in up3 + Aaea in HRRID in up4
-           sumArea[id] = countArea [row[6]] + countArea [row[1]] + countArea [row[2]] + countArea [row[3]] + countArea [row[4]]
-           countArea[id] = sumArea [id] # current cumulative area updated.
-
-   if cursor:
-       del cursor
-
-   print "Cumulative determined"
-   with arcpy.da.UpdateCursor (table, fields) as cursor:
-       for row in cursor:
-           id = row[6]
-           # cumulative area at current HRRID
-           row[5] = sumArea[id]
-           cursor.updateRow (row)
-
-   print "Cumulative entered"
-
-def fillFields (hrr3, catch, stream, region, zone):
+@hrrLog.step ('cumFields')
+def cumFields (hrr, topo, pairs):
+   """ Calculates cumulative values (e.g. area in sqkm) of each catchment and all catchments upstream.
+       pairs: [(field, cumulative field)], all accumulated in one pass. """
+   values = np.column_stack ([hrr[p[0]].astype (np.float64) for p in pairs])
+   # cumulative at current unit = value at current unit + values at all units upstream
+   sumArea = hrrTopo.accumulate (topo['down'], values)
+   for k in range (len (pairs)):
+       hrr[pairs[k][1]] = sumArea[:, k].astype (np.float32)
+   hrrLog.count (sumArea.shape[0])
+
+@hrrLog.step ('fillFields')
+def fillFields (hrr, topo, catch, stream, region, zone):
    """ Fills in length, area, and cumulative length and area fields."""
 
-   #Add fields to both tables
-   fieldsTable = ["CumA_sqkm","CumL_km","cumLfp_km"] #added by YZ
-   addFields (hrr3, fieldsTable)
-   addFields (catch, ["A_sqkm"])
-   addFields (stream, ["L_km"])
-   addFields (hrr3, ["Lp_km"])
+   gc = hrrTable.gridCodeField (hrr)
 
-   #Update new fields
-   print "Updating simple fields"
-
-   arcpy.CalculateField_management (stream, "L_km", "!SHAPE.LENGTH! / 1000", "PYTHON")   #GIS channel length
-   arcpy.CalculateField_management (catch, "A_sqkm", "!SHAPE.AREA@SQUAREKILOMETERS!", "PYTHON")
-
-   newGC = checkGC (hrr3)
-   strGC = checkGC (stream)
-   catchGC = checkGC (catch)
-
-   arcpy.JoinField_management (hrr3, newGC, stream, strGC, "L_km")
-   arcpy.JoinField_management (hrr3, newGC, catch, catchGC, "A_sqkm" )
+   #GIS channel length and catchment area
+   codes, length = hrrTable.geometryColumn (stream, "SHAPE@LENGTH", 0.001)
+   hrrTable.joinColumns (hrr, gc, codes, {"L_km": length.astype (np.float32)})
+   codes, area = hrrTable.geometryColumn (catch, "SHAPE@AREA", 1.0e-6)
+   hrrTable.joinColumns (hrr, gc, codes, {"A_sqkm": area.astype (np.float32)})
 
    #assume min length of change as 100 m
-   expression = "getClass(float(!Lc_LFP_km!),float(!A_sqkm!),0.1)"
-   #expression = "getClass(float(!Lc_LFP_km!),float(!A_sqkm!),cellSize)" 
-
-   codeblock = """def getClass(lpkm,asqkm,dx):
-     if lpkm < dx:
-        return asqkm/dx/2
-     elif lpkm >= dx:
-        return asqkm/lpkm/2"""
-    
-   arcpy.CalculateField_management (hrr3, "Lp_km", expression, "PYTHON", codeblock)  #EB
-
-   arcpy.JoinField_management (hrr3, newGC, catch, catchGC, "Lp_km" )
-
-   arcpy.DeleteField_management (catch, "A_sqkm")
-   arcpy.DeleteField_management (catch, "Lp_km")
-   arcpy.DeleteField_management (stream, "L_km")
+   dx = 0.1
+   lpkm = hrr["Lc_LFP_km"]
+   asqkm = hrr["A_sqkm"]
+   hrr["Lp_km"] = np.where (lpkm < dx, asqkm / dx / 2, asqkm / np.maximum (lpkm, dx) / 2).astype (np.float32)  #EB
    
-   print 'updating Cum fields'
-   cumFields (hrr3, "A_sqkm", "CumA_sqkm")
-   cumFields (hrr3, "L_km", "CumL_km")
-   cumFields (hrr3, "Lc_LFP_km", "cumLfp_km")
-
-#if __name__ == "__main__":
-#        main ();
-main ()
\ No newline at end of file
+   cumFields (hrr, topo, [("A_sqkm", "CumA_sqkm"), ("L_km", "CumL_km"), ("Lc_LFP_km", "cumLfp_km")])
+
+if __name__ == "__main__":
+    main ()
+    hrrLog.report ()
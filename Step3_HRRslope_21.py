@@ -3,6 +3,9 @@ GIS setup for Hillslope River Routing Model (HRR) Step 3
 
 Parts:
 1. Extract DEM data from longest flow path (LFP), measure the slope of LFP for each model unit in percent rise.
+   engine = 'numpy' computes both slopes and their catchment means in one tiled pass (hrrSlope), multi-core.
+   With the DEM tiled store of Step0 (makeTiles = True) the DEM is read tile by tile instead of whole.
+   With strSlope = 'path' the LFP slope is instead taken from the DEM profile along the LFP, following fdir.
 
 Hydro-Geo-Spatial Research Lab
 Website: http://www.northeastern.edu/beighley/home/
@@ -10,9 +13,11 @@ By: Yuanhao Zhao
 Email: zhao.yua@husky.neu.edu
 """
 
-import arcpy, os, os.path
+import arcpy, os, os.path, shutil
 from arcpy import env
 from arcpy.sa import *
+import numpy as np
+import hrrRaster, hrrSlope, hrrZonal, hrrLog
 
 #####***** input parameters *****#####
 drainageDirection = r"C:\Research\NASA_Decomp\Ohio_GIS_basic\fdirm_ohio" # Raster file of flow direction
@@ -23,8 +28,16 @@ slope_m = os.path.join(targetWorkspace,'slope_m')  # this code will make the slo
 slpstr_m = os.path.join(targetWorkspace,'slpstr_m') # this code will make the slope grid for channel
 
 hrr3 = "HRR_Table3_OH02.dbf" #HRR3 table in 'GIS_working' folder
+
+engine = 'numpy' # 'numpy' (tiled Horn slope, zonal means in the same pass) or 'arcpy' (Slope + ZonalStatisticsAsTable)
+numThreads = 0 # threads for the numpy engine, 0 = all cores
+tileSize = 1024 # rows/columns per tile for the numpy engine
+demTiles = DemRas + '_tiles' # numpy engine: DEM tiled store made by Step0 (makeTiles = True); used when it exists, with strSlope = 'raster'
+saveSlope = False # numpy engine: also save slope_m and slpstr_m grids (slope_m_tiles and slpstr_m_tiles stores with demTiles)
+strSlope = 'raster' # numpy engine, LFP slope: 'raster' (mean 3x3 slope of the LFP cells, as arcpy), 'path' (drop / length along the LFP) or 'fit' (fitted to the LFP profile)
 #####****************************#####
 
+@hrrLog.step ('Step3')
 def main ():
 	arcpy.env.overwriteOutput = True
 	arcpy.CheckOutExtension("Spatial")
@@ -50,15 +63,19 @@ def main ():
    			
 	StrslpStat = os.path.join (targetWorkspace, StrslpStat) #Stream (LFP) slope
 	slopeStat = os.path.join (targetWorkspace, slopeStat) #Catchment slope
+
+	if engine == 'numpy':
+		slopeNumpy (hrr3, catchments, lfp)
+		return
    
         arcpy.env.snapRaster = DemRas # Snap raster - fdir
-	print 'Slope for lfp'    
-	StrDem = arcpy.sa.ExtractByMask(DemRas, lfp)
-	slp_str = arcpy.sa.Slope(StrDem, "PERCENT_RISE")
+	with hrrLog.step ('Slope lfp'):
+		StrDem = arcpy.sa.ExtractByMask(DemRas, lfp)
+		slp_str = arcpy.sa.Slope(StrDem, "PERCENT_RISE")
         #slp_str.save(slpstr_m)
 
-	print 'Slope for Basin'
-	CatSlope = arcpy.sa.Slope(DemRas, "PERCENT_RISE")
+	with hrrLog.step ('Slope basin'):
+		CatSlope = arcpy.sa.Slope(DemRas, "PERCENT_RISE")
 	#CatSlope.save(slope_m)
     
         # set min slope to 0.001m/m (0.1%)
@@ -78,21 +95,18 @@ def main ():
 
 	gridCode = checkGC (catchments)
 
-	print ('zonal stats parameters : ' + catchments, gridCode, slp_strmod, StrslpStat, 'DATA', 'MEAN')
-	arcpy.sa.ZonalStatisticsAsTable (catchments, gridCode, slp_strmod, StrslpStat, 'DATA', 'MEAN')
+	with hrrLog.step ('ZonalStatisticsAsTable lfp slope'):
+		arcpy.sa.ZonalStatisticsAsTable (catchments, gridCode, slp_strmod, StrslpStat, 'DATA', 'MEAN')
 
 	# Join fields from catchments and slope with HRR
 	slopeField (hrr4, StrslpStat)
 
-	print 'slope for catchment'
-	print ('zonal stats parameters : ' + catchments, gridCode, CatSlopemod, slopeStat, 'DATA', 'MEAN')
-	arcpy.sa.ZonalStatisticsAsTable (catchments, gridCode, CatSlopemod, slopeStat, 'DATA', 'MEAN')
+	with hrrLog.step ('ZonalStatisticsAsTable catchment slope'):
+		arcpy.sa.ZonalStatisticsAsTable (catchments, gridCode, CatSlopemod, slopeStat, 'DATA', 'MEAN')
 		
 	# Join fields from catchments and slope with HRR
 	slopeFieldCat (hrr4, slopeStat)
 
-	print 'Success!'
-
 def addFields (table, names):
     for n in names:
         arcpy.AddField_management (table, n[0], n[1])
@@ -116,10 +130,103 @@ def checkGDB (workspace):
         return True
     return False
 
+def slopeNumpy (hrrTable, catchments, lfp):
+    """ Catchment and LFP slope (percent rise, min 0.1%) with hrrSlope, joined to the HRR table as
+        Slope_cat and Slope_str. Same results as the arcpy path: the LFP slope is the slope of the
+        DEM masked to the LFP cells, averaged over each catchment. """
+    arcpy.env.snapRaster = DemRas
+    arcpy.env.extent = DemRas
+    cs = arcpy.Describe (DemRas).meanCellWidth
+    gridCode = checkGC (catchments)
+
+    catRas = os.path.join (targetWorkspace, 'slpcat_z')
+    lfpRas = os.path.join (targetWorkspace, 'slplfp_z')
+    with hrrLog.step ('PolygonToRaster catchments'):
+        arcpy.PolygonToRaster_conversion (catchments, gridCode, catRas, "CELL_CENTER", "NONE", cs)
+    with hrrLog.step ('PolylineToRaster lfp'):
+        arcpy.PolylineToRaster_conversion (lfp, arcpy.Describe (lfp).OIDFieldName, lfpRas, "MAXIMUM_LENGTH", "NONE", cs)
+
+    if strSlope == 'raster' and hrrRaster.isTiles (demTiles):
+        catTable, strTable = slopeTiles (catRas, lfpRas)
+        joinSlopes (hrrTable, catTable, strTable, 'slope_MEAN')
+        for ras in (catRas, lfpRas):
+            arcpy.Delete_management (ras)
+        return
+
+    with hrrLog.step ('read dem and zones', unit = 'cells'):
+        dem, header = hrrRaster.readRaster (DemRas)
+        zones, zHdr = hrrRaster.readRaster (catRas, np.int64)
+        zones[~hrrRaster.nodataMask (zones, zHdr)] = 0
+        lfpCells, lHdr = hrrRaster.readRaster (lfpRas, np.int64)
+        onLfp = hrrRaster.nodataMask (lfpCells, lHdr)
+        hrrLog.count (dem.size)
+
+    with hrrLog.step ('zonalSlope basin', dem.size, 'cells'):
+        catTable, catSlope = hrrSlope.zonalSlope (dem, zones, header['cellsize'], nodata = header['NODATA_value'],
+                                                  tileSize = tileSize, numThreads = numThreads, saveSlope = saveSlope)
+    if strSlope == 'raster':
+        with hrrLog.step ('zonalSlope lfp', dem.size, 'cells'):
+            strTable, lfpSlope = hrrSlope.zonalSlope (dem, zones, header['cellsize'], nodata = header['NODATA_value'],
+                                                      mask = onLfp, tileSize = tileSize, numThreads = numThreads,
+                                                      saveSlope = saveSlope)
+        strField = 'slope_MEAN'
+    else:
+        fdir, fHdr = hrrRaster.readRaster (drainageDirection, np.int32)
+        if fdir.shape != dem.shape or abs (fHdr['xllcorner'] - header['xllcorner']) > 0.5 * cs \
+           or abs (fHdr['yllcorner'] - header['yllcorner']) > 0.5 * cs:
+            raise ValueError ('Flow direction and DEM grids differ, the LFP path slope needs both on one grid')
+        with hrrLog.step ('pathSlope lfp', int (onLfp.sum ()), 'cells'):
+            strTable = hrrSlope.pathSlope (fdir, dem, zones, header['cellsize'], pathMask = onLfp,
+                                           nodata = header['NODATA_value'], method = 'fit' if strSlope == 'fit' else 'drop')
+        strField = 'lfp_SLOPE'
+        lfpSlope = None
+    if saveSlope:
+        outHdr = dict (header, NODATA_value = -9999)
+        hrrRaster.writeRaster (slope_m, np.where (np.isnan (catSlope), -9999, catSlope), outHdr)
+        if lfpSlope is not None:
+            hrrRaster.writeRaster (slpstr_m, np.where (np.isnan (lfpSlope), -9999, lfpSlope), outHdr)
+
+    joinSlopes (hrrTable, catTable, strTable, strField)
+    for ras in (catRas, lfpRas):
+        arcpy.Delete_management (ras)
+
+def slopeTiles (catRas, lfpRas):
+    """ Catchment and LFP slope tables from the DEM tiled store (demTiles), one tile plus halo in
+        memory per thread. The catchment and LFP grids are copied to stores with the same tiles. """
+    demStore = hrrRaster.openTiles (demTiles)
+    stores = []
+    for ras in (catRas, lfpRas):
+        with hrrLog.step ('rasterToTiles ' + os.path.basename (ras)):
+            stores.append (hrrRaster.rasterToTiles (ras, ras + '_tiles', np.int32, demStore['tileSize']))
+    zoneStore, lfpStore = stores
+    if not hrrRaster.sameGrid (demStore['header'], zoneStore['header']):
+        raise ValueError ('DEM store ' + demTiles + ' does not hold the DEM grid, remake it with Step0')
+    cells = demStore['nrows'] * demStore['ncols']
+    cs = demStore['header']['cellsize']
+    outHdr = dict (demStore['header'], NODATA_value = -9999)
+    out = [hrrRaster.createTiles (path + '_tiles', outHdr, np.float32, demStore['tileSize']) if saveSlope else None
+           for path in (slope_m, slpstr_m)]
+    with hrrLog.step ('zonalSlopeTiles basin', cells, 'cells'):
+        catTable = hrrSlope.zonalSlopeTiles (demStore, zoneStore, cs, numThreads = numThreads, outStore = out[0])
+    with hrrLog.step ('zonalSlopeTiles lfp', cells, 'cells'):
+        strTable = hrrSlope.zonalSlopeTiles (demStore, zoneStore, cs, maskStore = lfpStore, numThreads = numThreads,
+                                             outStore = out[1])
+    for store in stores:
+        shutil.rmtree (store['path'])
+    return catTable, strTable
+
+def joinSlopes (hrrTable, catTable, strTable, strField):
+    """ Joins the catchment and LFP slope tables to the HRR table as Slope_cat and Slope_str """
+    for f in arcpy.ListFields (hrrTable):
+        if f.name in ('Slope_str', 'Slope_cat'):
+            arcpy.DeleteField_management (hrrTable, f.name)
+    with hrrLog.step ('join slopes', catTable.size):
+        hrrZonal.joinTable (hrrTable, strTable, [strField], {strField: 'Slope_str'})
+        hrrZonal.joinTable (hrrTable, catTable, ['slope_MEAN'], {'slope_MEAN': 'Slope_cat'})
+
 # gets slope by stream, joins it to HRR table
+@hrrLog.step ('join channel slope')
 def slopeField (hrrTable, StrslpStat):
-    print StrslpStat, 'is channel slope stat'
-    
     hrrGC = checkGC (hrrTable)
     slopeGC = checkGC(StrslpStat)
     
@@ -129,16 +236,13 @@ def slopeField (hrrTable, StrslpStat):
             arcpy.DeleteField_management (hrrTable, 'Slope_str')
             
     fields = ['MEAN']
-    print 'adding field'
     arcpy.AddField_management (hrrTable, 'Slope_str', 'FLOAT')
-    print 'joining mean'
     arcpy.JoinField_management (hrrTable, hrrGC, StrslpStat, slopeGC, fields)
     arcpy.CalculateField_management (hrrTable, 'Slope_str', '!MEAN!', 'PYTHON')
     arcpy.DeleteField_management (hrrTable, fields)
 
+@hrrLog.step ('join catchment slope')
 def slopeFieldCat (hrrTable, slopeStat):
-    print slopeStat, 'is catchment slope'
-    
     hrrGC = checkGC (hrrTable)
     slopeGC = checkGC(slopeStat)
     
@@ -148,14 +252,12 @@ def slopeFieldCat (hrrTable, slopeStat):
             arcpy.DeleteField_management (hrrTable, 'Slope_cat')
             
     fields = ['MEAN']
-    print 'adding field'
     arcpy.AddField_management (hrrTable, 'Slope_cat', 'FLOAT')
-    print 'joining mean'
     arcpy.JoinField_management (hrrTable, hrrGC, slopeStat, slopeGC, fields)
     expression = '!MEAN!'
     arcpy.CalculateField_management (hrrTable, 'Slope_cat', '!MEAN!', 'PYTHON')
     arcpy.DeleteField_management (hrrTable, fields)
 	
-#if __name__ == "__main__":
-#    main ();
-main ()
+if __name__ == "__main__":
+    main ()
+    hrrLog.report ()
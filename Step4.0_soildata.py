@@ -1,9 +1,56 @@
 # Step 4 --> extract soils data from global datasets
 
-##this is not python
-##
-##just telling you to run before going to step 4.1:
-##
-##    nc2ras_ks_soild.R
-##    nc2ras_theta.R
-##
+"""
+Python version of nc2ras_ks_soild.R and nc2ras_theta.R (the R codes can still be used instead).
+In: folders of the global k_s and theta_s netCDF files (one file per soil layer), Catchments.shp
+Out: ksat_hm_cm_d.tiles (harmonic mean k_s), theta.tiles (weighted mean theta_s) and soilD_m.tiles
+     (soil depth, m), tiled rasters cropped to the catchments. Step 4.1 reads them directly: set
+     rast_cat there to the .tiles names.
+By default the results equal those of the R codes: cells where any layer has no data are nodata, and
+the theta_s depth weighted sum is divided by 2.962 (as in nc2ras_theta.R), not by the depth 2.296.
+missingLayers and thetaDivisor below change this, and with it the model inputs (None raises theta
+by about 29%).
+
+Hydro-Geo-Spatial Research Lab
+Website: http://www.northeastern.edu/beighley/home/
+"""
+
+import os, os.path
+import hrrRaster, hrrSoils, hrrLog
+
+#####***** input parameters CHANGE AS NEEDED *****#####
+ksatFolder = r"C:\Research\HRR_0326\GlobalData\GlobalData\k_s" # Folder of the k_s nc files
+thetaFolder = r"C:\Research\HRR_0326\GlobalData\GlobalData\theta_s" # Folder of the theta_s nc files
+targetWorkspace = r"C:\Research\Scale_RC_aveVel_0316\HRRSetup\1000\GISworking2" # Working folder, Catchments.shp is there
+missingLayers = 'cell' # 'cell': a layer without data makes the cell nodata (R); 'layer': leave that layer out of the cell
+thetaDivisor = hrrSoils.thetaDivisor # 2.962 as in nc2ras_theta.R; None: divide by the depth of the layers (weighted mean)
+writeAscii = False # also write ksat_hm_cm_d.asc, theta.asc and soilD_m.asc as the R codes do
+#####****************************#####
+
+@hrrLog.step ('Step4.0')
+def main ():
+    with hrrLog.step ('catchment extent'):
+        bbox = hrrSoils.catchmentBox (os.path.join (targetWorkspace, "Catchments.shp"))
+
+    outputs = []
+    ksat = os.path.join (targetWorkspace, 'ksat_hm_cm_d.tiles')
+    soilD = os.path.join (targetWorkspace, 'soilD_m.tiles')
+    with hrrLog.step ('k_s harmonic mean and soil depth'):
+        hrrSoils.layeredMean (hrrSoils.layerFiles (ksatFolder), 'k_s', bbox, ksat, 'harmonic', soilD,
+                                missing = missingLayers)
+    outputs += [ksat, soilD]
+
+    theta = os.path.join (targetWorkspace, 'theta.tiles')
+    with hrrLog.step ('theta_s weighted mean'):
+        hrrSoils.layeredMean (hrrSoils.layerFiles (thetaFolder), 'theta_s', bbox, theta, 'arithmetic',
+                                missing = missingLayers, divisor = thetaDivisor)
+    outputs.append (theta)
+
+    if writeAscii:
+        for path in outputs:
+            with hrrLog.step ('write ' + os.path.basename (path)[:-6] + '.asc'):
+                hrrRaster.tilesToAscii (hrrRaster.openTiles (path), path[:-6] + '.asc')
+
+if __name__ == "__main__":
+    main ()
+    hrrLog.report ()
@@ -1,19 +1,17 @@
 # Step 4.1 --> setup soils and LC data
 
 """
-Note: Please extract soil raster files based on catchment before this step (see R codes). 
+Note: Please extract soil raster files based on catchment before this step (see R codes or Step4.0_soildata.py). 
 In: soil and LC raster files, project them using flow direction raster file.
 Out: Projected soil and LC raster files have same coordinate system as flow direction raster
+engine = 'numpy' resamples all rasters onto the fdir grid with one cached map per source grid (hrrResample)
+backend = 'numpy' runs without ArcGIS (hrrBackend): rasters are ESRI ASCII grids, e.g. fdirm_ohio.asc
 
 @author: Yuanhao
 """
 
-import arcpy, os, os.path
-from arcpy import env
-from arcpy.sa import *
-
-arcpy.env.overwriteOutput = True
-arcpy.CheckOutExtension("Spatial")
+import os, os.path
+import hrrRaster, hrrResample, hrrLog, hrrBackend
 
 #####***** input parameters CHANGE AS NEEDED *****#####
 targetWorkspace = r"C:\Research\Scale_RC_aveVel_0316\HRRSetup\1000\GISworking2" # Working folder (soils data from R code there too)
@@ -25,56 +23,51 @@ rast_global = ['lc2012']   # Landcover raster file in global raster path folder
 # Names of raster files for catchments will be projected using flow direction raster
 # *.asc files made with R codes
 rast_cat = ['ksat_hm_cm_d.asc', 'theta.asc', 'soilD_m.asc', 'lc2012_ex']
+#rast_cat = ['ksat_hm_cm_d.tiles', 'theta.tiles', 'soilD_m.tiles', 'lc2012_ex'] # made with Step4.0_soildata.py, numpy engine only
+nearest_cat = ['lc2012_ex'] # rasters resampled with NEAREST (categories), others BILINEAR
+
+engine = 'numpy' # 'numpy' (cached resampling maps, hrrResample) or 'arcpy' (ProjectRaster per raster)
+mapCache = os.path.join(targetWorkspace, 'rsmaps') # folder for the cached resampling maps
+backend = 'arcpy' # 'arcpy' or 'numpy' (no ArcGIS, ESRI ASCII grids; hrrBackend.py)
+fdirSR = None # 'numpy' backend: coordinate system of the fdir grid (EPSG code or WKT) when there is no fdirm_ohio.prj
 
 #####**********DO NOT CHANGE BELOW******************#####
 
-arcpy.env.workspace = targetWorkspace
-arcpy.env.snapRaster = drainageDirection # Snap raster - fdir
-arcpy.env.extent = drainageDirection
-inRectangle = arcpy.env.extent
+gp = hrrBackend.get(backend, workspace = targetWorkspace, snapRaster = drainageDirection, # Snap raster - fdir
+                    extent = drainageDirection, spatialReference = fdirSR)
 
 #%% Part 1: extract soil property raster files by flow direction raster of basin
 for name in rast_global:
-    print name
-    rast = os.path.join(global_rastPath, name)
+    rast = gp.rasterPath(os.path.join(global_rastPath, name))
     rastoutn = name+'_ex'
-    rastout = os.path.join(targetWorkspace, rastoutn)
+    rastout = gp.rasterPath(os.path.join(targetWorkspace, rastoutn))
     
 #    outras = ExtractByMask(rast, drainageDirection)
 #    outras.save(targetWorkspace+'\\'+name+'_cat')
     
-    rectExtract = ExtractByRectangle(rast, inRectangle, "INSIDE")
-    rectExtract.save(rastout)
+    with hrrLog.step('ExtractByRectangle ' + name):
+        gp.extractByExtent(rast, drainageDirection, rastout)
     
     
 #%% Part 2: Project the soil raster files which are not in projection of flow direction 
-fdircellsize = arcpy.GetRasterProperties_management(drainageDirection, "CELLSIZEX") # cell size
-desc_fdir = arcpy.Describe(drainageDirection)
-coor_system = desc_fdir.spatialReference
+coor_system = gp.spatialRef(drainageDirection)
 
-print 'Start to project...'
-for name in rast_cat:
-    print name
-    rast = os.path.join (targetWorkspace, name)
-    desc_rast = arcpy.Describe(rast)
-    
-    if desc_rast.extension == 'asc':
-        rastN = rast[:-4]
-        arcpy.ASCIIToRaster_conversion(rast, rastN, "FLOAT")
-        
-        desc_rastN = arcpy.Describe(rastN)
-        spatialRef_rastN = desc_rastN.spatialReference
-        if spatialRef_rastN.Name == 'Unknown':
-            arcpy.DefineProjection_management(rastN, '4326')
-            
-        rastp = rastN+'p' # p means projected
-        arcpy.ProjectRaster_management(rastN, rastp, drainageDirection, 'BILINEAR', fdircellsize)
-    else:
-        rastp = rast+'p'
-        if rast[-9:] == 'lc2012_ex':
-            print 'Nearest'
-            arcpy.ProjectRaster_management(rast, rastp, drainageDirection, 'NEAREST', fdircellsize)
-        else:
-            arcpy.ProjectRaster_management(rast, rastp, drainageDirection, 'BILINEAR', fdircellsize)
-        
-print 'Success!'
+if engine == 'numpy':
+    fdirHdr = hrrRaster.cleanHeader(gp.readHeader(drainageDirection))
+    for method in ('BILINEAR', 'NEAREST'):
+        names = [n for n in rast_cat if (n in nearest_cat) == (method == 'NEAREST')]
+        if not names:
+            continue
+        inPaths = [gp.rasterPath(os.path.join(targetWorkspace, n)) for n in names]
+        outPaths = [gp.rasterPath(os.path.join(targetWorkspace, os.path.splitext(n)[0] + 'p')) for n in names]
+        with hrrLog.step('resample ' + method + ' ' + ', '.join(names),
+                         int(fdirHdr['nrows']) * int(fdirHdr['ncols']) * len(names), 'cells'):
+            hrrResample.resampleRasters(inPaths, outPaths, fdirHdr, coor_system, method, mapCache, gp.defaultSR)
+else:
+    for name in rast_cat:
+        with hrrLog.step('ProjectRaster ' + name):
+            rast = gp.rasterPath(os.path.join(targetWorkspace, name))
+            rastp = gp.rasterPath(os.path.join(targetWorkspace, os.path.splitext(name)[0] + 'p')) # p means projected
+            gp.resample([rast], [rastp], drainageDirection, 'NEAREST' if name in nearest_cat else 'BILINEAR', mapCache)
+
+hrrLog.report()
@@ -7,46 +7,49 @@ By: Yuanhao Zhao
 Email: zhao.yua@husky.neu.edu
 """
 
-import arcpy, os, os.path
-from arcpy import env
-from arcpy.sa import *
+import os, os.path
+import hrrZonal, hrrLog, hrrBackend
+import numpy as np
 
 #####***** input parameters CAHNGE AS NEEDED*****#####
 drainageDirection = r"C:\Research\NASA_Decomp\Ohio_GIS_basic\fdirm_ohio" # Raster file of flow direction
 targetWorkspace = r"C:\Research\Scale_RC_aveVel_0316\HRRSetup\1000\GISworking2" #Output workspace folder
 rastPath = r"C:\Research\Scale_RC_aveVel_0316\HRRSetup\1000\GISworking2" #Land Cover data raster folder path; output from previous step
 hrr3 = "HRR_Table3_OH02.dbf" #HRR3 table in 'GIS_working' folder
+engine = 'numpy' # 'numpy' (hrrZonal.py, one pass over Watersheds grid) or 'arcpy' (ZonalStatisticsAsTable)
+backend = 'arcpy' # 'arcpy' or 'numpy' (no ArcGIS: Watersheds.asc and rasters as ESRI ASCII, HRR table as .csv; hrrBackend.py)
+tileFolder = None # numpy engine: folder for tiled copies of Watersheds and the rasters, so the zonal pass holds one tile at a time (hrrRaster); None reads whole grids
+tileSize = 2048 # cells per tile side
 #####****************************#####
 
+@hrrLog.step ('Step4.2')
 def main ():
-	arcpy.env.overwriteOutput = True
-	arcpy.CheckOutExtension("Spatial")
-
-	arcpy.env.workspace = targetWorkspace
-	arcpy.env.snapRaster = drainageDirection # Snap raster - fdir
+	gp = hrrBackend.get (backend, workspace = targetWorkspace, snapRaster = drainageDirection) # Snap raster - fdir
+	if engine == 'arcpy' and gp.name != 'arcpy':
+		raise ValueError ("engine 'arcpy' needs backend 'arcpy'")
 
 	catchments = "Catchments.shp" #shapefile of catchments	
 
 	#####***** Part2 *****#####
 	#arcpy.env.cellSize = cellsize
-	print 'Land Cover Properties'
 	names = [
 		 ["LC", "SHORT", "lc2012_exp", 1.0]
 		]
 
-	addFields(hrr3, names)
-	fillFields(catchments, hrr3, rastPath, names)
-
-	print 'Success!'
+	addFields(gp, hrr3, names)
+	if engine == 'numpy':
+		fillFieldsZonal(gp, "Watersheds", hrr3, rastPath, names)
+	else:
+		fillFields(catchments, hrr3, rastPath, names)
 
 
-def addFields (table, names):
+def addFields (gp, table, names):
     #print ("Adding fields")
-    for n in names:
-        arcpy.AddField_management (table, n[0], n[1])
+    gp.addFields (table, [(n[0], n[1]) for n in names])
         
 def checkGC (table):
     """ Returns correct Grid Code field. Can be either GRIDCODE or GRID_CODE """
+    import arcpy
     fields = arcpy.ListFields (table) 
     #Get correct name for gridcode field
     for f in fields:
@@ -57,6 +60,7 @@ def checkGC (table):
 
 def checkGDB (workspace):
     """ Returns true if GDB, false if not. """
+    import arcpy
     desc = arcpy.Describe(workspace) 
     isGDB = desc.workspaceType # FileSystem if not GDB, else type of GDB.
 
@@ -67,6 +71,7 @@ def checkGDB (workspace):
 	
 def fillFields (fc, outTable, rastPath, names):
     """Performs zonal statistics on all fields"""
+    import arcpy
     outGC = checkGC(outTable)
     fcGC = checkGC(fc)
     
@@ -80,21 +85,43 @@ def fillFields (fc, outTable, rastPath, names):
             
         expression = "(!MAJORITY!) / " + str (divisor)
         rast = os.path.join (rastPath, file)
-        print rast
         desc_rast = arcpy.Describe(rast)
         spatialRef_rast = desc_rast.spatialReference
-        print fc, fcGC, rast, statTable
-        arcpy.sa.ZonalStatisticsAsTable (fc, fcGC, rast, statTable, "DATA", "MAJORITY")
+        with hrrLog.step ('ZonalStatisticsAsTable ' + file):
+            arcpy.sa.ZonalStatisticsAsTable (fc, fcGC, rast, statTable, "DATA", "MAJORITY")
         statGC = checkGC (statTable)
     
-        arcpy.JoinField_management (outTable, outGC, statTable, statGC, "MAJORITY")
-        print ("calculating field")
-        arcpy.CalculateField_management (outTable, field, expression, "PYTHON")
+        with hrrLog.step ('join ' + field):
+            arcpy.JoinField_management (outTable, outGC, statTable, statGC, "MAJORITY")
+            arcpy.CalculateField_management (outTable, field, expression, "PYTHON")
     
         arcpy.DeleteField_management (outTable, "MAJORITY")
         arcpy.Delete_management(statTable)
 
+def fillFieldsZonal (gp, zones, outTable, rastPath, names):
+    """Zonal MAJORITY of all fields in one pass over the watershed grid (labels = grid codes)"""
+    rasters = {}
+    rename = {}
+    for item in names:
+        rasters[item[0]] = gp.rasterPath (os.path.join (rastPath, item[2]))
+        rename[item[0] + '_MAJORITY'] = item[0]
+    with hrrLog.step ('zonalStatsRasters ' + ', '.join (sorted (rasters))):
+        table = hrrZonal.zonalStatsRasters (gp.rasterPath (zones), rasters, ['MAJORITY'], tileFolder = tileFolder,
+                                              tileSize = tileSize)
+        hrrLog.count (table.size)
+    for item in names:
+        field = item[0] + '_MAJORITY'
+        table[field] /= item[3]
+    # Integer fields: catchments with no land cover data get -999
+    table = hrrZonal.subTable (table, sorted (rename.keys ()), rename)
+    out = table.astype ([(n, 'i4') for n in table.dtype.names])
+    for n in table.dtype.names:
+        out[n][np.isnan (table[n])] = -999
+    with hrrLog.step ('join ' + ', '.join (out.dtype.names[1:]), out.size):
+        gp.joinFields (outTable, out)
+
 #if __name__ == "__main__":
 #    main ();
 
 main()
+hrrLog.report()
@@ -7,48 +7,54 @@ By: Yuanhao Zhao
 Email: zhao.yua@husky.neu.edu
 """
 
-import arcpy, os, os.path
-from arcpy import env
-from arcpy.sa import *
+import os, os.path
+import hrrZonal, hrrOverlay, hrrLog, hrrBackend
 
 #####***** input parameters CHANGE AS NEEDED*****#####
 drainageDirection = r"C:\Research\NASA_Decomp\Ohio_GIS_basic\fdirm_ohio" # Raster file of flow direction
 targetWorkspace = r"C:\Research\Scale_RC_aveVel_0316\HRRSetup\1000\GISworking2" #Output workspace folder
 rastPath = r"C:\Research\Scale_RC_aveVel_0316\HRRSetup\1000\GISworking2" #soils data raster folder path; output from previous step
 hrr3 = "HRR_Table3_OH02.dbf" #HRR3 table in 'GIS_working' folder
+engine = 'numpy' # 'numpy' (hrrZonal.py, one pass over Watersheds grid), 'overlay' (native soil grids, hrrOverlay.py) or 'arcpy' (ZonalStatisticsAsTable)
+nativePath = r"C:\Research\Scale_RC_aveVel_0316\HRRSetup\1000\GISworking2" # 'overlay' engine: folder of the unprojected soil rasters (R codes or Step4.0)
+nativeRasters = {"kSat": "ksat_hm_cm_d.asc", "effPor": "theta.asc", "depth": "soilD_m.asc"} # 'overlay' engine: unprojected soil raster per field
+backend = 'arcpy' # 'arcpy' or 'numpy' (no ArcGIS: Watersheds.asc and rasters as ESRI ASCII, HRR table as .csv; hrrBackend.py)
+tileFolder = None # numpy engine: folder for tiled copies of Watersheds and the rasters, so the zonal pass holds one tile at a time (hrrRaster); None reads whole grids
+tileSize = 2048 # cells per tile side
 #####****************************#####
 
+@hrrLog.step ('Step4.3')
 def main ():
-	arcpy.env.overwriteOutput = True
-	arcpy.CheckOutExtension("Spatial")
-
-	arcpy.env.workspace = targetWorkspace
-	arcpy.env.snapRaster = drainageDirection # Snap raster - fdir
+	gp = hrrBackend.get (backend, workspace = targetWorkspace, snapRaster = drainageDirection) # Snap raster - fdir
+	if engine == 'arcpy' and gp.name != 'arcpy':
+		raise ValueError ("engine 'arcpy' needs backend 'arcpy'")
 
 	catchments = "Catchments.shp" #shapefile of catchments	
 
 	#####***** Part2 *****#####
 	#arcpy.env.cellSize = cellsize
-	print 'Soil/Cover properties'
 	names = [
 		 ["kSat", "FLOAT", "ksat_hm_cm_dp", 1.0],
 		 ["effPor", "FLOAT", "thetap", 1.0],
 		 ["depth", "FLOAT", "soild_mp", 1.0],
 		]
 
-	addFields(hrr3, names)
-	fillFields(catchments, hrr3, rastPath, names)
-
-	print 'Success!'
+	addFields(gp, hrr3, names)
+	if engine == 'numpy':
+		fillFieldsZonal(gp, "Watersheds", hrr3, rastPath, names)
+	elif engine == 'overlay':
+		fillFieldsOverlay(gp, "Watersheds", hrr3, nativePath, names)
+	else:
+		fillFields(catchments, hrr3, rastPath, names)
 
 
-def addFields (table, names):
+def addFields (gp, table, names):
     #print ("Adding fields")
-    for n in names:
-        arcpy.AddField_management (table, n[0], n[1])
+    gp.addFields (table, [(n[0], n[1]) for n in names])
         
 def checkGC (table):
     """ Returns correct Grid Code field. Can be either GRIDCODE or GRID_CODE """
+    import arcpy
     fields = arcpy.ListFields (table) 
     #Get correct name for gridcode field
     for f in fields:
@@ -59,6 +65,7 @@ def checkGC (table):
 
 def checkGDB (workspace):
     """ Returns true if GDB, false if not. """
+    import arcpy
     desc = arcpy.Describe(workspace) 
     isGDB = desc.workspaceType # FileSystem if not GDB, else type of GDB.
 
@@ -69,6 +76,7 @@ def checkGDB (workspace):
 	
 def fillFields (fc, outTable, rastPath, names):
     """Performs zonal statistics on all fields"""
+    import arcpy
     outGC = checkGC(outTable)
     fcGC = checkGC(fc)
     
@@ -82,19 +90,50 @@ def fillFields (fc, outTable, rastPath, names):
             
         expression = "(!MEAN!) / " + str (divisor)
         rast = os.path.join (rastPath, file)
-        print rast
         desc_rast = arcpy.Describe(rast)
         spatialRef_rast = desc_rast.spatialReference
-        print fc, fcGC, rast, statTable
-        arcpy.sa.ZonalStatisticsAsTable (fc, fcGC, rast, statTable, "DATA", "MEAN")
+        with hrrLog.step ('ZonalStatisticsAsTable ' + file):
+            arcpy.sa.ZonalStatisticsAsTable (fc, fcGC, rast, statTable, "DATA", "MEAN")
         statGC = checkGC (statTable)
     
-        arcpy.JoinField_management (outTable, outGC, statTable, statGC, "MEAN")
-        print ("calculating field")
-        arcpy.CalculateField_management (outTable, field, expression, "PYTHON")
+        with hrrLog.step ('join ' + field):
+            arcpy.JoinField_management (outTable, outGC, statTable, statGC, "MEAN")
+            arcpy.CalculateField_management (outTable, field, expression, "PYTHON")
     
         arcpy.DeleteField_management (outTable, "MEAN")
         arcpy.Delete_management(statTable)
 
+def fillFieldsZonal (gp, zones, outTable, rastPath, names):
+    """Zonal MEAN of all fields in one pass over the watershed grid (labels = grid codes)"""
+    rasters = {}
+    rename = {}
+    for item in names:
+        rasters[item[0]] = gp.rasterPath (os.path.join (rastPath, item[2]))
+        rename[item[0] + '_MEAN'] = item[0]
+    with hrrLog.step ('zonalStatsRasters ' + ', '.join (sorted (rasters))):
+        table = hrrZonal.zonalStatsRasters (gp.rasterPath (zones), rasters, ['MEAN'], tileFolder = tileFolder,
+                                              tileSize = tileSize)
+        hrrLog.count (table.size)
+    for item in names:
+        table[item[0] + '_MEAN'] /= item[3]
+    with hrrLog.step ('join ' + ', '.join (sorted (rename.values ())), table.size):
+        gp.joinFields (outTable, table, sorted (rename.keys ()), rename)
+
+def fillFieldsOverlay (gp, zones, outTable, rastPath, names):
+    """Area weighted MEAN of all fields straight from the native soil grids: the watershed grid
+    (labels = grid codes) is overlaid once on each soil grid and cached, no projected rasters"""
+    rasters = {}
+    for item in names:
+        rasters[item[0]] = gp.rasterPath (os.path.join (rastPath, nativeRasters[item[0]]))
+    with hrrLog.step ('zoneRasterMeans ' + ', '.join (sorted (rasters))):
+        table = hrrOverlay.zoneRasterMeans (gp.rasterPath (zones), rasters, 'GRIDCODE', os.path.join (targetWorkspace, 'rsmaps'),
+                                            gp.defaultSR)
+        hrrLog.count (table.size)
+    for item in names:
+        table[item[0]] /= item[3]
+    with hrrLog.step ('join ' + ', '.join ([item[0] for item in names]), table.size):
+        gp.joinFields (outTable, table, [item[0] for item in names])
+
 if __name__ == "__main__":
     main ();
+    hrrLog.report ()
@@ -3,6 +3,7 @@ GIS setup for Hillslope River Routing Model (HRR) Step 5
 
 Objectives:
 1. Take HRR3 table, Returns 3 tab delimited .txt files for HRR model to run: channels.txt, planes.txt. output_calibration.txt
+   Optionally channels.hrrb and planes.hrrb, the same tables in binary (hrrBinary.toText makes the text files back).
 
 Hydro-Geo-Spatial Research Lab
 Website: http://www.northeastern.edu/beighley/home/
@@ -13,6 +14,8 @@ Email: zhao.yua@husky.neu.edu
 import arcpy, os, os.path
 from arcpy import env
 from arcpy.sa import *
+import numpy as np
+import hrrText, hrrBinary, hrrLog
 
 arcpy.env.overwriteOutput = True
 arcpy.CheckOutExtension("Spatial")
@@ -21,17 +24,17 @@ arcpy.CheckOutExtension("Spatial")
 outputPath = r"C:\Research\Scale_RC_aveVel_0316\HRRSetup\1000\HRRtxt2"  #Path with HRR table (see next line) and location to write text files
 hrr = r"C:\Research\Scale_RC_aveVel_0316\HRRSetup\1000\HRRtxt2\HRR_Table3_OH02.dbf"  #Final HRR table with all slopes, lengths and areas 
 
-### change lines 140 if width=alph(Area)^beta is known, width (m) & Area (km2)
-# dict ['width_ch'][0][id] = 1.956 * ((dict['cumA_km2'][0][id]) ** 0.413)
-### change lines 141 if qref=alph(Area)^beta is known, qref (cms) & Area (km2)
-# dict ['q_r'][0][id]= 0.01 * 0.089 * ((dict['cumA_km2'][0][id]) ** 0.958) #10% of Qbank
+### change calcChannels if width=alph(Area)^beta is known, width (m) & Area (km2)
+# table['width_ch'] = 1.956 * table['cumA_km2'] ** 0.413
+### change calcChannels if qref=alph(Area)^beta is known, qref (cms) & Area (km2)
+# table['q_r'] = 0.01 * 0.089 * table['cumA_km2'] ** 0.958 #10% of Qbank
+writeBinary = False # also write channels.hrrb and planes.hrrb, binary tables the model can memory-map (hrrBinary.py)
 ###******************************#####
 
+@hrrLog.step ('Step5')
 def main ():  
 	
     arcpy.env.workspace = outputPath
-	
-    print ' running hrr to text on', hrr
 
     # Fill lists with appropriate data
     count = sum((1 for row in arcpy.da.SearchCursor(hrr, ['HRR_ID'])))
@@ -39,13 +42,11 @@ def main ():
 
     gridCode = checkGC (hrr)
     
-    dict = fillLists (hrr, numRec)
-    dict = removeFirst (dict)
+    table = fillTable (hrr, numRec)
+    table = dropFirst (table)
 
     #Write to files
-    makeFiles (outputPath, dict, numRec)
-    
-    print 'Success!'  
+    makeFiles (outputPath, table, numRec)
         
 def checkGC (table):
     """ Returns correct Grid Code field. Can be either GRIDCODE or GRID_CODE """
@@ -57,251 +58,142 @@ def checkGC (table):
             return "GRIDCODE"    
 
 
-#Recalculates null values to -999  
-def nullCheck (dict):
-    """Recalculates slope from null to -999 where catchment has no null value in raster."""
-    for id in dict['hrrID'][0]:
-        #slope
-        if not isinstance (dict['slope_ch'][0][id], float):
-            dict['slope_ch'][0][id] = -999
-        if not isinstance (dict['slope_p1'][0][id], float):
-            dict['slope_p1'][0][id] = -999
-
-        if not isinstance (dict['kSat'][0][id], float):
-            dict['kSat'][0][id] = -999
-        if not isinstance (dict['effPor'][0][id], float):
-            dict['effPor'][0][id] = -999
-        if not isinstance (dict['depthp'][0][id], float):
-            dict['depthp'][0][id] = -999   
-
-        if not isinstance (dict['lcp'][0][id], int):
-            dict['lcp'][0][id] = -999   
-               
-    return dict
+# Output columns: name, HRR3 field (None: constant or calculated), type, default, file.
+# Units without a record keep the default. The columns of a file are the 'all' columns followed by
+# its own, in this order. Integer defaults and nulls of float columns stay integers (hrrText.py).
+schema = [('hrrID', 'HRR_ID', 'i8', 0, 'all'),
+          ('gridCode', 'GRIDCODE', 'i8', 0, 'all'),
+
+          ('length_p1', 'LP_KM', 'f8', -999, 'planes'), #arc, calc
+          ('slope_p1', 'SLOPE_CAT', 'f8', 0.1, 'planes'), #arc, calc
+          ('n_surface', None, 'f8', 0.8, 'planes'), #constant
+          ('kSat', 'KSAT', 'f8', -999, 'planes'), #arc, calc
+          ('effPor', 'EFFPOR', 'f8', -999, 'planes'), #arc
+          ('depthp', 'DEPTH', 'f8', 3.2, 'planes'), #arc
+          ('lcp', 'LC', 'i8', -999, 'planes'), #arc
+
+          ('downID', 'DOWN_ID', 'i8', -999, 'channels'), #arc
+          ('numUp', 'NUMUP', 'i8', -999, 'channels'), #arc
+          ('up1', 'UP1ID', 'i8', -999, 'channels'), #arc
+          ('up2', 'UP2ID', 'i8', -999, 'channels'), #arc
+          ('up3', 'UP3ID', 'i8', -999, 'channels'), #arc
+          ('up4', 'UP4ID', 'i8', -999, 'channels'), #arc
+          ('a_km2', 'A_SQKM', 'f8', 999, 'channels'), #arc
+          ('cumA_km2', 'CUMA_SQKM', 'f8', 999, 'channels'), #arc
+          ('len_ch', 'LC_LFP_KM', 'f8', -999, 'channels'), #arc, calc
+          ('slope_ch', 'SLOPE_STR', 'f8', 0.001, 'channels'), #arc, calc
+          ('n', None, 'f8', 0.035, 'channels'), #constant
+          ('width_ch', None, 'f8', -999, 'channels'), #calc
+          ('q_r', None, 'f8', -999, 'channels'), #calc
+
+          ('guageA', None, 'i8', -999, 'output') #calc
+          ]
+
+# Fields set to -999 where the HRR3 value is null or, in float fields, an integer (as nullCheck did);
+# other null fields keep the default
+nullFields = ['slope_ch', 'slope_p1', 'kSat', 'effPor', 'depthp', 'lcp']
+
+# Text files and the group of columns each one holds
+files = [('planes.txt', 'planes'), ('channels.txt', 'channels'), ('output_calibration.txt', 'output')]
+
+
+def fileColumns (group):
+    """ Names of the columns of a file group, in file order """
+    return [c[0] for c in schema if c[4] == 'all'] + [c[0] for c in schema if c[4] == group]
+
+
+def newTable (numRec):
+    """ Structured array of numRec units (row = HRR ID) holding the schema defaults """
+    table = hrrText.schemaTable (schema, numRec)
+    table['hrrID'] = np.arange (numRec)
+    return table
+
+
+@hrrLog.step ('fillTable')
+def fillTable (hrrTable, numRec, rows = None):
+    """ Creates the table of final output: HRR3 values, null values as -999, then the calculated
+    columns. rows: fill from rows already read (in arcFieldNames order) instead of a cursor on
+    hrrTable. Row 0 (HRR ID 0) is not a unit (see dropFirst)."""
+    table = newTable (numRec)
+    hrrLog.count (numRec - 1)
 
-        
-def fillLists (hrrTable, numRec):
-    """ Creates data structure to hold final output."""
-    # Data fields needed for final output, or needed to calculate final output.
-    # Fills with default of -999 so it is obvious when a record does not exist for
-    # a particular grid code.
-
-    dict = {'gridCode': [[0 for x in range (numRec*10)], 1, 'all'], #arc
-        'hrrID': [[0 for x in range (numRec)], 0, 'all'], #arc
-            
-        'length_p1': [[-999 for x in range (numRec)], 2, 'planes'], #calc
-        'slope_p1': [[0.1 for x in range (numRec)], 3, 'planes'], #arc, calc
-        'n_surface': [[0.8 for x in range (numRec)], 4, 'planes'], #constant
-        'kSat': [[-999 for x in range (numRec)], 5, 'planes'], #arc
-        'effPor': [[-999 for x in range (numRec)], 6, 'planes'], #arc
-        'depthp': [[3.2 for x in range (numRec)], 7, 'planes'], #arc
-        'lcp': [[-999 for x in range (numRec)], 8, 'planes'], #calc
-            
-        'downID': [[-999 for x in range (numRec)], 2, 'channels'], #arc
-        'numUp': [[-999 for x in range (numRec)], 3, 'channels'], #arc
-        'up1': [[-999 for x in range (numRec)], 4, 'channels'], #arc
-        'up2': [[-999 for x in range (numRec)], 5, 'channels'], #arc
-        'up3': [[-999 for x in range (numRec)], 6, 'channels'], #arc
-        'up4': [[-999 for x in range (numRec)], 7, 'channels'], #arc
-        'a_km2': [[999 for x in range (numRec)], 8, 'channels'], #arc
-        'cumA_km2': [[999 for x in range (numRec)], 9, 'channels'], #arc
-        'len_ch': [[-999 for x in range (numRec)], 10, 'channels'], #arc
-        'slope_ch': [[0.001 for x in range (numRec)], 11, 'channels'], #constant
-        'n': [[0.035 for x in range (numRec)], 12, 'channels'], #constant
-        'width_ch': [[-999 for x in range (numRec)], 13, 'channels'], #calc
-        'q_r': [[-999 for x in range (numRec)], 14, 'channels'], #calc            
-        'guageA': [[-999 for x in range (numRec)], 2, 'output'] } #calc
-        
     # fill values directly from Arc
-    dict = fillArcLists (hrrTable, dict)
+    table = fillArcFields (hrrTable, table, rows)
 
-  # print dict
-    
-    # Fill lists with calculated values
+    # Fill with calculated values
+    table = calcChannels (table)
 
-    dict = nullCheck (dict)
-    
-    dict = calcChannelsLists (dict)
-    
-    return dict
-
-
-def calcChannelsLists (dict): 
-    """Calculates values for fields with calculated values. """
-    hrrID = dict['hrrID'][0]
-    for id in hrrID:
-        dict['length_p1'][0][id] = dict['length_p1'][0][id] * 1000 #(m)
-        dict['len_ch'][0][id] = dict['len_ch'][0][id] * 1000 #(m)
-        dict['slope_p1'][0][id] =  dict['slope_p1'][0][id] / 100 #(percent)
-        dict['slope_ch'][0][id] = dict['slope_ch'][0][id] / 100 #(percent)
-        dict['kSat'][0][id] = dict['kSat'][0][id] / 24 # ksat, cm/day to cm/hour
-
-        # from Beighley and Gummadi (2011)
-        dict ['width_ch'][0][id] = 1.956 * ((dict['cumA_km2'][0][id]) ** 0.413)
-        dict ['q_r'][0][id]= 0.01 * 0.089 * ((dict['cumA_km2'][0][id]) ** 0.958) #10% of Qbank
-        
-        dict ['guageA'][0][id] = int (dict['cumA_km2'][0][id])
-    return dict
+    return table
+
+
+def calcChannels (table):
+    """Calculates values for fields with calculated values, whole columns at a time. """
+    table['length_p1'] *= 1000 #(m)
+    table['len_ch'] *= 1000 #(m)
+    hrrText.divide (table, 'slope_p1', 100) #(percent)
+    hrrText.divide (table, 'slope_ch', 100) #(percent)
+    hrrText.divide (table, 'kSat', 24) # ksat, cm/day to cm/hour
+
+    # from Beighley and Gummadi (2011)
+    table['width_ch'] = 1.956 * table['cumA_km2'] ** 0.413
+    table['q_r'] = 0.01 * 0.089 * table['cumA_km2'] ** 0.958 #10% of Qbank
+
+    table['guageA'] = table['cumA_km2'].astype (np.int64)
+    return table
 
-def fillArcLists (hrrTable, dict):
-    """ Takes data from arc table and puts it into a list in memory."""
-    # Create lists of correct length
-    #list of fields in HRR3
+def arcFieldNames (hrrTable):
+    """ list of fields in HRR3 """
     gridCode = checkGC (hrrTable)
-    arcFields = [gridCode, 'HRR_ID', 'DOWN_ID', 'NUMUP', 'UP1ID',
-                 'UP2ID', 'UP3ID', 'UP4ID', 'CUMA_SQKM', 'A_SQKM',
-                 'LC_LFP_KM','LP_KM','KSAT','EFFPOR',
-                 'SLOPE_STR','SLOPE_CAT','DEPTH', 'LC'
-                 ]
-        
-    # list of lists
-    arcLists =[dict['gridCode'][0], #1
-		dict['hrrID'][0], #2
-		dict['downID'][0], #3
-		dict['numUp'][0], #4
-                dict['up1'][0], #5
-		dict['up2'][0], #6
-		dict['up3'][0], #7
-		dict['up4'][0], #8
-		dict['cumA_km2'][0], #9
-                dict['a_km2'][0], #10
-		dict['len_ch'][0], #11
-		dict['length_p1'][0], #12
-		dict['kSat'][0], #13
-                dict['effPor'][0], #14
-		dict['slope_ch'][0],#15
-                dict['slope_p1'][0], #16
-		dict['depthp'][0], #17
-		dict['lcp'][0], #18
-		#dict['n_surface'][0] #19
-               ]
-               
-    with arcpy.da.SearchCursor (hrrTable, arcFields) as cursor:
-
-        for row in cursor:
-            hrrINT= row [1]
-            # Fill all lists, with HRRINT as index
-            for i in range(len(arcLists)):
-               arcLists[i][hrrINT] = row [i]
-				
-    dict['gridCode'][0] = arcLists [0]
-    dict['hrrID'][0] = arcLists [1]
-    dict['downID'][0] = arcLists [2]
-    dict['numUp'][0] = arcLists [3]
-    dict['up1'][0] = arcLists [4]
-    dict['up2'][0] = arcLists [5]
-    dict['up3'][0] = arcLists [6]
-    dict['up4'][0] = arcLists [7]  
-    dict['cumA_km2'][0] = arcLists [8]
-    dict['a_km2'][0] = arcLists [9]
-    dict['len_ch'][0] = arcLists [10]
-    dict['length_p1'][0] = arcLists [11]
-    dict['kSat'][0] = arcLists [12]
-    dict['effPor'][0] = arcLists [13]
-    dict['slope_ch'][0] = arcLists [14]
-    dict['slope_p1'][0] = arcLists [15]
-    dict['depthp'][0] = arcLists [16]
-    dict['lcp'][0] = arcLists [17]
-    #dict['n_surface'][0] = arcLists [18]
-
-    return dict
+    return [gridCode if c[1] == 'GRIDCODE' else c[1] for c in schema if c[1] is not None]
+
+def fillArcFields (hrrTable, table, rows = None):
+    """ Takes data from arc table and puts it into the table, one column at a time."""
+    if rows is None:
+        rows = arcpy.da.SearchCursor (hrrTable, arcFieldNames (hrrTable))
+    rows = list (rows)
+    if not rows:
+        return table
+
+    return hrrText.fillRows (table, schema, rows, nullFields, 'hrrID')
 
  
-def makeFiles (outPath, dict, numRec):
-    """Creates and opens channels, planes, and ouput_calibration .txt files."""
-    channels = os.path.join (outPath, 'channels.txt')
-    planes = os.path.join (outPath, 'planes.txt')
-    output = os.path.join (outPath, 'output_calibration.txt')
+def makeFiles (outPath, table, numRec):
+    """Creates and writes channels, planes, and ouput_calibration .txt files."""
     input = os.path.join (outPath, 'input_num.txt')
-    
-    # Put data into lists for files
-    chList, plList, outList = toLists (dict)
-
-    chList = sorted (chList, key = lambda ch:ch[1])
-    plList = sorted (plList, key = lambda pl:pl[1])
-    outList = sorted (outList, key = lambda ou:ou[1])
-
-    # make files     
-    with open (planes, 'w') as handle:
-        wrFile (plList, handle)
-    with open (channels, 'w') as handle:
-        wrFile (chList, handle)
-    with open (output, 'w') as handle:
-        wrFile2 (outList, numRec, handle)
+
+    # make files
+    for fileName, group in files:
+        names = fileColumns (group)
+        with hrrLog.step ('write ' + fileName, table.size), open (os.path.join (outPath, fileName), 'w') as handle:
+            if group == 'output':
+                wrFile2 (table, names, numRec, handle)
+            else:
+                wrFile (table, names, handle)
+        if writeBinary and group != 'output':
+            binName = os.path.splitext (fileName)[0] + '.hrrb'
+            with hrrLog.step ('write ' + binName, table.size):
+                hrrBinary.write (os.path.join (outPath, binName), names, [hrrText.textColumn (table, n) for n in names])
     with open (input, 'w') as handle:
         wrInput (numRec, handle)
 
   
-def wrFile (dataLists, handle):
-    """Writes data to open file"""
-    n = 0
-    #Iterate number of records in HRRID
-    #
-    hrrID = dataLists [0][0]
-    print len (dataLists)
-    while n < len (hrrID):
-        #Iterate fields for current file
-        i = 0
-        while i < (len (dataLists)):
-            handle.write (str (dataLists[i][0][n]))
-
-            if i == len (dataLists) - 1:
-                handle.write ('\n')
-            else:
-                handle.write ('\t')
-            i += 1
-        n += 1 
-
-def wrFile2 (dataLists, numRec, handle):
-    """Writes data to open file"""
-    n = 0
-    #Iterate number of records in HRRID
+def wrFile (table, names, handle):
+    """Writes columns of the table to open file, whole columns per write (hrrText.py)"""
+    hrrText.writeColumns (handle, [hrrText.textColumn (table, n) for n in names])
 
-    hrrID = dataLists [0][0]
-    print len (dataLists)
+def wrFile2 (table, names, numRec, handle):
+    """Writes columns of the table to open file, after the number of units"""
     handle.write (str (numRec-1)+ '\n')
-    while n < len (hrrID):
-        #Iterate fields for current file
-        i = 0
-        while i < (len (dataLists)):
-            handle.write (str (dataLists[i][0][n]))
-
-            if i == len (dataLists) - 1:
-                handle.write ('\n')
-            else:
-                handle.write ('\t')
-            i += 1
-        n += 1 
-         
-def toLists (dict):
-    """Creates list of data to be written to files from dictionary."""
-    ch = []
-    pl = []
-    out = []
-    all = []
-    for k, v in dict.iteritems ():
-        if v[2] == 'planes':
-            pl.append (v)
-        
-        elif v[2] == 'channels':
-            ch.append (v)
-        elif v[2] == 'output':
-            out.append (v)
-        else:
-            all.append (v)
-    ch = all + ch
-    pl = all + pl
-    out = all + out
-    return ch, pl, out
-
-# Removes first item of each list, where HRRID = 0. These are not valid datapoints  
-def removeFirst (dict):
-    for k, v in dict.iteritems():
-        v[0] = v[0][1:]
-    return dict
+    hrrText.writeColumns (handle, [hrrText.textColumn (table, n) for n in names])
+
+# Removes first row, where HRRID = 0. This is not a valid datapoint
+def dropFirst (table):
+    return table[1:]
 
 # Writes fill of inputs used to create data.
 def wrInput (numRec, handle):
     handle.write (str (numRec-1))    
     
-main ()
+if __name__ == '__main__':
+    main ()
+    hrrLog.report ()
@@ -5,6 +5,8 @@ Objectives:
 1. Take catchment, met polygon IDs. Calculate area of each part of the catchment, then calculate 
    weight (wt) by percent area for each part of the catchment. Sort by catchment ID (GRID_CODE), small to large. 
 2. Output text file contains met data.
+The weights of each met grid are cached (hrrOverlay.py) under a hash of the catchment, met grid and HRR
+geometries/IDs, so repeat runs skip the intersect. The overlay text is made by overlay4.exe.
 
 Hydro-Geo-Spatial Research Lab
 Website: http://www.northeastern.edu/beighley/home/
@@ -12,8 +14,10 @@ By: Yuanhao Zhao
 Email: zhao.yua@husky.neu.edu
 """
 
-import arcpy, csv, os, os.path, subprocess, shutil, time
+import arcpy, csv, os, os.path, subprocess, shutil
 from operator import itemgetter, attrgetter
+import numpy as np
+import hrrOverlay, hrrLog
 
 arcpy.CheckOutExtension("Spatial")
 
@@ -26,34 +30,48 @@ hrr = r"C:\Research\Scale_RC_aveVel_0316\HRRSetup\1\GISworking\HRR_Table3_OH07.d
 catchments = r"C:\Research\Scale_RC_aveVel_0316\HRRSetup\1\GISworking\Catchments.shp" #Fianl catchments shapefile in GIS folder
 gridList = ['TRMM'] # Name of met data, must match the met data grid in 'met_bas' folder. 
 #For example, 'TRMM' matches 'TRMM_Grid.shp'. If want to use other data source, the format must be ####_Grid.shp
+useCache = True # reuse the catchment x met cell weights of earlier runs when nothing changed
+cacheFolder = os.path.join (outputSpace, 'overlay_cache') # folder for the cached weights
+maxCache = 20 # number of cached weight sets kept, least recently used are removed
+writeText = True # write Pgrid and Grid_overlay text files
 #####*********DO NOT CHANGE ANYTHING BELOW*******************#####
 
 arcpy.env.workspace = outputSpace
 arcpy.env.overwriteOutput = True
 
+@hrrLog.step ('Step6')
 def main ():
 	
 	#Start run
-    place = '{1}{0}'.format (zone, region)
-
     for cpcet in gridList:
-        # Run code for grid
+        with hrrLog.step (cpcet):
+            runGrid (cpcet)
+
 
-        cpcName = cpcet + '_Grid.shp'
-        cpcPoly = os.path.join(fortSpace,cpcName)
-        intTable = os.path.join (outputSpace, "{}_Zones_{}.shp".format (cpcet, place)) #intersected table, output
+def runGrid (cpcet):
+    """ Weights and overlay text files for one met grid """
+    place = '{1}{0}'.format (zone, region)
 
-        print 'working on', place, cpcet
+    cpcName = cpcet + '_Grid.shp'
+    cpcPoly = os.path.join(fortSpace,cpcName)
+    intTable = os.path.join (outputSpace, "{}_Zones_{}.shp".format (cpcet, place)) #intersected table, output
 
+    dataRec = None
+    if useCache:
+        key = weightKey (catchments, cpcPoly, hrr, metField (cpcet))
+        dataRec = loadWeights (key)
+    if dataRec is None:
         setup (catchments, cpcPoly, intTable, hrr)
-  
+
         dataRec = getData (intTable, cpcet, cpcPoly)
         dataRec = calcWt (dataRec)
+        if useCache:
+            saveWeights (key, dataRec)
 
+    if writeText:
         writeCSV (dataRec, fortSpace, cpcet)
 
         fortranCall (fortSpace, outputSpace, place, cpcet) 
-    print 'success!'
 
 
 def addFields (table, fields):
@@ -71,39 +89,30 @@ def checkGC (table):
         elif f.name.upper() == "GRIDCODE":
             return f.name.upper ()
 
+@hrrLog.step ('setup')
 def setup (catch, cpc, iTable, hrr):
     """ Creates intersected, projected shapefile, adds and calculates
        weight field, and adds weight (wt) field. """
 
-    arcpy.Intersect_analysis ([catch, cpc], iTable)
-    print 'intersect done'
+    with hrrLog.step ('Intersect ' + os.path.basename (cpc)):
+        arcpy.Intersect_analysis ([catch, cpc], iTable)
 
     fields = ['AP_sqkm', "DOUBLE"]
     
     arcpy.AddField_management (iTable, fields[0], fields[1])
-    print 'fields added'
 
     iTableGC = checkGC (iTable)
     hrrGC = checkGC (hrr)
 
-    arcpy.JoinField_management (iTable, iTableGC, hrr, hrrGC, "HRR_ID")
-    print "joined hrr"
+    with hrrLog.step ('JoinField HRR_ID'):
+        arcpy.JoinField_management (iTable, iTableGC, hrr, hrrGC, "HRR_ID")
  
     expression = "!SHAPE.AREA@SQUAREKILOMETERS !"
-    arcpy.CalculateField_management (iTable, fields [0], expression, "PYTHON")
-    print 'field calculated'
-
-    print 'Setup completed'
-
-def getData (table, cpcet, cpc):
-    """ Reads data from the intersected cpc/grid table. """
-    
-    gc = checkGC (table)
-    print 'gridcode is ', gc
-    
-    field_names = [f.name for f in arcpy.ListFields(cpc)]  
-    #metID = field_names[2]
+    with hrrLog.step ('CalculateField ' + fields[0]):
+        arcpy.CalculateField_management (iTable, fields [0], expression, "PYTHON")
 
+def metField (cpcet):
+    """ Met cell ID field of a met grid """
     if cpcet == "TRMM":
         metID = "TRMMID"
     if cpcet == "RRET25Congo":
@@ -112,8 +121,46 @@ def getData (table, cpcet, cpc):
         metID = "ETIDag"
     if cpcet == "GCM":
         metID = "GCMID"      
+    return metID
+
+def weightKey (catch, cpc, hrr, metID):
+    """ Hash of the catchment and met grid geometries and IDs, and of the HRR IDs """
+    h = hrrOverlay.featureHash (catch, [checkGC (catch)])
+    hrrOverlay.featureHash (cpc, [metID], h)
+    hrrOverlay.featureHash (hrr, [checkGC (hrr), "HRR_ID"], h)
+    return h.hexdigest ()
+
+def saveWeights (key, data):
+    """ Caches the weight records (sparse HRR_ID x met cell matrix, one entry per record) """
+    arrays = {"grid": np.array (data["grid"], dtype = np.int32),
+              "hrr": np.array (data["hrr"], dtype = np.int32),
+              "cpc": np.array (data["cpc"], dtype = np.int32),
+              "ap": np.array (data["ap"], dtype = np.float64),
+              "area": np.array (data["area"], dtype = np.float64),
+              "wt": np.array (data["wt"], dtype = np.float64)
+              }
+    hrrOverlay.cacheSave (cacheFolder, 'metwt', key, arrays, maxCache)
+
+@hrrLog.step ('loadWeights')
+def loadWeights (key):
+    """ Weight records from the cache, as getData/calcWt make them; None if not cached (no rows
+        counted) """
+    arrays = hrrOverlay.cacheLoad (cacheFolder, 'metwt', key)
+    if arrays is None:
+        return None
+    hrrLog.count (arrays["hrr"].size)
+    return dict ((k, arrays[k].tolist ()) for k in ("grid", "hrr", "cpc", "ap", "area", "wt"))
+
+@hrrLog.step ('getData')
+def getData (table, cpcet, cpc):
+    """ Reads data from the intersected cpc/grid table. """
+    
+    gc = checkGC (table)
+    
+    field_names = [f.name for f in arcpy.ListFields(cpc)]  
+    #metID = field_names[2]
 
-    print metID
+    metID = metField (cpcet)
    
 
     fields = ["HRR_ID", gc, metID, "AP_SQKM", "SHAPE@AREA"]
@@ -137,13 +184,15 @@ def getData (table, cpcet, cpc):
             data["hrr"].append (row [0])
             data["ap"].append (row[3])
             data["area"].append (row [4])
-    print 'cursor run'
+    hrrLog.count (len (data["hrr"]))
     return data
 
             
 
+@hrrLog.step ('calcWt')
 def calcWt (data):
     numRecs = len(data["hrr"])
+    hrrLog.count (numRecs)
     areaDict = {} # Dictionary of total areas by grid code
     
     for n in range (numRecs):
@@ -165,12 +214,13 @@ def calcWt (data):
     return data
 
 
-def writeCSV(data, workspace, cpcet):
+@hrrLog.step ('writeCSV')
+def writeCSV(data, workspace, cpcet, fileName = "Pgrid.txt"):
     # Writes data to Pgrid.txt
     numRecs = len(data["grid"])
+    hrrLog.count (numRecs)
     
-    csvFile = os.path.join(workspace, "Pgrid.txt")
-    print "file name is", csvFile
+    csvFile = os.path.join(workspace, fileName)
     with open(csvFile, "w") as myFile:
         
         writer = csv.writer(myFile, delimiter = ",", lineterminator = "\n")
@@ -183,6 +233,7 @@ def writeCSV(data, workspace, cpcet):
     myFile.close()
 
 
+@hrrLog.step ('overlay4.exe')
 def fortranCall (fortSpace, outPath, place, cpcet):
     """ Runs overlay4.exe, and puts the output in the current workspace"""
 
@@ -200,20 +251,16 @@ def fortranCall (fortSpace, outPath, place, cpcet):
               ]
     
     
-    subprocess.Popen (exe, cwd = fortSpace)
-    time.sleep(20) # Without this, computer would sometimes have Pgrid.txt open,
-                    # or would not recognize Pgrid_overlay.txt
+    subprocess.check_call (exe, cwd = fortSpace) # waits until Pgrid_overlay.txt is written and closed
 
     # Move results to output location and rename.
     for n in range (2):
-        print 'moving ', toFile [n]
         shutil.copy (fromFile [n], toFile [n])
-        time.sleep(20)
-                             
-    print 'have run overlay4.exe'
+
                    
 if __name__ == '__main__':
     main ()
+    hrrLog.report ()
 
 
 
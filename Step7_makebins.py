@@ -1,23 +1,67 @@
 # Step 7 --> make the P and ET bin files for each model unit
 
-##this is not python
-##
-##just telling your to run makebins code in folder
-##
-##change input_P_ET.txt
-##line 1: number pfaf units
-##line 2: number of time steps, hourly
-##line 4: start year
-##Lines 5-6: leave as zero unless working on future climate model output
-##
-##
-##Modify filenames/locations in main_P_ET_v1_GCM.f90
-##fnameTRMM(1:44) = 'C:\Global_Data\TRMM\GnuWin32\bin\3B42_daily.'
-##fnameRRET(1:65)='C:\Research\Amazon\AM_AG_GIS\HRR_g\makebins\PTET_GRID(Amazon).txt'
-##
-##copy overlay files to the makebins folder
-##Grid_overlay_TRMM.txt
-##Grid_overlay_RRET25Congo.txt
-##
-##re-make the exe file
-##run the exe file
+"""
+Runs makebins for the P and ET bin files.
+In: input_P_ET.txt (line 1: number of units, line 2: number of hourly time steps, line 4: start year,
+    lines 5-6: zero unless future climate model output), Grid_overlay_<data>.txt from step 6, and the
+    met data of each data set.
+Out: one bin file per data set.
+
+engine = 'exe' (default) runs the Fortran code (main_P_ET_v1_GCM.f90): change input_P_ET.txt in the makebins
+folder, modify fnameTRMM / fnameRRET in main_P_ET_v1_GCM.f90 and re-make the exe; this script copies the
+overlay files to the makebins folder and runs the exe there.
+engine = 'python' uses hrrBins.py (no Fortran paths to edit, nothing to recompile). Its bin, overlay and met
+series layouts have not been checked against main_P_ET_v1_GCM.f90, and it reads a met time series of time x
+met cells (.npy or text), not the 3B42_daily files the Fortran reads: convert the met data first and compare
+a bin file with the Fortran one before using it. Inputs that do not fit its layouts are refused (ValueError).
+
+Hydro-Geo-Spatial Research Lab
+Website: http://www.northeastern.edu/beighley/home/
+"""
+
+import os, os.path, shutil, subprocess
+import hrrBins, hrrLog
+
+#####***** input parameters CHANGE AS NEEDED *****#####
+engine = 'exe' # 'exe': Fortran makebins exe; 'python': hrrBins.py (layouts not yet checked against the Fortran)
+binSpace = r"C:\Research\Scale_RC_aveVel_0316\HRRSetup\1\HRRtxt" # Folder with the Grid_overlay files (step 6); 'python': input_P_ET.txt is here and bin files go here
+makebinsSpace = r"C:\Research\Amazon\AM_AG_GIS\HRR_g\makebins" # 'exe': makebins folder with input_P_ET.txt and the exe
+makebinsExe = "makebins.exe" # 'exe': exe made from main_P_ET_v1_GCM.f90, in makebinsSpace
+inputFile = "input_P_ET.txt"
+# [data name (Grid_overlay_<name>.txt), met time series file ('python' only, time x met cells, .npy or text),
+#  met records per time step repeat, scale, bin file]
+# The Fortran reads TRMM from the 3B42_daily files: set the TRMM series once they are converted
+datasets = [
+    ["TRMM", None, 1, 1.0, "P.bin"],
+    ["RRET25Congo", r"C:\Research\Amazon\AM_AG_GIS\HRR_g\makebins\PTET_GRID(Amazon).txt", 1, 1.0, "ET.bin"],
+    ]
+blockSteps = 744 # time steps read and averaged at a time (one month of hourly data)
+metNodata = None # 'python': nodata value of the met series, left out of the unit averages (None for none)
+#####****************************#####
+
+@hrrLog.step ('Step7')
+def main ():
+    if engine == 'exe':
+        runExe ()
+        return
+    for name, metFile, repeat, scale, binFile in datasets:
+        if metFile is None:
+            raise ValueError ('No met time series for ' + name + ' (engine python): convert the met data first')
+        with hrrLog.step ('makeBins ' + binFile + ' from ' + name, unit = 'time steps'):
+            n = hrrBins.makeBins (os.path.join (binSpace, inputFile),
+                                  os.path.join (binSpace, 'Grid_overlay_{}.txt'.format (name)),
+                                  metFile, os.path.join (binSpace, binFile), blockSteps, repeat, scale,
+                                  metNodata)
+            hrrLog.count (n)
+
+@hrrLog.step ('makebins exe')
+def runExe ():
+    """ Copies the overlay files to the makebins folder and runs the Fortran exe there """
+    for name in [d[0] for d in datasets]:
+        overlay = 'Grid_overlay_{}.txt'.format (name)
+        shutil.copy (os.path.join (binSpace, overlay), os.path.join (makebinsSpace, overlay))
+    subprocess.check_call (os.path.join (makebinsSpace, makebinsExe), cwd = makebinsSpace)
+
+if __name__ == "__main__":
+    main ()
+    hrrLog.report ()
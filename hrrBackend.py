@@ -0,0 +1,357 @@
+"""
+Geoprocessing backends for the HRR setup: the same operations with arcpy or with NumPy and files.
+
+Steps 4.1, 4.2 and 4.3 run on a backend (their 'backend' parameter); steps 0-3 and 5-7 still call
+arcpy directly. A backend holds the operations of these steps:
+  rasterPath, tablePath                   dataset names of a step to paths of the backend
+  readRaster, readHeader, writeRaster,    rasters as (array, header) (hrrRaster) and their
+  spatialRef                              coordinate system
+  extractByExtent                         clipping to the extent of a template raster
+  resample                                onto the grid of a template raster (NEAREST, BILINEAR)
+  readTable, writeTable, addFields,       HRR tables (hrrTable form) and joins of zonal tables on
+  joinFields                              the grid code
+  zoneFeatures                            one dissolved polygon per zone of a watershed grid
+
+ArcpyBackend runs the ArcGIS tools (ExtractByRectangle, ProjectRaster, AddField, ExtendTable,
+RasterToPolygon and Dissolve) on any dataset arcpy reads, with the workspace and snap raster of the
+step, and needs a licensed ArcGIS install.
+
+NumpyBackend needs no arcpy, so steps 4.1-4.3 run on headless Linux nodes. Rasters are ESRI ASCII
+grids or tiled stores (a name without extension is <name>.asc), tables are comma delimited text (a
+.dbf name is read and written as .csv), features are GeoJSON, and resampling is done by hrrResample.
+Relative names are in the workspace folder. ASCII grids carry no coordinate system: that of the
+template grid (spatialRef) is read from a <name>.prj file next to it (WKT), else spatialReference is
+used; source grids of resample get defaultSR, and projecting needs pyproj. Zone polygons keep the
+coordinates of the raster.
+
+get ('numpy') or get ('arcpy') returns a backend; with no name the HRR_BACKEND environment variable
+chooses, else arcpy.
+
+Hydro-Geo-Spatial Research Lab
+Website: http://www.northeastern.edu/beighley/home/
+"""
+
+import os, os.path, json
+from collections import OrderedDict
+import numpy as np
+import hrrRaster, hrrTable, hrrZonal, hrrResample
+
+# numpy type of each field type of AddField
+fieldTypes = {'SHORT': np.int16, 'LONG': np.int32, 'FLOAT': np.float32, 'DOUBLE': np.float64}
+
+
+def windowOf (header, template):
+    """ Rows and columns of header's grid whose centers fall in the template extent:
+        (r0, r1, c0, c1), clipped to the grid """
+    cs = header['cellsize']
+    top = header['yllcorner'] + header['nrows'] * cs
+    tTop = template['yllcorner'] + template['nrows'] * template['cellsize']
+    tRight = template['xllcorner'] + template['ncols'] * template['cellsize']
+    c0 = int (np.ceil ((template['xllcorner'] - header['xllcorner']) / cs - 0.5))
+    c1 = int (np.ceil ((tRight - header['xllcorner']) / cs - 0.5))
+    r0 = int (np.ceil ((top - tTop) / cs - 0.5))
+    r1 = int (np.ceil ((top - template['yllcorner']) / cs - 0.5))
+    return max (r0, 0), min (r1, int (header['nrows'])), max (c0, 0), min (c1, int (header['ncols']))
+
+
+# directions of the cell edges (+x, +y, -x, -y) as steps of (row, column) on the cell corners
+edgeSteps = np.array ([[0, 1], [-1, 0], [0, -1], [1, 0]])
+
+
+def zoneEdges (labels):
+    """ Cell edges between a zone (labels > 0) and other cells, the zone on the left: arrays of
+        code, start row, start column and direction (index into edgeSteps) """
+    nrows, ncols = labels.shape
+    pad = np.zeros ((nrows + 2, ncols + 2), dtype = labels.dtype)
+    pad[1:-1, 1:-1] = labels
+    inside = labels > 0
+    parts = []
+    # bottom edges run east, right edges north, top edges west, left edges south
+    for direction, other, dr, dc in ((0, pad[2:, 1:-1], 1, 0), (1, pad[1:-1, 2:], 1, 1),
+                                     (2, pad[:-2, 1:-1], 0, 1), (3, pad[1:-1, :-2], 0, 0)):
+        r, c = np.nonzero (inside & (other != labels))
+        parts.append ((labels[r, c], r + dr, c + dc, np.full (r.size, direction)))
+    return [np.concatenate (p) for p in zip (*parts)]
+
+
+def zoneRings (labels):
+    """ Boundary rings of every zone (labels > 0) on the cell corners: (codes, list of lists of
+        (n x 2) row, column vertex arrays, closed). Outer rings run counterclockwise and holes
+        clockwise; cells of a zone that only touch at a corner are in separate rings. """
+    code, row, col, direction = zoneEdges (labels)
+    ncols = labels.shape[1] + 1
+    start = row * ncols + col
+    index = dict (((c, v, d), k) for k, (c, v, d) in enumerate (zip (code.tolist (), start.tolist (), direction.tolist ())))
+    end = (row + edgeSteps[direction, 0]) * ncols + col + edgeSteps[direction, 1]
+    # next edge at the end corner: turn left, else go straight, else turn right
+    nxt = np.zeros (code.size, dtype = np.int64)
+    for k, (c, v, d) in enumerate (zip (code.tolist (), end.tolist (), direction.tolist ())):
+        for turn in (1, 0, 3):
+            n = index.get ((c, v, (d + turn) % 4))
+            if n is not None:
+                nxt[k] = n
+                break
+    seen = np.zeros (code.size, dtype = bool)
+    rings = OrderedDict ((c, []) for c in np.unique (code).tolist ())
+    for k in range (code.size):
+        if seen[k]:
+            continue
+        ring = [k]
+        seen[k] = True
+        e = nxt[k]
+        while e != k:
+            seen[e] = True
+            ring.append (e)
+            e = nxt[e]
+        # corners only: edges that turn from the one before
+        ring = np.array (ring)
+        ring = ring[direction[ring] != direction[np.roll (ring, 1)]]
+        ring = np.append (ring, ring[0])
+        rings[code[k]].append (np.column_stack ([row[ring], col[ring]]))
+    return np.array (list (rings.keys ()), dtype = np.int64), list (rings.values ())
+
+
+def signedArea (rc):
+    """ Area of a closed ring of (row, column) vertices, positive counterclockwise """
+    x, y = rc[:, 1], -rc[:, 0]
+    return float ((x[:-1] * y[1:] - x[1:] * y[:-1]).sum ()) / 2.0
+
+
+def inRing (point, rc):
+    """ Whether a (row, column) point lies inside a closed ring (even-odd rule) """
+    r, c = point
+    r0, c0, r1, c1 = rc[:-1, 0], rc[:-1, 1], rc[1:, 0], rc[1:, 1]
+    cross = (r0 > r) != (r1 > r)
+    at = c0[cross] + (r - r0[cross]) * (c1[cross] - c0[cross]) / (r1[cross] - r0[cross]).astype (np.float64)
+    return bool ((at > c).sum () % 2)
+
+
+def zonePolygons (labels, header):
+    """ GeoJSON Polygon of every zone (labels > 0), MultiPolygon if it has parts apart, holes in the
+        part around them, as RasterToPolygon and Dissolve on GRIDCODE. Returns (codes, geometries). """
+    cs = header['cellsize']
+    nrows = header['nrows']
+    def coords (rc):
+        return np.column_stack ([header['xllcorner'] + rc[:, 1] * cs, header['yllcorner'] + (nrows - rc[:, 0]) * cs]).tolist ()
+    codes, rings = zoneRings (labels)
+    geoms = []
+    for zone in rings:
+        area = [signedArea (rc) for rc in zone]
+        outer = [k for k in range (len (zone)) if area[k] > 0]
+        parts = OrderedDict ((k, [coords (zone[k])]) for k in outer)
+        for k in range (len (zone)):
+            if area[k] < 0:
+                # the smallest outer ring around a hole is its part
+                point = (zone[k][0] + zone[k][1]) / 2.0
+                around = [o for o in outer if inRing (point, zone[o])]
+                parts[min (around, key = lambda o: area[o])].append (coords (zone[k]))
+        parts = list (parts.values ())
+        if len (parts) == 1:
+            geoms.append ({'type': 'Polygon', 'coordinates': parts[0]})
+        else:
+            geoms.append ({'type': 'MultiPolygon', 'coordinates': parts})
+    return codes, geoms
+
+
+def writeGeoJSON (path, geometries, codes, codeField = 'GRIDCODE'):
+    """ Writes features (GeoJSON geometry dictionaries) with a grid code property each """
+    with open (path, 'w') as handle:
+        handle.write ('{"type": "FeatureCollection", "features": [\n')
+        for k, (geom, code) in enumerate (zip (geometries, codes)):
+            feature = OrderedDict ([('type', 'Feature'), ('properties', {codeField: int (code)}),
+                                    ('geometry', geom)])
+            handle.write ((',\n' if k else '') + json.dumps (feature))
+        handle.write ('\n]}\n')
+
+
+class Backend (object):
+    """ Operations shared by the backends: rasters through hrrRaster """
+    name = None
+
+    def __init__ (self, workspace = None, defaultSR = 4326):
+        self.workspace = workspace
+        self.defaultSR = defaultSR
+
+    def rasterPath (self, name):
+        return name
+
+    def tablePath (self, name):
+        return name
+
+    def readRaster (self, name, dtype = np.float64):
+        return hrrRaster.readRaster (self.rasterPath (name), dtype)
+
+    def readHeader (self, name):
+        return hrrRaster.readHeader (self.rasterPath (name))
+
+    def writeRaster (self, name, arr, header):
+        hrrRaster.writeRaster (self.rasterPath (name), arr, header)
+
+    def spatialRef (self, name):
+        return self.readHeader (name).get ('spatialReference')
+
+
+class ArcpyBackend (Backend):
+    """ The ArcGIS tools; names are resolved by arcpy in workspace (arcpy.env.workspace).
+        snapRaster, extent: arcpy.env settings of the step. """
+    name = 'arcpy'
+
+    def __init__ (self, workspace = None, snapRaster = None, extent = None, defaultSR = 4326, **options):
+        Backend.__init__ (self, workspace, defaultSR)
+        import arcpy
+        self.arcpy = arcpy
+        arcpy.env.overwriteOutput = True
+        arcpy.CheckOutExtension ("Spatial")
+        if workspace is not None:
+            arcpy.env.workspace = workspace
+        if snapRaster is not None:
+            arcpy.env.snapRaster = snapRaster
+        if extent is not None:
+            arcpy.env.extent = extent
+
+    def spatialRef (self, name):
+        return self.arcpy.Describe (name).spatialReference
+
+    def extractByExtent (self, inName, templateName, outName):
+        self.arcpy.sa.ExtractByRectangle (inName, self.arcpy.Describe (templateName).extent, "INSIDE").save (outName)
+
+    def resample (self, inNames, outNames, templateName, method = 'BILINEAR', cacheFolder = None):
+        """ ProjectRaster onto the template grid. ASCII grids are converted to rasters first (same
+            name without extension) and get defaultSR when they have no coordinate system. """
+        arcpy = self.arcpy
+        cellSize = arcpy.GetRasterProperties_management (templateName, "CELLSIZEX")
+        for inName, outName in zip (inNames, outNames):
+            if hrrRaster.isAscii (inName):
+                ras = os.path.splitext (inName)[0]
+                arcpy.ASCIIToRaster_conversion (inName, ras, "FLOAT")
+                if arcpy.Describe (ras).spatialReference.name == 'Unknown':
+                    arcpy.DefineProjection_management (ras, arcpy.SpatialReference (self.defaultSR))
+                inName = ras
+            arcpy.ProjectRaster_management (inName, outName, templateName, method, cellSize)
+
+    def readTable (self, name):
+        return hrrTable.fromArc (name)
+
+    def writeTable (self, table, name):
+        hrrTable.writeArc (table, name)
+
+    def addFields (self, name, fields):
+        """ AddField of each (field, type), e.g. ('LC', 'SHORT') """
+        for field, fieldType in fields:
+            self.arcpy.AddField_management (name, field, fieldType)
+
+    def joinFields (self, name, zonalTable, fields = None, rename = None, zoneField = 'GRIDCODE'):
+        hrrZonal.joinTable (name, zonalTable, fields, rename, zoneField)
+
+    def zoneFeatures (self, zoneName, outName):
+        tmp = 'in_memory\\hrrzones'
+        if self.arcpy.Exists (tmp):
+            self.arcpy.Delete_management (tmp)
+        self.arcpy.RasterToPolygon_conversion (zoneName, tmp, "NO_SIMPLIFY", "VALUE")
+        self.arcpy.Dissolve_management (tmp, outName, "GRIDCODE")
+        self.arcpy.Delete_management (tmp)
+
+
+class NumpyBackend (Backend):
+    """ NumPy and files, no arcpy. spatialReference: coordinate system (EPSG code or WKT) of
+        ASCII grids without a .prj file, e.g. that of the fdir grid. """
+    name = 'numpy'
+
+    def __init__ (self, workspace = None, spatialReference = None, defaultSR = 4326, **options):
+        Backend.__init__ (self, workspace, defaultSR)
+        self.spatialReference = spatialReference
+
+    def path (self, name):
+        return os.path.join (self.workspace, name) if self.workspace else name
+
+    def rasterPath (self, name):
+        """ ESRI ASCII grid or tiled store of a raster name (<name>.asc without an extension) """
+        path = self.path (name)
+        if hrrRaster.isAscii (path) or hrrRaster.isTiles (path):
+            return path
+        return path + '.asc'
+
+    def tablePath (self, name):
+        """ Comma delimited text of a table name (.csv in place of .dbf or no extension) """
+        path = self.path (name)
+        if os.path.splitext (path)[1].lower () in ('.csv', '.txt'):
+            return path
+        return os.path.splitext (path)[0] + '.csv'
+
+    def readHeader (self, name):
+        header = hrrRaster.readHeader (self.rasterPath (name))
+        if header.get ('spatialReference') is None:
+            header['spatialReference'] = self.spatialRef (name)
+        return header
+
+    def spatialRef (self, name):
+        """ WKT of <name>.prj next to the grid, else spatialReference """
+        prj = os.path.splitext (self.rasterPath (name))[0] + '.prj'
+        if os.path.isfile (prj):
+            with open (prj, 'r') as handle:
+                return handle.read ().strip ()
+        return self.spatialReference
+
+    def extractByExtent (self, inName, templateName, outName):
+        """ Cells of the input whose centers fall in the template extent, at the input resolution """
+        arr, hdr = self.readRaster (inName)
+        r0, r1, c0, c1 = windowOf (hdr, self.readHeader (templateName))
+        cs = hdr['cellsize']
+        out = dict (hrrRaster.cleanHeader (hdr), ncols = max (c1 - c0, 0), nrows = max (r1 - r0, 0),
+                    xllcorner = hdr['xllcorner'] + c0 * cs,
+                    yllcorner = hdr['yllcorner'] + (hdr['nrows'] - r1) * cs)
+        self.writeRaster (outName, arr[r0:r1, c0:c1], out)
+
+    def resample (self, inNames, outNames, templateName, method = 'BILINEAR', cacheFolder = None):
+        """ hrrResample onto the template grid, one cached map per source grid """
+        target = self.readHeader (templateName)
+        hrrResample.resampleRasters ([self.rasterPath (n) for n in inNames], [self.rasterPath (n) for n in outNames],
+                                     hrrRaster.cleanHeader (target), target.get ('spatialReference'), method,
+                                     cacheFolder, self.defaultSR)
+
+    def readTable (self, name):
+        return hrrTable.readText (self.tablePath (name))
+
+    def writeTable (self, table, name):
+        hrrTable.writeText (table, self.tablePath (name))
+
+    def addFields (self, name, fields):
+        """ Adds zero columns (field, type) the table does not have, e.g. ('LC', 'SHORT') """
+        table = self.readTable (name)
+        rows = hrrTable.numRows (table)
+        for field, fieldType in fields:
+            if field not in table:
+                table[field] = np.zeros (rows, dtype = fieldTypes.get (fieldType.upper (), np.float64))
+        self.writeTable (table, name)
+
+    def joinFields (self, name, zonalTable, fields = None, rename = None, zoneField = 'GRIDCODE'):
+        """ Joins zonal table fields to the table on its grid code; rows without a zone get 0
+            (integer fields) or NaN, as empty values read back from a dbf """
+        if fields is not None:
+            zonalTable = hrrZonal.subTable (zonalTable, fields, rename, zoneField)
+        table = self.readTable (name)
+        key = hrrTable.gridCodeField (table)
+        for f in zonalTable.dtype.names:
+            if f != zoneField:
+                fill = 0 if np.issubdtype (zonalTable.dtype[f], np.integer) else np.nan
+                hrrTable.joinColumns (table, key, zonalTable[zoneField], {f: zonalTable[f]}, fill)
+        self.writeTable (table, name)
+
+    def zoneFeatures (self, zoneName, outName):
+        """ GeoJSON polygon of every zone (GRIDCODE = label), dissolved as with ArcpyBackend """
+        labels, hdr = self.readRaster (zoneName, np.int64)
+        labels[~hrrRaster.nodataMask (labels, hdr)] = 0
+        codes, geoms = zonePolygons (labels, hdr)
+        writeGeoJSON (self.path (outName), geoms, codes)
+
+
+backends = {'arcpy': ArcpyBackend, 'numpy': NumpyBackend}
+
+
+def get (name = None, **options):
+    """ Backend by name ('arcpy' or 'numpy'; None: HRR_BACKEND environment variable, else arcpy).
+        options: workspace, snapRaster, extent (arcpy), spatialReference (numpy), defaultSR. """
+    name = (name or os.environ.get ('HRR_BACKEND') or 'arcpy').lower ()
+    if name not in backends:
+        raise ValueError ('Unknown backend ' + name + ', use one of ' + ', '.join (sorted (backends)))
+    return backends[name] (**options)
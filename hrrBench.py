@@ -0,0 +1,400 @@
+"""
+Benchmarks of the HRR setup engines on synthetic basins
+
+Makes synthetic D8 basins (DEM, fdir, facc, stream links, catchments, land cover and soil grids)
+for each grid size, and synthetic channel networks for each number of HRR units, then runs the
+NumPy engine of every step on them and appends one JSON line per run to resultsFile: wall time,
+throughput (cells or units per second) and peak resident memory. Each run is a separate process,
+so the peak memory is the one of that run. The inputs are made once per size and saved in
+benchFolder, and the stages memory-map them. step5 and step6 run functions of the step scripts,
+so they need arcpy (a run without it records the ImportError).
+
+  step1b   stream links, watersheds, upd and the zonal MAX tables (hrrFlow, hrrZonal)
+  step2    channel topology, HRR IDs, WID and cumulative fields (hrrSweep.unitTable, hrrTopo)
+  step3    Horn slope and its catchment means (hrrSlope)
+  step4.1  bilinear resampling of three soil grids onto the fdir grid (hrrResample)
+  step4.2  land cover MAJORITY per catchment (hrrZonal)
+  step4.3  soil means per catchment on the native soil grids (hrrOverlay)
+  step5    Step5 fillTable and makeFiles (text and binary tables) on rows shaped as the HRR3 cursor
+           gives them; the cursor read is not timed
+  step6    catchment x met cell pieces on a met lattice (hrrOverlay), then Step6 calcWt and a save and
+           load of the weight cache; the arcpy Intersect it stands in for and the overlay4.exe run
+           are not timed
+  step7    one month of hourly P bins (hrrBins)
+
+compare () lists the runs slower or larger than in an earlier results file.
+
+Hydro-Geo-Spatial Research Lab
+Website: http://www.northeastern.edu/beighley/home/
+"""
+
+import os, os.path, json, time, timeit, platform, tempfile, multiprocessing, subprocess, shutil, importlib
+import numpy as np
+import hrrFlow, hrrTopo, hrrZonal, hrrSlope, hrrResample, hrrOverlay, hrrSweep, hrrBins, hrrLog
+
+#####***** input parameters CHANGE AS NEEDED *****#####
+gridSizes = [1000, 2000, 5000, 10000, 20000] # grid side in cells, 1k x 1k to 20k x 20k
+unitCounts = [1000, 10000, 100000, 1000000] # HRR units for the table stages (step2, step5, step7)
+stages = ['step1b', 'step2', 'step3', 'step4.1', 'step4.2', 'step4.3', 'step5', 'step6', 'step7']
+benchFolder = os.path.join (tempfile.gettempdir (), 'hrr_bench') # synthetic inputs, made once per size
+resultsFile = 'bench_results.jsonl' # one JSON line per run, appended
+label = '' # saved with every run, e.g. the machine name
+streamCells = 1000 # stream threshold (cells) of the synthetic networks
+cellSize = 90.0 # synthetic cell size, m
+soilFactor = 10 # soil grid cells are this many fdir cells wide
+metFactor = 250 # met cells are this many fdir cells wide
+numThreads = 0 # step3 threads, 0 = all cores
+#####****************************#####
+
+gridStages = ['step1b', 'step3', 'step4.1', 'step4.2', 'step4.3', 'step6']
+unitStages = ['step2', 'step5', 'step7']
+stageScripts = {'step5': 'Step5_HRRtoText_21', 'step6': 'Step6_HRR_Met_21'} # imported before the clock starts
+
+
+def syntheticDEM (n, seed = 0, bandRows = 1024):
+    """ DEM falling to the south edge, with valleys every 64 and 1024 columns and noise, so every
+        cell has a lower neighbour and the flow gathers into a branching network """
+    rng = np.random.RandomState (seed)
+    c = np.arange (n, dtype = np.float64)
+    cross = np.zeros (n)
+    for period in (64, 1024):
+        cross += np.abs ((c % period) - period / 2.0) * 0.5
+    dem = np.empty ((n, n), dtype = np.float32)
+    for r0 in range (0, n, bandRows):
+        r1 = min (r0 + bandRows, n)
+        rows = (n - np.arange (r0, r1, dtype = np.float64))[:, np.newaxis]
+        dem[r0:r1] = rows + cross + rng.random_sample ((r1 - r0, n)) * 0.5
+    return dem
+
+
+def steepestD8 (dem, bandRows = 1024):
+    """ ESRI D8 codes by steepest drop; the south edge drains out of the grid """
+    nrows, ncols = dem.shape
+    fdir = np.zeros (dem.shape, dtype = np.uint8)
+    for r0 in range (0, nrows, bandRows):
+        r1 = min (r0 + bandRows, nrows)
+        pad = np.full ((r1 - r0 + 2, ncols + 2), np.inf, dtype = np.float64)
+        top, bottom = max (r0 - 1, 0), min (r1 + 1, nrows)
+        pad[top - r0 + 1:bottom - r0 + 1, 1:-1] = dem[top:bottom]
+        if r1 == nrows:
+            pad[-1, :] = -np.inf
+        block = pad[1:-1, 1:-1]
+        best = np.zeros (block.shape)
+        for code, (dr, dc) in hrrFlow.D8.items ():
+            drop = (block - pad[1 + dr:pad.shape[0] - 1 + dr, 1 + dc:pad.shape[1] - 1 + dc]) / np.hypot (dr, dc)
+            sel = drop > best
+            best[sel] = drop[sel]
+            fdir[r0:r1][sel] = code
+    return fdir
+
+
+def flowAccumulation (down, order, bounds):
+    """ Number of cells draining through each cell (itself included), flat float32 """
+    facc = np.ones (down.size, dtype = np.float64)
+    for k in range (len (bounds) - 1):
+        cells = order[bounds[k]:bounds[k + 1]]
+        d = down[cells]
+        ok = d >= 0
+        np.add.at (facc, d[ok], facc[cells[ok]])
+    return facc.astype (np.float32)
+
+
+def gridHeader (n, cs):
+    return {'ncols': n, 'nrows': n, 'xllcorner': 0.0, 'yllcorner': 0.0, 'cellsize': cs, 'NODATA_value': -9999}
+
+
+def makeGrids (folder, n, seed = 0):
+    """ Synthetic basin of n x n cells saved as .npy in folder: dem, fdir, facc, basin (catchment
+        labels), lc (land cover classes) and ksat/theta/soild on the coarser soil grid """
+    if not os.path.exists (folder):
+        os.makedirs (folder)
+    dem = syntheticDEM (n, seed)
+    fdir = steepestD8 (dem)
+    down, valid = hrrFlow.downIndex (fdir)
+    order, bounds = hrrFlow.flowLevels (down, valid)
+    facc = flowAccumulation (down, order, bounds)
+    link = hrrFlow.streamLink (down, order, bounds, valid & (facc >= streamCells))
+    basin = hrrFlow.watershed (down, order, bounds, link)
+    del down, valid, order, bounds, link
+
+    rng = np.random.RandomState (seed + 1)
+    ns = max (n // soilFactor, 2)
+    np.save (os.path.join (folder, 'dem.npy'), dem)
+    np.save (os.path.join (folder, 'fdir.npy'), fdir)
+    np.save (os.path.join (folder, 'facc.npy'), facc.reshape (n, n))
+    np.save (os.path.join (folder, 'basin.npy'), basin.reshape (n, n))
+    np.save (os.path.join (folder, 'lc.npy'), rng.randint (1, 17, size = (n, n)).astype (np.int16))
+    for name, lo, hi in (('ksat', 0.5, 200.0), ('theta', 0.3, 0.6), ('soild', 0.5, 2.3)):
+        np.save (os.path.join (folder, name + '.npy'), (lo + (hi - lo) * rng.random_sample ((ns, ns))).astype (np.float32))
+    with open (os.path.join (folder, 'ready'), 'w') as handle:
+        handle.write (str (int (basin.max ())))
+
+
+def loadGrids (folder):
+    names = ['dem', 'fdir', 'facc', 'basin', 'lc', 'ksat', 'theta', 'soild']
+    return dict ((name, np.load (os.path.join (folder, name + '.npy'), mmap_mode = 'r')) for name in names)
+
+
+def makeUnits (n, seed = 0):
+    """ Synthetic channel network of n units: watersheds of about 1000 units, each unit draining
+        to one of the ~sqrt (n) units before it in its watershed, grid codes shuffled.
+        Returns (gridCode, toCode, count, maxFacc). """
+    rng = np.random.RandomState (seed)
+    size = min (n, 1000)
+    pos = np.arange (n) % size # position in the watershed, 0 = outlet
+    width = max (int (np.sqrt (size)), 1)
+    parent = np.arange (n) - 1 - (rng.random_sample (n) * np.minimum (pos, width)).astype (np.int64)
+    parent[pos == 0] = -1
+    codes = rng.permutation (n) + 1
+    toCode = np.where (parent >= 0, codes[np.maximum (parent, 0)], 0)
+    count = rng.randint (50, 5000, size = n)
+    cum = hrrTopo.accumulate (hrrTopo.downstream (codes, toCode), count)
+    return codes, toCode, count, cum * (1 + 0.01 * rng.random_sample (n))
+
+
+def makeRows (n, seed = 0):
+    """ Synthetic HRR3 table of n units as rows of the step 5 cursor (its fields in schema order,
+        a few nulls): topology of makeUnits numbered as step 2 does, random slopes and soils """
+    schema = importlib.import_module (stageScripts['step5']).schema
+    gridCode, toCode, count, maxFacc = makeUnits (n, seed)
+    table = hrrSweep.unitTable (gridCode, toCode, count, maxFacc, maxFacc)
+    rng = np.random.RandomState (seed + 5)
+    cellArea = (cellSize / 1000.0) ** 2
+    fields = {'HRR_ID': table['HRR_ID'], 'GRIDCODE': table['GRIDCODE'], 'DOWN_ID': table['Down_ID'],
+              'NUMUP': table['NumUp'], 'UP1ID': table['Up1ID'], 'UP2ID': table['Up2ID'], 'UP3ID': table['Up3ID'],
+              'UP4ID': table['Up4ID'], 'A_SQKM': table['COUNT'] * cellArea, 'CUMA_SQKM': table['CumArea'] * cellArea,
+              'LP_KM': rng.random_sample (n) * 5, 'LC_LFP_KM': rng.random_sample (n) * 10,
+              'SLOPE_CAT': rng.random_sample (n) * 30, 'SLOPE_STR': rng.random_sample (n) * 5,
+              'KSAT': 0.5 + rng.random_sample (n) * 200, 'EFFPOR': 0.3 + rng.random_sample (n) * 0.3,
+              'DEPTH': 0.5 + rng.random_sample (n) * 1.8, 'LC': rng.randint (1, 17, size = n)}
+    columns = []
+    for c in schema:
+        if c[1] is not None:
+            values = fields[c[1]].tolist ()
+            if c[1] in ('SLOPE_CAT', 'SLOPE_STR', 'KSAT', 'EFFPOR', 'DEPTH', 'LC'):
+                for k in np.nonzero (rng.random_sample (n) < 0.01)[0]:
+                    values[k] = None
+            columns.append (values)
+    return list (zip (*columns))
+
+
+# stage functions: (inputs) -> work size; inputs are made before the clock starts
+
+def step1b (g):
+    fdir, facc = np.asarray (g['fdir']), np.asarray (g['facc'])
+    link, basin = hrrFlow.streamNetwork (fdir, facc, streamCells)
+    upd = hrrFlow.updLength (fdir, facc, streamCells // 10, cellSize)
+    hrrZonal.zonalStats (basin, {'facc': facc, 'upd': upd}, ['COUNT', 'MAX'], {'upd': -1})
+    return fdir.size
+
+
+def step3 (g):
+    hrrSlope.zonalSlope (g['dem'], g['basin'], cellSize, numThreads = numThreads or None)
+    return g['dem'].size
+
+
+def soilHeader (g):
+    ns = g['ksat'].shape[0]
+    return gridHeader (ns, cellSize * g['dem'].shape[0] / float (ns))
+
+
+def step41 (g):
+    n = g['dem'].shape[0]
+    rsMap = hrrResample.buildMap (soilHeader (g), 4326, gridHeader (n, cellSize), 4326, 'BILINEAR')
+    hrrResample.applyMap (rsMap, [g['ksat'], g['theta'], g['soild']], [None] * 3)
+    return n * n
+
+
+def step42 (g):
+    hrrZonal.zonalStats (g['basin'], {'lc': g['lc']}, ['MAJORITY'])
+    return g['basin'].size
+
+
+def step43 (g):
+    n = g['dem'].shape[0]
+    overlay = hrrOverlay.labelOverlay (g['basin'], gridHeader (n, cellSize), 4326, soilHeader (g), 4326)
+    for name in ('ksat', 'theta', 'soild'):
+        hrrOverlay.zoneMeans (overlay, g[name])
+    return n * n
+
+
+def step6 (g):
+    script = importlib.import_module (stageScripts['step6'])
+    n = g['dem'].shape[0]
+    nm = max (n // metFactor, 1)
+    metHdr = gridHeader (nm, cellSize * n / float (nm))
+    overlay = hrrOverlay.labelOverlay (g['basin'], gridHeader (n, cellSize), 4326, metHdr, 4326)
+    # one record per catchment x met cell piece, sorted on HRR_ID, as getData reads the Intersect
+    hrrID = overlay['zones'][overlay['row']].tolist ()
+    ap = (overlay['weight'] * overlay['area'][overlay['row']]).tolist ()
+    data = {"grid": hrrID, "hrr": list (hrrID), "cpc": (overlay['col'] + 1).tolist (), "ap": ap, "area": list (ap),
+            "wt": []}
+    data = script.calcWt (data)
+    script.cacheFolder = os.path.join (benchFolder, 'step6_cache')
+    script.saveWeights ('bench', data)
+    script.loadWeights ('bench')
+    shutil.rmtree (script.cacheFolder)
+    return n * n
+
+
+def step2 (u):
+    gridCode, toCode, count, maxFacc = u
+    table = hrrSweep.unitTable (gridCode, toCode, count, maxFacc, maxFacc)
+    down = hrrTopo.downFromIDs (table['HRR_ID'], table['Down_ID'])
+    hrrTopo.accumulate (down, np.column_stack ([count, count, count]))
+    return gridCode.size
+
+
+def step5 (rows):
+    script = importlib.import_module (stageScripts['step5'])
+    script.writeBinary = True
+    numRec = len (rows) + 1
+    table = script.dropFirst (script.fillTable (None, numRec, rows))
+    folder = os.path.join (benchFolder, 'step5')
+    if not os.path.exists (folder):
+        os.makedirs (folder)
+    script.makeFiles (folder, table, numRec)
+    shutil.rmtree (folder)
+    return len (rows)
+
+
+def step7 (u):
+    n = u[0].size
+    rng = np.random.RandomState (7)
+    numCells = max (n // 10, 1)
+    per = rng.randint (1, 5, size = n)
+    ptr = np.concatenate ([[0], np.cumsum (per)])
+    cells = rng.randint (0, numCells, size = ptr[-1])
+    weights = rng.random_sample (ptr[-1])
+    blocks = (rng.random_sample ((24, numCells)) for d in range (31))
+    path = os.path.join (benchFolder, 'step7.bin')
+    hrrBins.writeBins (path, blocks, ptr, cells, weights)
+    os.remove (path)
+    return n
+
+
+stageFunctions = {'step1b': step1b, 'step2': step2, 'step3': step3, 'step4.1': step41, 'step4.2': step42,
+                  'step4.3': step43, 'step5': step5, 'step6': step6, 'step7': step7}
+
+
+def runCase (stage, size, queue):
+    """ One run in this (child) process; puts the record on queue """
+    record = {'stage': stage, 'size': size}
+    hrrLog.echo = False
+    try:
+        if stage in stageScripts:
+            importlib.import_module (stageScripts[stage])
+        if stage == 'step5':
+            inputs = makeRows (size)
+        elif stage in unitStages:
+            inputs = makeUnits (size)
+        else:
+            inputs = loadGrids (os.path.join (benchFolder, 'grid_' + str (size)))
+        record['input_rss_mb'] = hrrLog.currentRSS ()
+        t0 = timeit.default_timer ()
+        work = stageFunctions[stage] (inputs)
+        record['wall_s'] = timeit.default_timer () - t0
+        record['work'] = int (work)
+        record['work_unit'] = 'units' if stage in unitStages else 'cells'
+        record['throughput'] = work / max (record['wall_s'], 1e-9)
+        record['peak_rss_mb'] = hrrLog.peakRSS ()
+    except MemoryError:
+        record['error'] = 'MemoryError'
+    except Exception as e:
+        record['error'] = type (e).__name__ + ': ' + str (e)
+    queue.put (record)
+
+
+def inChild (target, args):
+    """ Runs target (*args, queue) in a new process, returns what it put on the queue """
+    queue = multiprocessing.Queue ()
+    proc = multiprocessing.Process (target = target, args = tuple (args) + (queue,))
+    proc.start ()
+    result = queue.get ()
+    proc.join ()
+    return result
+
+
+def gridWorker (n, queue):
+    folder = os.path.join (benchFolder, 'grid_' + str (n))
+    t0 = timeit.default_timer ()
+    makeGrids (folder, n)
+    queue.put (timeit.default_timer () - t0)
+
+
+def gitCommit ():
+    try:
+        out = subprocess.Popen (['git', 'rev-parse', '--short', 'HEAD'], stdout = subprocess.PIPE,
+                                stderr = subprocess.PIPE, cwd = os.path.dirname (os.path.abspath (__file__)))
+        return out.communicate ()[0].decode ('ascii').strip () or None
+    except OSError:
+        return None
+
+
+def runBenchmarks (stageNames = None, sizes = None, units = None, outFile = None):
+    """ Runs every stage at every size, appends the records to outFile. Returns the records. """
+    stageNames = stages if stageNames is None else stageNames
+    sizes = gridSizes if sizes is None else sizes
+    units = unitCounts if units is None else units
+    outFile = resultsFile if outFile is None else outFile
+    common = {'label': label,
+              'commit': gitCommit (),
+              'time': time.strftime ('%Y-%m-%dT%H:%M:%SZ', time.gmtime ()),
+              'python': platform.python_version (),
+              'numpy': np.__version__,
+              'platform': platform.platform (),
+              'cpus': multiprocessing.cpu_count ()
+              }
+    records = []
+    cases = [(s, n) for s in stageNames if s in unitStages for n in units]
+    cases += [(s, n) for n in sizes for s in stageNames if s in gridStages]
+    for stage, size in cases:
+        if stage in gridStages and not os.path.exists (os.path.join (benchFolder, 'grid_' + str (size), 'ready')):
+            print ('making synthetic basin ' + str (size) + ' x ' + str (size))
+            print ('  %.1f s' % inChild (gridWorker, [size]))
+        record = dict (common)
+        record.update (inChild (runCase, [stage, size]))
+        records.append (record)
+        with open (outFile, 'a') as handle:
+            handle.write (json.dumps (record, sort_keys = True) + '\n')
+        if 'error' in record:
+            print ('%-8s %9d  %s' % (stage, size, record['error']))
+        else:
+            peak = record['peak_rss_mb']
+            print ('%-8s %9d  %9.2f s  %12.0f %s/s  peak %s MB' % (stage, size, record['wall_s'], record['throughput'],
+                                                                  record['work_unit'], '?' if peak is None else '%.0f' % peak))
+    return records
+
+
+def readResults (path):
+    """ Last record of every (stage, size) in a results file """
+    last = {}
+    with open (path, 'r') as handle:
+        for line in handle:
+            if line.strip ():
+                r = json.loads (line)
+                last[(r['stage'], r['size'])] = r
+    return last
+
+
+def compare (path, baselinePath, tolerance = 1.25):
+    """ Runs in path slower, or with a larger peak memory, than tolerance times the same stage and
+        size in baselinePath. Returns list of (stage, size, field, value, baseline value). """
+    new, old = readResults (path), readResults (baselinePath)
+    out = []
+    for key in sorted (set (new) & set (old)):
+        for field in ('wall_s', 'peak_rss_mb'):
+            a, b = new[key].get (field), old[key].get (field)
+            if a is not None and b and a > tolerance * b:
+                out.append (key + (field, a, b))
+    return out
+
+
+def main ():
+    if not os.path.exists (benchFolder):
+        os.makedirs (benchFolder)
+    runBenchmarks ()
+    print ('Results in ' + resultsFile)
+
+if __name__ == "__main__":
+    main ()
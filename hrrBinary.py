@@ -0,0 +1,135 @@
+"""
+Binary form of the HRR model input tables (channels, planes), readable by memory-mapping.
+
+File layout, all little-endian:
+  bytes 0-7     magic b'HRRBIN01'
+  bytes 8-11    uint32 number of columns
+  bytes 12-15   uint32 size of one schema entry (64)
+  bytes 16-23   uint64 number of rows (units, in HRR_ID order: row i is HRR_ID i + 1)
+  bytes 24-31   uint64 offset of the first column
+  schema        one 64 byte entry per column: name (40 bytes, ASCII, NUL padded), NumPy type
+                (8 bytes, e.g. '<f8', '<i4'), uint64 offset of the column, uint64 size in bytes
+  columns       contiguous, each starting on an 8 byte boundary
+
+Columns keep the order of the text file. A column holding both integers and floats (e.g. the
+-999 defaults in float columns) is stored as '<f8' with a companion '<u1' column named
+'<name>#int' that flags the integer values, so toText writes the same text the model reads
+(str of each value) and the text files can always be made back from the binary file.
+
+Hydro-Geo-Spatial Research Lab
+Website: http://www.northeastern.edu/beighley/home/
+"""
+
+import struct
+from collections import OrderedDict
+import numpy as np
+import hrrText
+
+magic = b'HRRBIN01'
+try:
+    integerTypes = (int, long, np.integer)
+except NameError:
+    integerTypes = (int, np.integer)
+entrySize = 64
+flagSuffix = '#int'
+
+
+def columnArrays (name, values):
+    """ [(name, array)] for one column of Python values or an array, with the integer flags of
+        mixed columns """
+    if isinstance (values, np.ndarray):
+        return [(name, values)]
+    isInt = np.array ([isinstance (v, integerTypes) and not isinstance (v, bool) for v in values],
+                      dtype = bool)
+    if isInt.all ():
+        return [(name, np.array (values, dtype = np.int64))]
+    arr = np.array (values, dtype = np.float64)
+    if not isInt.any ():
+        return [(name, arr)]
+    return [(name, arr), (name + flagSuffix, isInt.astype (np.uint8))]
+
+
+def write (path, names, columns):
+    """ Writes columns (lists of Python values or arrays, one per name) to a binary table """
+    arrays = []
+    for name, values in zip (names, columns):
+        arrays.extend (columnArrays (name, values))
+    numRows = len (arrays[0][1]) if arrays else 0
+    for name, arr in arrays:
+        if len (arr) != numRows:
+            raise ValueError ('Column ' + name + ' has ' + str (len (arr)) + ' rows, not ' + str (numRows))
+
+    offset = 32 + entrySize * len (arrays)
+    offset += -offset % 8
+    dataOffset = offset
+    schema = []
+    for name, arr in arrays:
+        arr = np.ascontiguousarray (arr, dtype = arr.dtype.newbyteorder ('<'))
+        schema.append ((name, arr, offset))
+        offset += arr.nbytes
+        offset += -offset % 8
+
+    with open (path, 'wb') as handle:
+        handle.write (magic)
+        handle.write (struct.pack ('<IIQQ', len (arrays), entrySize, numRows, dataOffset))
+        for name, arr, off in schema:
+            handle.write (struct.pack ('<40s8sQQ', name.encode ('ascii'), arr.dtype.str.encode ('ascii'),
+                                       off, arr.nbytes))
+        for name, arr, off in schema:
+            handle.write (b'\0' * (off - handle.tell ()))
+            handle.write (arr.tobytes ())
+
+
+def readSchema (path):
+    """ (numRows, [(name, dtype, offset, nbytes)]) of a binary table """
+    with open (path, 'rb') as handle:
+        if handle.read (8) != magic:
+            raise ValueError (path + ' is not an HRR binary table')
+        numCols, size, numRows, dataOffset = struct.unpack ('<IIQQ', handle.read (24))
+        schema = []
+        for c in range (numCols):
+            entry = handle.read (size)
+            name, dtype, off, nbytes = struct.unpack ('<40s8sQQ', entry[:64])
+            schema.append ((name.rstrip (b'\0').decode ('ascii'), dtype.rstrip (b'\0').decode ('ascii'),
+                            off, nbytes))
+    return numRows, schema
+
+
+def read (path, flags = False):
+    """ Memory-maps a binary table: OrderedDict of column name -> read only array, no parsing.
+        flags: also return the '#int' companion columns. """
+    numRows, schema = readSchema (path)
+    table = OrderedDict ()
+    for name, dtype, off, nbytes in schema:
+        if name.endswith (flagSuffix) and not flags:
+            continue
+        table[name] = np.memmap (path, dtype = np.dtype (dtype), mode = 'r', offset = off, shape = (numRows,))
+    return table
+
+
+def toText (path, txtPath, firstLine = None, blockRows = 65536):
+    """ Writes a binary table back to the tab delimited text file it was made from.
+        firstLine: text written before the rows (e.g. the count line of output_calibration). """
+    table = read (path, True)
+    names = [n for n in table if not n.endswith (flagSuffix)]
+    numRows = len (table[names[0]]) if names else 0
+
+    def values (name, r0, r1):
+        col = np.asarray (table[name][r0:r1])
+        if name + flagSuffix not in table:
+            return col.tolist ()
+        isInt = np.asarray (table[name + flagSuffix][r0:r1]).astype (bool)
+        out = col.tolist ()
+        for i in np.nonzero (isInt)[0].tolist ():
+            out[i] = int (out[i])
+        return out
+
+    def blocks ():
+        for r0 in range (0, numRows, blockRows):
+            r1 = min (r0 + blockRows, numRows)
+            yield [values (n, r0, r1) for n in names]
+
+    with open (txtPath, 'w') as handle:
+        if firstLine is not None:
+            handle.write (firstLine)
+        hrrText.writeStream (handle, blocks ())
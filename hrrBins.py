@@ -0,0 +1,188 @@
+"""
+P and ET bin files for the HRR model units (Python version of the makebins Fortran code).
+
+Reads input_P_ET.txt and the met overlay weights (Grid_overlay_<data>.txt, step 6), streams the
+gridded met time series in blocks of time steps, and averages every block over the model units
+with the sparse unit x met cell weights: one gather and one segmented sum (reduceat) per block,
+so a basin needs no recompiling and memory depends on the block size only.
+
+The makebins source (main_P_ET_v1_GCM.f90) is not in this folder, so the layouts below are
+assumptions that have not been checked against it, kept in one place each (readInput,
+readOverlay, metBlocks, writeBins); step 7 runs the Fortran exe unless asked. Inputs that do not
+fit them are refused with a ValueError rather than read as something else: overlay lines that
+are not HRR_ID n and n (ID, wt) pairs summing to 1, repeated or out of range HRR_IDs, met cell
+IDs past the columns of the met series, raw binary series and the 3B42_daily files.
+  input_P_ET.txt   line 1 number of units, line 2 number of (hourly) time steps, line 4 start
+                   year, lines 5-6 climate model settings (0 unless GCM data)
+  Grid_overlay     one line per unit, HRR_ID order: HRR_ID  n  ID_1 wt_1 ... ID_n wt_n
+                   (overlay4.exe output); met cell ID k is column k - 1 of the met series
+  met series       time x cells: .npy (2-D, memory-mapped) or text, one line per time step.
+                   The Fortran reads TRMM from the daily 3B42_daily.* files, which must be
+                   converted first
+  bin file         little-endian float32, time major: for each time step the values of units
+                   1..n (Fortran stream / direct access, no record markers)
+
+Hydro-Geo-Spatial Research Lab
+Website: http://www.northeastern.edu/beighley/home/
+"""
+
+import os, os.path, itertools
+import numpy as np
+import hrrLog
+
+
+def readInput (path):
+    """ Reads input_P_ET.txt. Returns dictionary: numUnits, numSteps, startYear, lines """
+    with open (path, 'r') as handle:
+        lines = [l.strip () for l in handle.readlines ()]
+
+    def value (i):
+        return int (float (lines[i].split ()[0])) if len (lines) > i and lines[i].split () else 0
+
+    return {'numUnits': value (0),
+            'numSteps': value (1),
+            'startYear': value (3),
+            'lines': lines
+            }
+
+
+def readOverlay (path, numUnits = None, wtDigits = 3):
+    """ Reads a met overlay file to CSR form for units 1..numUnits: the cells of unit u
+        (HRR_ID u + 1) are cells[ptr[u]:ptr[u+1]] (0-based met columns) with weights.
+        Returns (ptr, cells, weights). ValueError for a line that does not fit the layout, a
+        repeated HRR_ID or one past numUnits, or weights of a unit not summing to 1 (within
+        the rounding of wtDigits decimals per weight, as Step6 calcWt rounds them). """
+    ids, counts, cells, weights = [], [], [], []
+    with open (path, 'r') as handle:
+        for k, line in enumerate (handle):
+            parts = line.split ()
+            if not parts:
+                continue
+            where = path + ' line ' + str (k + 1)
+            try:
+                hrrID, n = int (parts[0]), int (parts[1])
+                metIDs = [int (c) for c in parts[2::2]]
+                wts = [float (w) for w in parts[3::2]]
+            except (IndexError, ValueError):
+                raise ValueError (where + ' is not HRR_ID n ID_1 wt_1 ... ID_n wt_n: ' + line.strip ())
+            if hrrID < 1 or n < 1 or len (parts) != 2 + 2 * n or min (metIDs) < 1:
+                raise ValueError (where + ' is not HRR_ID n ID_1 wt_1 ... ID_n wt_n: ' + line.strip ())
+            if abs (sum (wts) - 1.0) > n * 0.5 * 10 ** -wtDigits + 1e-9:
+                raise ValueError (where + ': weights of HRR_ID ' + str (hrrID) + ' sum to ' + str (sum (wts)))
+            ids.append (hrrID)
+            counts.append (n)
+            cells.extend (metIDs)
+            weights.extend (wts)
+    ids = np.array (ids, dtype = np.int64)
+    counts = np.array (counts, dtype = np.int64)
+    cells = np.array (cells, dtype = np.int64) - 1
+    weights = np.array (weights, dtype = np.float64)
+    if np.unique (ids).size != ids.size:
+        raise ValueError (path + ' has repeated HRR_IDs')
+    if numUnits is None:
+        numUnits = int (ids.max ()) if ids.size else 0
+    elif ids.size and ids.max () > numUnits:
+        raise ValueError (path + ' has HRR_ID ' + str (ids.max ()) + ', past the ' + str (numUnits) + ' units')
+
+    # entries grouped by HRR_ID, units without cells get empty rows
+    unit = np.repeat (ids, counts) - 1
+    order = np.argsort (unit, kind = 'mergesort')
+    ptr = np.zeros (numUnits + 1, dtype = np.int64)
+    ptr[1:] = np.cumsum (np.bincount (unit, minlength = numUnits))
+    return ptr, cells[order], weights[order]
+
+
+def metBlocks (path, blockSteps = 744):
+    """ Yields blocks (time steps x cells) of a met time series, blockSteps at a time.
+        .npy files are memory-mapped; other files are text, one line per time step, the same
+        number of values on every line. ValueError for the 3B42_daily files and raw binary
+        series, whose layout is not known here. """
+    name = os.path.basename (path)
+    ext = os.path.splitext (path)[1].lower ()
+    if name.upper ().startswith ('3B42'):
+        raise ValueError (name + ': the 3B42_daily files are not read, convert them to a time x cells series first')
+    if ext in ('.bin', '.dat'):
+        raise ValueError (name + ': raw binary met series are not read, save them as .npy (time x cells) or text')
+    if ext == '.npy':
+        data = np.load (path, mmap_mode = 'r')
+        if data.ndim != 2:
+            raise ValueError (name + ' is not a 2-D (time x cells) array')
+        for t0 in range (0, data.shape[0], blockSteps):
+            yield np.asarray (data[t0:t0 + blockSteps], dtype = np.float64)
+        return
+    numCells = None
+    with open (path, 'r') as handle:
+        while True:
+            block = np.loadtxt (itertools.islice (handle, blockSteps), dtype = np.float64, ndmin = 2)
+            if block.size == 0:
+                return
+            if numCells is None:
+                numCells = block.shape[1]
+            elif block.shape[1] != numCells:
+                raise ValueError (name + ' has ' + str (block.shape[1]) + ' values per line after ' + str (numCells))
+            yield block
+            if block.shape[0] < blockSteps:
+                return
+
+
+def unitAverages (block, ptr, cells, weights, nodata = None):
+    """ Weighted averages of one block of met data over the units: (time steps x units).
+        Met cells with nodata (or NaN) are left out and the weights of the other cells of the
+        unit rescaled to the unit's weight sum (as hrrOverlay.zoneMeans). Units without cells,
+        or without data in a time step, get 0. """
+    out = np.zeros ((block.shape[0], ptr.size - 1))
+    has = np.diff (ptr) > 0
+    if not cells.size:
+        return out
+    vals = block[:, cells]
+    ok = np.isfinite (vals)
+    if nodata is not None:
+        ok &= vals != nodata
+    w = np.where (ok, weights, 0.0)
+    starts = ptr[:-1][has]
+    vsum = np.add.reduceat (np.where (ok, vals, 0.0) * w, starts, axis = 1)
+    wsum = np.add.reduceat (w, starts, axis = 1)
+    total = np.add.reduceat (weights, starts)
+    good = wsum > 0
+    out[:, has] = vsum * np.where (good, total / np.where (good, wsum, 1.0), 0.0)
+    return out
+
+
+def writeBins (binPath, blocks, ptr, cells, weights, numSteps = None, stepsPerRecord = 1, scale = 1.0,
+               nodata = None):
+    """ Streams met blocks into a bin file (see module layout). stepsPerRecord repeats each met
+        record (e.g. 24 for daily data in hourly bins). Stops after numSteps time steps.
+        Returns the number of time steps written. """
+    written = 0
+    with open (binPath, 'wb') as handle:
+        for block in blocks:
+            if cells.size and cells.max () >= block.shape[1]:
+                raise ValueError ('Met cell ID ' + str (cells.max () + 1) + ' of the overlay is past the ' +
+                                  str (block.shape[1]) + ' cells of the met series')
+            avg = unitAverages (block, ptr, cells, weights, nodata) * scale
+            if stepsPerRecord > 1:
+                avg = np.repeat (avg, stepsPerRecord, axis = 0)
+            if numSteps is not None:
+                avg = avg[:max (numSteps - written, 0)]
+            avg.astype ('<f4').tofile (handle)
+            written += avg.shape[0]
+            if numSteps is not None and written >= numSteps:
+                break
+    if numSteps is not None and written < numSteps:
+        hrrLog.warning (binPath + ' has ' + str (written) + ' of ' + str (numSteps) + ' time steps')
+    return written
+
+
+def readBins (binPath, numUnits):
+    """ Bin file as a memory-mapped (time steps x units) array """
+    return np.memmap (binPath, dtype = '<f4', mode = 'r').reshape (-1, numUnits)
+
+
+def makeBins (inputFile, overlayFile, metFile, binPath, blockSteps = 744, stepsPerRecord = 1, scale = 1.0,
+              nodata = None):
+    """ One bin file from input_P_ET.txt, a met overlay file and a met time series """
+    params = readInput (inputFile)
+    ptr, cells, weights = readOverlay (overlayFile, params['numUnits'])
+    blocks = metBlocks (metFile, blockSteps)
+    return writeBins (binPath, blocks, ptr, cells, weights, params['numSteps'] or None,
+                      stepsPerRecord, scale, nodata)
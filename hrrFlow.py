@@ -0,0 +1,183 @@
+"""
+D8 flow network engine for the HRR setup (replaces StreamLink and Watershed in step 1).
+
+Works on fdir/facc arrays. The flow direction grid is turned into one downstream pointer per cell,
+cells are ordered once from the headwaters to the outlets (topological levels), and stream links and
+catchments are labeled by sweeping that order, so the work is linear in the number of cells.
+
+Flow direction uses the ESRI D8 coding:
+     32  64 128
+     16   x   1
+      8   4   2
+
+Hydro-Geo-Spatial Research Lab
+Website: http://www.northeastern.edu/beighley/home/
+"""
+
+import numpy as np
+import hrrLog
+
+# ESRI D8 code: (row offset, column offset); rows grow to the south
+D8 = {1: (0, 1), 2: (1, 1), 4: (1, 0), 8: (1, -1),
+      16: (0, -1), 32: (-1, -1), 64: (-1, 0), 128: (-1, 1)}
+
+
+def downIndex (fdir, mask = None):
+    """ Returns (down, valid). down is the flat index of the next cell downstream, -1 if the flow
+        leaves the grid, the mask or the valid fdir cells. valid is the flat mask of routed cells."""
+    nrows, ncols = fdir.shape
+    flat = fdir.ravel ()
+    valid = np.isin (flat, list (D8.keys ()))
+    if mask is not None:
+        valid &= mask.ravel ()
+
+    down = np.full (flat.size, -1, dtype = np.int64)
+    for code, (dr, dc) in D8.items ():
+        idx = np.nonzero (valid & (flat == code))[0]
+        r = idx // ncols + dr
+        c = idx % ncols + dc
+        ok = (r >= 0) & (r < nrows) & (c >= 0) & (c < ncols)
+        down[idx[ok]] = r[ok] * ncols + c[ok]
+
+    #Cells draining into nodata or masked cells become outlets
+    inside = down >= 0
+    inside[inside] = valid[down[inside]]
+    down[~inside] = -1
+    return down, valid
+
+
+def flowLevels (down, valid, indegType = np.uint8):
+    """ Orders routed cells from the headwaters to the outlets.
+        Returns (order, bounds); order[bounds[k]:bounds[k+1]] are the cells of level k. Every cell
+        upstream of a cell is on a lower level, so sweeping levels up gives an upstream-first pass,
+        sweeping them down gives a downstream-first pass.
+        indegType holds the number of cells flowing in: uint8 is enough for D8 grids (at most 8),
+        use a wider type for networks of units."""
+    d = down[down >= 0]
+    indeg = np.bincount (d, minlength = down.size).astype (indegType)
+
+    frontier = np.nonzero (valid & (indeg == 0))[0]
+    parts = []
+    while frontier.size:
+        parts.append (frontier)
+        d = down[frontier]
+        d = d[d >= 0]
+        if d.size == 0:
+            break
+        u, n = np.unique (d, return_counts = True)
+        indeg[u] -= n.astype (indegType)
+        frontier = u[indeg[u] == 0]
+
+    if parts:
+        order = np.concatenate (parts)
+    else:
+        order = np.zeros (0, dtype = np.int64)
+    bounds = np.zeros (len (parts) + 1, dtype = np.int64)
+    bounds[1:] = np.cumsum ([p.size for p in parts])
+
+    numValid = int (np.count_nonzero (valid))
+    if order.size != numValid:
+        hrrLog.warning (str (numValid - order.size) + ' cells are in flow direction loops and are skipped')
+    return order, bounds
+
+
+def levelSlices (order, bounds, keep):
+    """ Returns the cells of each level where keep is True, as a list of arrays (level order) """
+    pos = np.nonzero (keep[order])[0]
+    cuts = np.searchsorted (pos, bounds)
+    cells = order[pos]
+    return [cells[cuts[k]:cuts[k + 1]] for k in range (len (bounds) - 1) if cuts[k + 1] > cuts[k]]
+
+
+def streamLink (down, order, bounds, stream):
+    """ Labels stream links, 1..n, 0 off the stream network.
+        A link starts at a stream source or below a confluence and runs to the next confluence,
+        as in ArcGIS StreamLink. Links are numbered from the headwaters down."""
+    n = down.size
+    sIdx = np.nonzero (stream)[0]
+    sDown = down[sIdx]
+    onStream = sDown >= 0
+    onStream[onStream] = stream[sDown[onStream]]
+
+    #Number of stream cells flowing directly into each cell
+    numUp = np.bincount (sDown[onStream], minlength = n)
+    parent = np.full (n, -1, dtype = np.int64)
+    parent[sDown[onStream]] = sIdx[onStream] #only used where numUp is 1
+    head = stream & (numUp != 1)
+
+    link = np.zeros (n, dtype = np.int32)
+    heads = order[head[order]]
+    link[heads] = np.arange (1, heads.size + 1, dtype = np.int32)
+
+    for cells in levelSlices (order, bounds, stream & ~head):
+        link[cells] = link[parent[cells]]
+    return link
+
+
+def watershed (down, order, bounds, link):
+    """ Labels every cell with the link it first drains to, 0 if it leaves the grid first """
+    basin = link.copy ()
+    for cells in reversed (levelSlices (order, bounds, (link == 0) & (down >= 0))):
+        basin[cells] = basin[down[cells]]
+    return basin
+
+
+def streamNetwork (fdir, facc, threshold, mask = None):
+    """ Stream link and watershed grids for cells with facc >= threshold.
+        Returns (link, basin) as 2D int32 arrays, 0 = nodata."""
+    down, valid = downIndex (fdir, mask)
+    order, bounds = flowLevels (down, valid)
+    stream = valid & (facc.ravel () >= threshold)
+    link = streamLink (down, order, bounds, stream)
+    basin = watershed (down, order, bounds, link)
+    return link.reshape (fdir.shape), basin.reshape (fdir.shape)
+
+
+def stepLength (fdir, cellX, cellY = None):
+    """ Length of the step out of each cell along its flow direction, flat array.
+        Cardinal steps are one cell wide or high, diagonal steps the cell diagonal. Lengths are in
+        the grid units, meters for a projected grid or decimal degrees for a geographic grid
+        (same as ArcGIS FlowLength)."""
+    if cellY is None:
+        cellY = cellX
+    flat = fdir.ravel ()
+    step = np.zeros (flat.size, dtype = np.float64)
+    for code, (dr, dc) in D8.items ():
+        step[flat == code] = np.hypot (dr * cellY, dc * cellX)
+    return step
+
+
+def flowLength (down, order, bounds, step):
+    """ Upstream and downstream flow length of every cell from one ordering of the grid.
+        Returns (downl, upl): downl is the length along the flow path to the outlet,
+        upl the longest flow path from the divide to the cell."""
+    levels = [order[bounds[k]:bounds[k + 1]] for k in range (len (bounds) - 1)]
+
+    upl = np.zeros (down.size, dtype = np.float64)
+    for cells in levels:
+        d = down[cells]
+        ok = d >= 0
+        np.maximum.at (upl, d[ok], upl[cells[ok]] + step[cells[ok]])
+
+    downl = np.zeros (down.size, dtype = np.float64)
+    for cells in reversed (levels):
+        d = down[cells]
+        ok = d >= 0
+        downl[cells[ok]] = downl[d[ok]] + step[cells[ok]]
+    return downl, upl
+
+
+def updLength (fdir, facc, lfpThreshold, cellX, cellY = None, mask = None):
+    """ Length of the longest flow path through every cell (upd = downstream + upstream
+        flow length) on the network of cells with facc > lfpThreshold.
+        Returns a 2D float array, nodata (-1) off the network."""
+    keep = facc > lfpThreshold
+    if mask is not None:
+        keep &= mask
+    down, valid = downIndex (fdir, keep)
+    order, bounds = flowLevels (down, valid)
+    downl, upl = flowLength (down, order, bounds, stepLength (fdir, cellX, cellY))
+    downl += upl
+    del upl
+    downl[~valid] = -1
+    return downl.reshape (fdir.shape)
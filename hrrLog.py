@@ -0,0 +1,223 @@
+"""
+Timing of the HRR setup steps and their sub steps.
+
+A step is timed with a with block or as a function decorator:
+
+    with hrrLog.step ('ZonalStatisticsAsTable slope'):
+        ...
+
+    @hrrLog.step ('buildChannels')
+    def buildChannels (hrr, n):
+        ...
+        hrrLog.count (len (hrr['GRIDCODE']))
+
+Steps nest (the path of a sub step is 'Step2/buildChannels'). Each finished step prints one line
+(elapsed time, rows or cells counted, peak memory of the process) and is kept in records, and,
+with a log file (configure () or the HRR_LOG environment variable, which processes started later
+inherit), is appended to it as one JSON line. Peak memory is the peak resident size of the process
+so far; peak_gain_mb is how much the step raised it. warning () records a warning of the open step
+the same way (printed, kept in records, one JSON line with a warning field); summary () skips it.
+
+report () prints a summary table by step: calls, total and largest time, items, rate and peak
+memory, of this process or of a log file (readLog) holding the lines of several processes.
+
+Hydro-Geo-Spatial Research Lab
+Website: http://www.northeastern.edu/beighley/home/
+"""
+
+import os, os.path, sys, json, time, timeit, functools
+from collections import OrderedDict
+
+logFile = os.environ.get ('HRR_LOG') or None # JSON lines file, None for none
+echo = True # print a line when a step ends
+records = [] # finished steps of this process
+openSteps = [] # steps being timed, outermost first
+
+
+def configure (path = None, echoSteps = True):
+    """ Sets the log file of this process and of the processes it starts """
+    global logFile, echo
+    logFile = path or None
+    echo = echoSteps
+    if logFile:
+        folder = os.path.dirname (os.path.abspath (logFile))
+        if not os.path.exists (folder):
+            os.makedirs (folder)
+        os.environ['HRR_LOG'] = logFile
+    else:
+        os.environ.pop ('HRR_LOG', None)
+
+
+def peakRSS ():
+    """ Peak resident memory of this process, MB (None where it cannot be read) """
+    try:
+        import resource
+        peak = resource.getrusage (resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1048576.0 if sys.platform == 'darwin' else peak / 1024.0
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process ().memory_info ().peak_wset / 1048576.0
+    except (ImportError, AttributeError):
+        return None
+
+
+def currentRSS ():
+    """ Resident memory of this process now, MB (None where it cannot be read) """
+    try:
+        with open ('/proc/self/statm') as handle:
+            return int (handle.read ().split ()[1]) * os.sysconf ('SC_PAGE_SIZE') / 1048576.0
+    except (IOError, OSError):
+        pass
+    try:
+        import psutil
+        return psutil.Process ().memory_info ().rss / 1048576.0
+    except ImportError:
+        return None
+
+
+def scriptName ():
+    """ Name of the running script (without the _run_ prefix of hrrPipeline copies) """
+    name = os.path.basename (sys.argv[0]) if sys.argv and sys.argv[0] else 'python'
+    return name[5:] if name.startswith ('_run_') else name
+
+
+class step (object):
+    """ Times a step: with block or function decorator. items: rows or cells processed (or set
+        later with count); unit: what items counts. """
+
+    def __init__ (self, name, items = None, unit = 'rows'):
+        self.name = name
+        self.items = items
+        self.unit = unit
+
+    def __call__ (self, func):
+        @functools.wraps (func)
+        def timed (*args, **kwargs):
+            with step (self.name, self.items, self.unit):
+                return func (*args, **kwargs)
+        return timed
+
+    def __enter__ (self):
+        openSteps.append (self)
+        self.path = '/'.join (s.name for s in openSteps)
+        self.startPeak = peakRSS ()
+        self.started = time.time ()
+        self.t0 = timeit.default_timer ()
+        return self
+
+    def __exit__ (self, excType, excValue, tb):
+        elapsed = timeit.default_timer () - self.t0
+        if openSteps and openSteps[-1] is self:
+            openSteps.pop ()
+        peak = peakRSS ()
+        rec = OrderedDict ()
+        rec['time'] = time.strftime ('%Y-%m-%dT%H:%M:%S', time.localtime (self.started))
+        rec['script'] = scriptName ()
+        rec['pid'] = os.getpid ()
+        rec['step'] = self.path
+        rec['elapsed_s'] = round (elapsed, 6)
+        rec['items'] = None if self.items is None else int (self.items)
+        rec['unit'] = self.unit
+        rec['rate'] = None if self.items is None else round (self.items / max (elapsed, 1e-9), 1)
+        rec['rss_mb'] = currentRSS ()
+        rec['peak_rss_mb'] = peak
+        rec['peak_gain_mb'] = None if peak is None or self.startPeak is None else peak - self.startPeak
+        rec['status'] = 'ok' if excType is None else excType.__name__
+        records.append (rec)
+        if logFile:
+            with open (logFile, 'a') as handle:
+                handle.write (json.dumps (rec) + '\n')
+        if echo:
+            print (line (rec, len (openSteps)))
+        return False
+
+
+def count (items, unit = None):
+    """ Sets the rows or cells processed by the innermost open step """
+    if openSteps:
+        openSteps[-1].items = items
+        if unit is not None:
+            openSteps[-1].unit = unit
+
+
+def warning (text):
+    """ Records a warning of the innermost open step: printed, kept and written to the log file """
+    rec = OrderedDict ()
+    rec['time'] = time.strftime ('%Y-%m-%dT%H:%M:%S')
+    rec['script'] = scriptName ()
+    rec['pid'] = os.getpid ()
+    rec['step'] = '/'.join (s.name for s in openSteps)
+    rec['warning'] = text
+    records.append (rec)
+    if logFile:
+        with open (logFile, 'a') as handle:
+            handle.write (json.dumps (rec) + '\n')
+    if echo:
+        print ('  ' * len (openSteps) + 'Warning: ' + text)
+
+
+def line (rec, depth = 0):
+    """ One line of text for a finished step """
+    text = '  ' * depth + rec['step'].split ('/')[-1] + ': %.2f s' % rec['elapsed_s']
+    if rec['items'] is not None:
+        text += ', %d %s' % (rec['items'], rec['unit'])
+    if rec['peak_rss_mb'] is not None:
+        text += ', peak %.0f MB' % rec['peak_rss_mb']
+    if rec['status'] != 'ok':
+        text += ' (' + rec['status'] + ')'
+    return text
+
+
+def readLog (path):
+    """ Records of a JSON lines log file """
+    out = []
+    with open (path, 'r') as handle:
+        for text in handle:
+            if text.strip ():
+                out.append (json.loads (text, object_pairs_hook = OrderedDict))
+    return out
+
+
+def summary (recs = None):
+    """ Rows of the summary table by (script, step), in order of first appearance: dictionaries
+        of script, step, calls, total_s, max_s, items, rate, peak_rss_mb """
+    recs = records if recs is None else recs
+    rows = OrderedDict ()
+    for rec in recs:
+        if 'warning' in rec:
+            continue
+        key = (rec['script'], rec['step'])
+        row = rows.get (key)
+        if row is None:
+            row = rows[key] = OrderedDict ([('script', rec['script']), ('step', rec['step']), ('calls', 0),
+                                            ('total_s', 0.0), ('max_s', 0.0), ('items', None), ('unit', rec['unit']),
+                                            ('rate', None), ('peak_rss_mb', None)])
+        row['calls'] += 1
+        row['total_s'] += rec['elapsed_s']
+        row['max_s'] = max (row['max_s'], rec['elapsed_s'])
+        if rec['items'] is not None:
+            row['items'] = (row['items'] or 0) + rec['items']
+        if rec['peak_rss_mb'] is not None:
+            row['peak_rss_mb'] = max (row['peak_rss_mb'] or 0.0, rec['peak_rss_mb'])
+    for row in rows.values ():
+        if row['items'] is not None and row['total_s'] > 0:
+            row['rate'] = row['items'] / row['total_s']
+    return list (rows.values ())
+
+
+def report (recs = None, handle = None):
+    """ Prints the summary table (to handle, default standard output) """
+    handle = sys.stdout if handle is None else handle
+    rows = summary (recs)
+    sw = max ([len (r['script']) for r in rows] + [6])
+    width = max ([len (r['step']) for r in rows] + [4])
+    handle.write ('%-*s %-*s %6s %10s %10s %20s %14s %9s\n' % (sw, 'script', width, 'step', 'calls', 'total s', 'max s',
+                                                               'items', 'per s', 'peak MB'))
+    for r in rows:
+        handle.write ('%-*s %-*s %6d %10.2f %10.2f %20s %14s %9s\n' % (
+            sw, r['script'], width, r['step'], r['calls'], r['total_s'], r['max_s'],
+            '' if r['items'] is None else '%d %s' % (r['items'], r['unit']),
+            '' if r['rate'] is None else '%.0f' % r['rate'],
+            '' if r['peak_rss_mb'] is None else '%.0f' % r['peak_rss_mb']))
@@ -0,0 +1,209 @@
+"""
+Sparse overlay weights between HRR units and the cells of a coarse grid (soil, met data).
+
+An overlay is a sparse zone x cell matrix in coordinate form: entry k says that zone row[k]
+covers weight[k] of its area with cell col[k] of the coarse grid. The weights of a zone sum to 1,
+so zone averages of any raster on the coarse grid are one weighted sum (bincount) over the
+entries, on the native resolution and without resampling the raster first.
+
+The soil overlay comes from the Watersheds label raster: every label cell is mapped once to the
+coarse cell under its center (hrrResample NEAREST map) and counts with its area (constant on a
+projected grid, cos (latitude) on a geographic grid).
+
+Overlays that take long to build (label rasters, polygon intersects for the met grids) are
+cached as .npz files keyed by a hash of both inputs; the least recently used entries are
+removed past a set number of entries.
+
+Hydro-Geo-Spatial Research Lab
+Website: http://www.northeastern.edu/beighley/home/
+"""
+
+import os, os.path, hashlib
+import numpy as np
+import hrrRaster, hrrResample
+
+
+def fromPairs (zoneIDs, cells, areas, numCells):
+    """ Overlay from (zone ID, cell, area) triples, repeated pairs are summed.
+        Returns dictionary: zones (IDs, sorted), row (position in zones), col (flat cell index),
+        weight (area fraction of the zone), area (zone area), numCells. """
+    zoneIDs = np.asarray (zoneIDs, dtype = np.int64)
+    cells = np.asarray (cells, dtype = np.int64)
+    zones, zpos = np.unique (zoneIDs, return_inverse = True)
+    keys, inv = np.unique (zpos * numCells + cells, return_inverse = True)
+    w = np.bincount (inv, weights = np.asarray (areas, dtype = np.float64), minlength = keys.size)
+    row = keys // numCells
+    col = keys % numCells
+    area = np.bincount (row, weights = w, minlength = zones.size)
+    return {'zones': zones,
+            'row': row,
+            'col': col,
+            'weight': w / area[row],
+            'area': area,
+            'numCells': int (numCells)
+            }
+
+
+def cellAreas (header, geographic = False):
+    """ Relative area of the cells of each row: 1 on a projected grid, cos (latitude) on a
+        geographic grid. Returns array of nrows. """
+    nrows = int (header['nrows'])
+    if not geographic:
+        return np.ones (nrows)
+    cs = header['cellsize']
+    top = header['yllcorner'] + nrows * cs
+    return np.cos (np.radians (top - (np.arange (nrows) + 0.5) * cs))
+
+
+def labelOverlay (labels, labelHdr, labelSR, srcHdr, srcSR, geographic = False, rowsPerChunk = 512):
+    """ Overlay of label raster zones (labels > 0, e.g. Watersheds = GRIDCODE) on a coarse grid.
+        Works on bands of label rows, each mapped to the coarse grid with hrrResample. """
+    nrows, ncols = labels.shape
+    rowArea = cellAreas (labelHdr, geographic)
+    numCells = int (srcHdr['nrows']) * int (srcHdr['ncols'])
+    cs = labelHdr['cellsize']
+    parts = []
+    for r0 in range (0, nrows, rowsPerChunk):
+        r1 = min (r0 + rowsPerChunk, nrows)
+        band = dict (labelHdr, nrows = r1 - r0,
+                     yllcorner = labelHdr['yllcorner'] + (nrows - r1) * cs)
+        idx = hrrResample.buildMap (srcHdr, srcSR, band, labelSR, 'NEAREST')['index'][0]
+        z = np.asarray (labels[r0:r1]).ravel ()
+        keep = (z > 0) & (idx >= 0)
+        area = np.repeat (rowArea[r0:r1], ncols)[keep]
+        part = fromPairs (z[keep], idx[keep], area, numCells)
+        parts.append ((part['zones'][part['row']], part['col'], part['weight'] * part['area'][part['row']]))
+    if not parts:
+        return fromPairs ([], [], [], numCells)
+    return fromPairs (np.concatenate ([p[0] for p in parts]), np.concatenate ([p[1] for p in parts]),
+                      np.concatenate ([p[2] for p in parts]), numCells)
+
+
+def zoneMeans (overlay, values, nodata = None):
+    """ Area weighted mean of a coarse grid raster (2D or flat) for every zone. Cells with nodata
+        are left out and the weights of the zone rescaled (as the DATA option); NaN for zones
+        without data. Returns array in the order of overlay['zones']. """
+    v = np.asarray (values, dtype = np.float64).ravel ()[overlay['col']]
+    ok = np.isfinite (v)
+    if nodata is not None:
+        ok &= v != nodata
+    n = overlay['zones'].size
+    wsum = np.bincount (overlay['row'][ok], weights = overlay['weight'][ok], minlength = n)
+    vsum = np.bincount (overlay['row'][ok], weights = overlay['weight'][ok] * v[ok], minlength = n)
+    out = np.full (n, np.nan)
+    has = wsum > 0
+    out[has] = vsum[has] / wsum[has]
+    return out
+
+
+def overlayKey (*parts):
+    """ Cache key from grid keys (hrrResample.gridKey) and arrays """
+    h = hashlib.sha1 ()
+    for part in parts:
+        if isinstance (part, np.ndarray):
+            h.update (str (part.dtype).encode ('utf-8'))
+            h.update (np.ascontiguousarray (part).tobytes ())
+        else:
+            h.update (str (part).encode ('utf-8'))
+        h.update (b'|')
+    return h.hexdigest ()
+
+
+def cacheLoad (cacheFolder, prefix, key):
+    """ Arrays cached under prefix_key.npz, None when missing. A hit marks the entry as recently
+        used (file time), for the LRU eviction in cacheSave. """
+    if not cacheFolder:
+        return None
+    path = os.path.join (cacheFolder, prefix + '_' + key + '.npz')
+    if not os.path.exists (path):
+        return None
+    os.utime (path, None)
+    data = np.load (path)
+    return dict ((k, data[k]) for k in data.files)
+
+
+def cacheSave (cacheFolder, prefix, key, arrays, maxEntries = None):
+    """ Saves arrays ({name: array}) as prefix_key.npz (uncompressed, loads in milliseconds).
+        With maxEntries, the least recently used prefix_*.npz entries beyond it are removed. """
+    if not cacheFolder:
+        return
+    if not os.path.exists (cacheFolder):
+        os.makedirs (cacheFolder)
+    path = os.path.join (cacheFolder, prefix + '_' + key + '.npz')
+    tmp = path[:-4] + '_tmp.npz'
+    np.savez (tmp, **arrays)
+    if os.path.exists (path):
+        os.remove (path)
+    os.rename (tmp, path)
+    if maxEntries is None:
+        return
+    entries = [os.path.join (cacheFolder, f) for f in os.listdir (cacheFolder)
+               if f.startswith (prefix + '_') and f.endswith ('.npz') and not f.endswith ('_tmp.npz')]
+    entries.sort (key = os.path.getmtime, reverse = True)
+    for old in entries[maxEntries:]:
+        if old != path:
+            os.remove (old)
+
+
+def cachedLabelOverlay (cacheFolder, labels, labelHdr, labelSR, srcHdr, srcSR, geographic = False,
+                        maxEntries = None):
+    """ labelOverlay, saved in cacheFolder under a hash of both grids and the labels """
+    key = overlayKey (hrrResample.gridKey (labelHdr, labelSR), hrrResample.gridKey (srcHdr, srcSR),
+                      geographic, labels)
+    overlay = cacheLoad (cacheFolder, 'overlay', key)
+    if overlay is not None:
+        overlay['numCells'] = int (overlay['numCells'])
+        return overlay
+    overlay = labelOverlay (labels, labelHdr, labelSR, srcHdr, srcSR, geographic)
+    cacheSave (cacheFolder, 'overlay', key, overlay, maxEntries)
+    return overlay
+
+
+def featureHash (fc, fields = (), h = None):
+    """ SHA-1 of the geometries (WKB) and the listed fields of a feature class or table, in
+        cursor order, with arcpy. Pass h to hash several inputs together. """
+    import arcpy
+    if h is None:
+        h = hashlib.sha1 ()
+    desc = arcpy.Describe (fc)
+    cols = list (fields)
+    if getattr (desc, 'shapeType', None):
+        cols = ['SHAPE@WKB'] + cols
+        h.update (hrrResample.srsText (desc.spatialReference).encode ('utf-8'))
+    with arcpy.da.SearchCursor (fc, cols) as cursor:
+        for row in cursor:
+            for v in row:
+                h.update (v if isinstance (v, (bytes, bytearray)) else repr (v).encode ('utf-8'))
+            h.update (b';')
+    return h
+
+
+def zoneRasterMeans (zoneRaster, valueRasters, zoneField = 'GRIDCODE', cacheFolder = None, defaultSR = 4326):
+    """ Area weighted zone means of native resolution rasters (ESRI ASCII, tiled store or arcpy)
+        over a label raster (e.g. Watersheds). valueRasters: {name: path}; rasters without a
+        coordinate system get defaultSR. Rasters on one grid share one overlay.
+        Returns structured array keyed by zoneField with one field per name. """
+    labels, lHdr = hrrRaster.readRaster (zoneRaster, np.int64)
+    labels[~hrrRaster.nodataMask (labels, lHdr)] = 0
+    lSR = lHdr.get ('spatialReference')
+    geographic = getattr (lSR, 'type', '') == 'Geographic'
+
+    names = sorted (valueRasters.keys ())
+    zones = np.unique (labels[labels > 0])
+    table = np.zeros (zones.size, dtype = [(zoneField, np.int32)] + [(n, np.float64) for n in names])
+    table[zoneField] = zones
+    overlays = {}
+    for name in names:
+        hdr = hrrRaster.readHeader (valueRasters[name])
+        sr = hdr.get ('spatialReference')
+        if sr is None or getattr (sr, 'name', '') == 'Unknown':
+            sr = defaultSR
+        key = hrrResample.gridKey (hdr, sr)
+        if key not in overlays:
+            overlays[key] = cachedLabelOverlay (cacheFolder, labels, lHdr, lSR, hdr, sr, geographic)
+        overlay = overlays[key]
+        values, vHdr = hrrRaster.readRaster (valueRasters[name])
+        col = np.full (zones.size, np.nan)
+        col[np.searchsorted (zones, overlay['zones'])] = zoneMeans (overlay, values, vHdr.get ('NODATA_value'))
+        table[name] = col
+    return table
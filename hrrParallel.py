@@ -0,0 +1,77 @@
+"""
+Per-watershed parallel execution of the HRR table stages.
+
+Units in different watersheds (WID) never interact, so a table can be cut into batches of whole
+watersheds and each batch processed on its own in a process pool. Batches hold consecutive WIDs
+in WID order and keep the table order of their rows, so a batch sees its units exactly as a serial
+run would. Each job gets the number of units and watersheds before its batch (idOffset,
+widOffset) to shift its HRR IDs and WIDs, and the merged result is identical to a serial run.
+
+The stage function must be defined at module level (it is pickled to the workers). Scripts that
+use this must only call main () under if __name__ == '__main__', because on Windows each worker
+imports the script again.
+
+Hydro-Geo-Spatial Research Lab
+Website: http://www.northeastern.edu/beighley/home/
+"""
+
+from collections import OrderedDict
+import multiprocessing
+import numpy as np
+
+
+def widBatches (wid, numBatches):
+    """ Splits rows into batches of consecutive watersheds of about equal size.
+        Returns list of (rows, idOffset, widOffset); rows in table order. """
+    wid = np.asarray (wid)
+    order = np.argsort (wid, kind = 'mergesort')
+    wids, first = np.unique (wid[order], return_index = True)
+    bounds = np.append (first, wid.size) # rows of wids[k] are order[bounds[k]:bounds[k+1]]
+
+    # cut at watershed boundaries closest to equal shares of the rows
+    numBatches = max (1, min (numBatches, wids.size))
+    targets = np.arange (1, numBatches) * wid.size / float (numBatches)
+    cuts = np.unique (np.concatenate ([[0], np.searchsorted (bounds, targets), [wids.size]]))
+
+    batches = []
+    for b in range (cuts.size - 1):
+        k0, k1 = cuts[b], cuts[b + 1]
+        rows = np.sort (order[bounds[k0]:bounds[k1]])
+        batches.append ((rows, int (bounds[k0]), int (k0)))
+    return batches
+
+
+def subTable (table, rows):
+    """ Rows of a column table (OrderedDict of arrays) """
+    return OrderedDict ((name, col[rows]) for name, col in table.items ())
+
+
+def runBatches (func, jobs, numProcs):
+    """ Runs func on every job, in a process pool when numProcs > 1. Results keep job order. """
+    if numProcs <= 1 or len (jobs) <= 1:
+        return [func (job) for job in jobs]
+    pool = multiprocessing.Pool (numProcs)
+    try:
+        return pool.map (func, jobs, chunksize = 1)
+    finally:
+        pool.close ()
+        pool.join ()
+
+
+def runByWatershed (func, table, wid, numProcs, batchesPerProc = 4):
+    """ Runs func ((subTable, idOffset, widOffset)) -> subTable on batches of watersheds and
+        merges the returned columns back into one table in the original row order. """
+    if numProcs is None or numProcs < 1:
+        numProcs = multiprocessing.cpu_count ()
+    batches = widBatches (wid, numProcs * batchesPerProc)
+    jobs = [(subTable (table, rows), idOffset, widOffset) for rows, idOffset, widOffset in batches]
+    results = runBatches (func, jobs, numProcs)
+
+    n = np.asarray (wid).size
+    merged = OrderedDict ()
+    for (rows, idOffset, widOffset), result in zip (batches, results):
+        for name, col in result.items ():
+            if name not in merged:
+                merged[name] = np.zeros (n, dtype = col.dtype)
+            merged[name][rows] = col
+    return merged
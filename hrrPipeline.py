@@ -0,0 +1,212 @@
+"""
+Incremental runner for the HRR setup steps (RunSteps.py).
+
+Every stage is one Step script run with its input parameters replaced, and declares the files it
+reads (inputs) and the files it writes or updates in place (outputs). Its key is a SHA-1 of the
+script source, the parameters, the content of the inputs no stage makes, and the keys of the
+earlier stages that write the other inputs (and of the stages in needs). A stage is skipped when
+its key is the one of its last successful run and its outputs are all there, so a change reruns
+the stages that depend on it and nothing else.
+
+Keys of stages and file hashes are kept in a JSON state file. Files are hashed again only when
+their size or modification time changed. ESRI grids (folders) and shapefiles (with their side
+files) are hashed as a whole.
+
+Each stage run is timed (hrrLog.py) and the scripts time their own sub steps; with a log file
+set (hrrLog.configure) all of them go to it as JSON lines.
+
+Scripts run in their own process, from a copy next to the script in which each overridden
+parameter is assigned again right after its own assignment, so parameters computed from it (e.g.
+cacheFolder from outputSpace) follow, and process pools in the script see the same values.
+
+Hydro-Geo-Spatial Research Lab
+Website: http://www.northeastern.edu/beighley/home/
+"""
+
+import os, os.path, sys, ast, glob, json, hashlib, subprocess
+import hrrLog
+
+shapeExtensions = ('.shp', '.shx', '.dbf', '.prj', '.sbn', '.sbx', '.cpg', '.shp.xml')
+
+
+def stage (name, script, params = None, inputs = (), outputs = (), needs = ()):
+    """ Stage declaration. params: {script parameter: value}; inputs, outputs: paths;
+        needs: names of earlier stages the stage depends on without reading their outputs
+        (e.g. a table another stage updates in place) """
+    return {'name': name,
+            'script': script,
+            'params': dict (params or {}),
+            'inputs': list (inputs),
+            'outputs': list (outputs),
+            'needs': list (needs)
+            }
+
+
+def pathFiles (path):
+    """ Files holding a dataset: the file, all files of a folder (ESRI grid, tiled store) or a
+        shapefile and its side files. Sorted, empty when missing. """
+    if os.path.isdir (path):
+        files = []
+        for root, dirs, names in os.walk (path):
+            dirs.sort ()
+            files.extend (os.path.join (root, n) for n in sorted (names))
+        return files
+    if path.lower ().endswith ('.shp'):
+        stem = path[:-4]
+        return sorted (f for f in glob.glob (stem + '.*') if f[len (stem):].lower () in shapeExtensions)
+    return [path] if os.path.isfile (path) else []
+
+
+def fileHash (path, fileCache):
+    """ SHA-1 of a file's bytes, reused from fileCache ({path: [size, mtime, hash]}) while the
+        size and modification time are unchanged """
+    st = os.stat (path)
+    entry = fileCache.get (path)
+    if entry and entry[0] == st.st_size and entry[1] == st.st_mtime:
+        return entry[2]
+    h = hashlib.sha1 ()
+    with open (path, 'rb') as handle:
+        for chunk in iter (lambda: handle.read (1 << 20), b''):
+            h.update (chunk)
+    fileCache[path] = [st.st_size, st.st_mtime, h.hexdigest ()]
+    return h.hexdigest ()
+
+
+def pathHash (path, fileCache):
+    """ SHA-1 of a dataset (see pathFiles), names relative to it included """
+    h = hashlib.sha1 ()
+    files = pathFiles (path)
+    if not files:
+        h.update (b'missing')
+    for f in files:
+        h.update (os.path.relpath (f, os.path.dirname (path)).replace ('\\', '/').encode ('utf-8'))
+        h.update (fileHash (f, fileCache).encode ('ascii'))
+    return h.hexdigest ()
+
+
+def samePath (a, b):
+    return os.path.normcase (os.path.abspath (a)) == os.path.normcase (os.path.abspath (b))
+
+
+def stageKey (st, done, fileCache):
+    """ Key of a stage given the stages before it (done: list of (stage, key)) """
+    h = hashlib.sha1 ()
+    with open (st['script'], 'rb') as handle:
+        h.update (handle.read ())
+    h.update (repr (sorted (st['params'].items ())).encode ('utf-8'))
+    for path in st['inputs']:
+        makers = [key for prev, key in done if any (samePath (path, o) for o in prev['outputs'])]
+        h.update (b'|')
+        if makers:
+            h.update (' '.join (makers).encode ('ascii'))
+        else:
+            h.update (pathHash (path, fileCache).encode ('ascii'))
+    for name in st['needs']:
+        keys = [key for prev, key in done if prev['name'] == name]
+        if not keys:
+            raise ValueError ('Stage ' + st['name'] + ' needs ' + name + ', which is not before it')
+        h.update (b'|' + keys[0].encode ('ascii'))
+    return h.hexdigest ()
+
+
+def overrideSource (source, params):
+    """ Script source with each parameter assigned again (repr of its value) right after its
+        top level assignment """
+    newline = '\r\n' if '\r\n' in source else '\n'
+    lines = source.splitlines (True)
+    body = ast.parse (source.replace ('\r\n', '\n')).body
+    inserts = {}
+    found = set ()
+    for i, node in enumerate (body):
+        if not isinstance (node, ast.Assign):
+            continue
+        names = [t.id for t in node.targets if isinstance (t, ast.Name) and t.id in params]
+        if not names:
+            continue
+        found.update (names)
+        if i + 1 < len (body):
+            nxt = body[i + 1]
+            line = min ([nxt.lineno] + [d.lineno for d in getattr (nxt, 'decorator_list', [])]) - 1
+        else:
+            line = len (lines)
+        inserts.setdefault (line, []).extend (names)
+    missing = sorted (set (params) - found)
+    if missing:
+        raise ValueError ('Parameters not in the script: ' + ', '.join (missing))
+
+    out = []
+    for i in range (len (lines) + 1):
+        for name in inserts.get (i, []):
+            value = params[name]
+            if ast.literal_eval (repr (value)) != value:
+                raise ValueError ('Parameter ' + name + ' is not a literal: ' + repr (value))
+            if out and not out[-1].endswith ('\n'):
+                out[-1] += newline
+            out.append (name + ' = ' + repr (value) + ' # RunSteps' + newline)
+        if i < len (lines):
+            out.append (lines[i])
+    return ''.join (out)
+
+
+def runScript (script, params):
+    """ Runs a Step script with its parameters replaced, in a new process. Returns exit code. """
+    folder, name = os.path.split (os.path.abspath (script))
+    with open (script, 'r') as handle:
+        source = handle.read ()
+    copy = os.path.join (folder, '_run_' + name)
+    with open (copy, 'w') as handle:
+        handle.write (overrideSource (source, params))
+    try:
+        return subprocess.call ([sys.executable, copy], cwd = folder)
+    finally:
+        os.remove (copy)
+
+
+def loadState (stateFile):
+    if stateFile and os.path.exists (stateFile):
+        with open (stateFile, 'r') as handle:
+            return json.load (handle)
+    return {'stages': {}, 'files': {}}
+
+
+def saveState (stateFile, state):
+    if not stateFile:
+        return
+    tmp = stateFile + '.tmp'
+    with open (tmp, 'w') as handle:
+        json.dump (state, handle, indent = 1, sort_keys = True)
+    if os.path.exists (stateFile):
+        os.remove (stateFile)
+    os.rename (tmp, stateFile)
+
+
+def runStages (stages, stateFile, force = (), dryRun = False, runner = runScript):
+    """ Runs the stages in order, skipping those whose key and outputs are unchanged since their
+        last successful run. force: names of stages to run anyway. dryRun: only report.
+        Returns the names of the stages run (or to run). Stops at the first failing stage. """
+    state = loadState (stateFile)
+    fileCache = state.setdefault ('files', {})
+    done = []
+    ran = []
+    for st in stages:
+        key = stageKey (st, done, fileCache)
+        done.append ((st, key))
+        current = state['stages'].get (st['name']) == key and all (pathFiles (o) for o in st['outputs'])
+        if current and st['name'] not in force:
+            print ('skip  ' + st['name'] + ' (unchanged)')
+            continue
+        ran.append (st['name'])
+        if dryRun:
+            print ('run   ' + st['name'])
+            continue
+        print ('run   ' + st['name'] + ': ' + st['script'])
+        state['stages'].pop (st['name'], None)
+        saveState (stateFile, state)
+        with hrrLog.step (st['name']):
+            code = runner (st['script'], st['params'])
+        if code:
+            saveState (stateFile, state)
+            raise RuntimeError ('Stage ' + st['name'] + ' failed (exit code ' + str (code) + ')')
+        state['stages'][st['name']] = key
+        saveState (stateFile, state)
+    return ran
@@ -0,0 +1,358 @@
+"""
+Raster input/output helpers for the HRR setup engines.
+
+Rasters are handled as NumPy arrays plus a small header dictionary that follows the ESRI ASCII grid
+keys (ncols, nrows, xllcorner, yllcorner, cellsize, NODATA_value). ESRI ASCII grids (*.asc) are read
+and written without arcpy, so the engines can run on Linux nodes. Any other path is treated as an
+arcpy raster and needs arcpy.
+
+Grids too large for memory go into a tiled store: a folder with tiles.json and one .npy file per
+tile, opened memory-mapped. Blocks are read tile by tile with an optional halo of neighbour cells,
+so peak memory depends on the tile size and not on the grid size. The slope pass of step 3
+(hrrSlope.zonalSlopeTiles) and the zonal passes of steps 4.2 and 4.3 (hrrZonal.zonalStatsTiles)
+read stores this way. Flow routing (step 1b, hrrFlow) orders the cells of the whole grid at once,
+so it still holds fdir and facc in memory: readRaster loads a store whole.
+
+Hydro-Geo-Spatial Research Lab
+Website: http://www.northeastern.edu/beighley/home/
+"""
+
+import os, os.path, json, itertools
+import numpy as np
+
+headerKeys = ['ncols', 'nrows', 'xllcorner', 'yllcorner', 'cellsize', 'NODATA_value']
+
+
+def isAscii (path):
+    """ True if path is an ESRI ASCII grid """
+    return os.path.splitext(path)[1].lower() in ('.asc', '.txt')
+
+
+def isTiles (path):
+    """ True if path is a tiled store folder (createTiles) """
+    return os.path.isfile (os.path.join (path, 'tiles.json'))
+
+
+def readAsciiHeader (path):
+    """ Reads the six header lines of an ESRI ASCII grid, returns header dictionary """
+    header = {}
+    with open (path, 'r') as handle:
+        for i in range (6):
+            key, value = handle.readline().split()[:2]
+            key = key.lower()
+            if key in ('ncols', 'nrows'):
+                header[key] = int (value)
+            elif key == 'nodata_value':
+                header['NODATA_value'] = float (value)
+            elif key == 'xllcenter':
+                header['xllcorner'] = float (value)
+                header['xllcenter'] = True
+            elif key == 'yllcenter':
+                header['yllcorner'] = float (value)
+            else:
+                header[key] = float (value)
+    if header.pop ('xllcenter', False):
+        #Header given on cell centers, move to lower left corner
+        header['xllcorner'] -= header['cellsize'] / 2.0
+        header['yllcorner'] -= header['cellsize'] / 2.0
+    header.setdefault ('NODATA_value', -9999.0)
+    return header
+
+
+def readAscii (path, dtype = np.float64):
+    """ Reads an ESRI ASCII grid, returns (array, header) """
+    header = readAsciiHeader (path)
+    arr = np.loadtxt (path, dtype = dtype, skiprows = 6, ndmin = 2)
+    arr = arr.reshape (header['nrows'], header['ncols'])
+    return arr, header
+
+
+def writeAscii (path, arr, header, fmt = None):
+    """ Writes array to an ESRI ASCII grid """
+    if fmt is None:
+        fmt = '%d' if np.issubdtype (arr.dtype, np.integer) else '%.6g'
+    with open (path, 'w') as handle:
+        handle.write ('ncols         %d\n' % arr.shape[1])
+        handle.write ('nrows         %d\n' % arr.shape[0])
+        handle.write ('xllcorner     %r\n' % float (header['xllcorner']))
+        handle.write ('yllcorner     %r\n' % float (header['yllcorner']))
+        handle.write ('cellsize      %r\n' % float (header['cellsize']))
+        nodata = header.get ('NODATA_value', -9999)
+        if np.issubdtype (arr.dtype, np.integer):
+            handle.write ('NODATA_value  %d\n' % int (nodata))
+        else:
+            handle.write ('NODATA_value  %r\n' % float (nodata))
+        np.savetxt (handle, arr, fmt = fmt, delimiter = ' ')
+
+
+def readRaster (path, dtype = np.float64):
+    """ Reads ESRI ASCII grid, tiled store, or any arcpy raster, to (array, header).
+        A tiled store is loaded whole: use readBlock / iterBlocks to stay out of core. """
+    if isAscii (path):
+        return readAscii (path, dtype)
+    if isTiles (path):
+        store = openTiles (path)
+        return tilesToArray (store).astype (dtype), dict (store['header'])
+
+    import arcpy
+    desc = arcpy.Describe (path)
+    nodata = desc.noDataValue if desc.noDataValue is not None else -9999
+    arr = arcpy.RasterToNumPyArray (path, nodata_to_value = nodata).astype (dtype)
+    header = {'ncols': arr.shape[1],
+              'nrows': arr.shape[0],
+              'xllcorner': desc.extent.XMin,
+              'yllcorner': desc.extent.YMin,
+              'cellsize': desc.meanCellWidth,
+              'NODATA_value': nodata,
+              'spatialReference': desc.spatialReference
+              }
+    return arr, header
+
+
+def readHeader (path):
+    """ Header of an ESRI ASCII grid, tiled store or arcpy raster, without reading the cells """
+    if isAscii (path):
+        return readAsciiHeader (path)
+    if isTiles (path):
+        return dict (openTiles (path)['header'])
+
+    import arcpy
+    desc = arcpy.Describe (path)
+    return {'ncols': desc.width,
+            'nrows': desc.height,
+            'xllcorner': desc.extent.XMin,
+            'yllcorner': desc.extent.YMin,
+            'cellsize': desc.meanCellWidth,
+            'NODATA_value': desc.noDataValue if desc.noDataValue is not None else -9999,
+            'spatialReference': desc.spatialReference
+            }
+
+
+def writeRaster (path, arr, header):
+    """ Writes array to ESRI ASCII grid, or with arcpy to any other raster path """
+    if isAscii (path):
+        writeAscii (path, arr, header)
+        return
+
+    import arcpy
+    ll = arcpy.Point (header['xllcorner'], header['yllcorner'])
+    ras = arcpy.NumPyArrayToRaster (arr, ll, header['cellsize'], header['cellsize'],
+                                    header.get ('NODATA_value'))
+    ras.save (path)
+    if header.get ('spatialReference') is not None:
+        arcpy.DefineProjection_management (path, header['spatialReference'])
+
+
+def sameGrid (header, other, tol = 1e-6):
+    """ True if two headers describe the same grid: size, lower left corner and cell size (corners
+        within tol of a cell) """
+    if int (header['ncols']) != int (other['ncols']) or int (header['nrows']) != int (other['nrows']):
+        return False
+    cs = float (header['cellsize'])
+    return (abs (float (other['cellsize']) - cs) <= tol * cs and
+            abs (float (other['xllcorner']) - float (header['xllcorner'])) <= tol * cs and
+            abs (float (other['yllcorner']) - float (header['yllcorner'])) <= tol * cs)
+
+
+def nodataMask (arr, header):
+    """ True where array holds data """
+    nodata = header.get ('NODATA_value')
+    if nodata is None:
+        return np.isfinite (arr)
+    return (arr != nodata) & np.isfinite (arr)
+
+
+#####***** Tiled raster store *****#####
+
+def tileName (ti, tj):
+    return 'r%04d_c%04d.npy' % (ti, tj)
+
+
+def cleanHeader (header):
+    """ Header values that can be saved to tiles.json """
+    return dict ((k, header[k]) for k in headerKeys if k in header)
+
+
+def createTiles (path, header, dtype = np.float32, tileSize = 2048):
+    """ Creates an empty tiled store (all nodata) for a grid described by header """
+    if not os.path.exists (path):
+        os.makedirs (path)
+    store = {'path': path,
+             'nrows': int (header['nrows']),
+             'ncols': int (header['ncols']),
+             'tileSize': int (tileSize),
+             'dtype': np.dtype (dtype).str,
+             'header': cleanHeader (header),
+             'mode': 'r+'
+             }
+    with open (os.path.join (path, 'tiles.json'), 'w') as handle:
+        json.dump (dict ((k, v) for k, v in store.items () if k not in ('path', 'mode')), handle, indent = 1)
+
+    nodata = store['header'].get ('NODATA_value', 0)
+    nti, ntj = tileCount (store)
+    for ti in range (nti):
+        for tj in range (ntj):
+            r0, r1, c0, c1 = tileWindow (store, ti, tj)
+            mm = np.lib.format.open_memmap (os.path.join (path, tileName (ti, tj)), mode = 'w+',
+                                            dtype = store['dtype'], shape = (r1 - r0, c1 - c0))
+            mm[:] = nodata
+            del mm
+    return store
+
+
+def openTiles (path, mode = 'r'):
+    """ Opens a tiled store; mode 'r' read only, 'r+' to write blocks """
+    with open (os.path.join (path, 'tiles.json'), 'r') as handle:
+        store = json.load (handle)
+    store['path'] = path
+    store['mode'] = mode
+    return store
+
+
+def tileCount (store):
+    """ Number of tile rows and tile columns """
+    ts = store['tileSize']
+    return (store['nrows'] + ts - 1) // ts, (store['ncols'] + ts - 1) // ts
+
+
+def tileWindow (store, ti, tj):
+    """ Grid rows and columns (r0, r1, c0, c1) covered by a tile """
+    ts = store['tileSize']
+    return (ti * ts, min ((ti + 1) * ts, store['nrows']),
+            tj * ts, min ((tj + 1) * ts, store['ncols']))
+
+
+def tile (store, ti, tj):
+    """ Memory-mapped tile """
+    return np.load (os.path.join (store['path'], tileName (ti, tj)), mmap_mode = store['mode'])
+
+
+def readWindow (store, r0, r1, c0, c1):
+    """ Reads grid rows r0:r1 and columns c0:c1; cells outside the grid are nodata """
+    nodata = store['header'].get ('NODATA_value', 0)
+    out = np.empty ((r1 - r0, c1 - c0), dtype = store['dtype'])
+    out[:] = nodata
+    ts = store['tileSize']
+    nti, ntj = tileCount (store)
+    for ti in range (max (r0 // ts, 0), min ((r1 - 1) // ts + 1, nti)):
+        for tj in range (max (c0 // ts, 0), min ((c1 - 1) // ts + 1, ntj)):
+            tr0, tr1, tc0, tc1 = tileWindow (store, ti, tj)
+            a0, a1 = max (r0, tr0), min (r1, tr1)
+            b0, b1 = max (c0, tc0), min (c1, tc1)
+            if a0 >= a1 or b0 >= b1:
+                continue
+            mm = tile (store, ti, tj)
+            out[a0 - r0:a1 - r0, b0 - c0:b1 - c0] = mm[a0 - tr0:a1 - tr0, b0 - tc0:b1 - tc0]
+            del mm
+    return out
+
+
+def readBlock (store, ti, tj, halo = 0):
+    """ Reads a tile plus halo cells from the neighbour tiles """
+    r0, r1, c0, c1 = tileWindow (store, ti, tj)
+    if halo == 0:
+        return np.array (tile (store, ti, tj))
+    return readWindow (store, r0 - halo, r1 + halo, c0 - halo, c1 + halo)
+
+
+def writeBlock (store, ti, tj, block, halo = 0):
+    """ Writes a tile; a block read with a halo is trimmed first """
+    if halo:
+        block = block[halo:-halo, halo:-halo]
+    mm = tile (store, ti, tj)
+    mm[:] = block
+    mm.flush ()
+    del mm
+
+
+def iterBlocks (store, halo = 0):
+    """ Yields (ti, tj, block) for every tile, row by row. Blocks carry halo cells on each side. """
+    nti, ntj = tileCount (store)
+    for ti in range (nti):
+        for tj in range (ntj):
+            yield ti, tj, readBlock (store, ti, tj, halo)
+
+
+def iterRows (store):
+    """ Yields grid rows top to bottom, one band of tiles in memory at a time """
+    nti, ntj = tileCount (store)
+    for ti in range (nti):
+        band = readWindow (store, tileWindow (store, ti, 0)[0], tileWindow (store, ti, 0)[1],
+                           0, store['ncols'])
+        for row in band:
+            yield row
+
+
+def tileHeader (store, ti, tj, halo = 0):
+    """ Raster header of a block, halo included """
+    r0, r1, c0, c1 = tileWindow (store, ti, tj)
+    h = dict (store['header'])
+    cs = h['cellsize']
+    h['ncols'] = c1 - c0 + 2 * halo
+    h['nrows'] = r1 - r0 + 2 * halo
+    h['xllcorner'] = h['xllcorner'] + (c0 - halo) * cs
+    h['yllcorner'] = h['yllcorner'] + (store['nrows'] - r1 - halo) * cs
+    return h
+
+
+def asciiToTiles (ascPath, path, dtype = np.float32, tileSize = 2048):
+    """ Streams an ESRI ASCII grid into a tiled store, one band of tile rows at a time """
+    header = readAsciiHeader (ascPath)
+    store = createTiles (path, header, dtype, tileSize)
+    nti, ntj = tileCount (store)
+    with open (ascPath, 'r') as handle:
+        for i in range (6):
+            handle.readline ()
+        for ti in range (nti):
+            r0, r1 = tileWindow (store, ti, 0)[:2]
+            band = np.loadtxt (itertools.islice (handle, r1 - r0), dtype = dtype, ndmin = 2)
+            for tj in range (ntj):
+                c0, c1 = tileWindow (store, ti, tj)[2:]
+                writeBlock (store, ti, tj, band[:, c0:c1])
+    return store
+
+
+def rasterToTiles (rasPath, path, dtype = np.float32, tileSize = 2048):
+    """ Copies an ESRI ASCII grid or arcpy raster into a tiled store without loading the whole grid """
+    if isAscii (rasPath):
+        return asciiToTiles (rasPath, path, dtype, tileSize)
+
+    import arcpy
+    desc = arcpy.Describe (rasPath)
+    nodata = desc.noDataValue if desc.noDataValue is not None else -9999
+    header = {'ncols': desc.width,
+              'nrows': desc.height,
+              'xllcorner': desc.extent.XMin,
+              'yllcorner': desc.extent.YMin,
+              'cellsize': desc.meanCellWidth,
+              'NODATA_value': nodata
+              }
+    store = createTiles (path, header, dtype, tileSize)
+    cs = desc.meanCellWidth
+    for ti, tj, block in iterBlocks (store):
+        r0, r1, c0, c1 = tileWindow (store, ti, tj)
+        ll = arcpy.Point (desc.extent.XMin + c0 * cs, desc.extent.YMin + (desc.height - r1) * cs)
+        arr = arcpy.RasterToNumPyArray (rasPath, ll, c1 - c0, r1 - r0, nodata)
+        writeBlock (store, ti, tj, arr.astype (dtype))
+    return store
+
+
+def tilesToAscii (store, ascPath, fmt = None):
+    """ Streams a tiled store out to an ESRI ASCII grid """
+    if fmt is None:
+        fmt = '%d' if np.issubdtype (np.dtype (store['dtype']), np.integer) else '%.6g'
+    header = dict (store['header'])
+    with open (ascPath, 'w') as handle:
+        handle.write ('ncols         %d\n' % store['ncols'])
+        handle.write ('nrows         %d\n' % store['nrows'])
+        handle.write ('xllcorner     %r\n' % float (header['xllcorner']))
+        handle.write ('yllcorner     %r\n' % float (header['yllcorner']))
+        handle.write ('cellsize      %r\n' % float (header['cellsize']))
+        handle.write ('NODATA_value  %s\n' % (fmt % header.get ('NODATA_value', -9999)))
+        for row in iterRows (store):
+            np.savetxt (handle, row[np.newaxis, :], fmt = fmt, delimiter = ' ')
+
+
+def tilesToArray (store):
+    """ Whole grid in memory, for grids that fit """
+    return readWindow (store, 0, store['nrows'], 0, store['ncols'])
@@ -0,0 +1,237 @@
+"""
+Resampling engine for HRR step 4.1 (replaces one ProjectRaster call per soil / land cover raster).
+
+Every cell of the target grid (the fdir grid) is mapped once to the source grid: its center is
+projected to the source coordinate system and turned into source cell indices and weights (one
+index for NEAREST, four indices and bilinear weights for BILINEAR). The map is saved in a cache
+folder under a hash of the source grid, the target grid and the method, so later runs and every
+other raster on the same source grid reuse it. Applying the map is one gather per raster block,
+and rasters on the same source grid are gathered together.
+
+Coordinates are projected with pyproj when it is installed, else with arcpy (Project).
+Both grids need a coordinate system: a missing one is an error, never taken as the other's.
+Bilinear weights of nodata source cells are dropped and the others rescaled; a target cell is
+nodata when all its source cells are nodata or it falls outside the source grid.
+
+Hydro-Geo-Spatial Research Lab
+Website: http://www.northeastern.edu/beighley/home/
+"""
+
+import os, os.path, hashlib
+import numpy as np
+import hrrRaster
+
+methods = ['NEAREST', 'BILINEAR']
+
+
+def srsText (sr):
+    """ Text form of a spatial reference: EPSG code (int or 'EPSG:4326'), WKT, or arcpy object;
+        '' for none or an Unknown arcpy one """
+    if sr is None:
+        return ''
+    if isinstance (sr, int):
+        return 'EPSG:%d' % sr
+    if hasattr (sr, 'factoryCode'):
+        if getattr (sr, 'name', '') == 'Unknown':
+            return ''
+        if sr.factoryCode:
+            return 'EPSG:%d' % sr.factoryCode
+        return sr.exportToString ().split (';')[0]
+    return str (sr)
+
+
+def gridKey (header, sr):
+    """ Text that identifies a grid: size, corner, cell size and coordinate system """
+    return '%d,%d,%r,%r,%r,%s' % (header['ncols'], header['nrows'], float (header['xllcorner']),
+                                  float (header['yllcorner']), float (header['cellsize']), srsText (sr))
+
+
+def mapKey (srcHdr, srcSR, dstHdr, dstSR, method):
+    """ Cache key of a resampling map """
+    text = gridKey (srcHdr, srcSR) + '|' + gridKey (dstHdr, dstSR) + '|' + method.upper ()
+    return hashlib.sha1 (text.encode ('utf-8')).hexdigest ()
+
+
+def projectPoints (x, y, fromSR, toSR):
+    """ Projects point coordinates between coordinate systems, returns (x, y).
+        Raises ValueError when either coordinate system is missing. """
+    fromText, toText = srsText (fromSR), srsText (toSR)
+    if not fromText or not toText:
+        raise ValueError ('Missing coordinate system (%s to %s): define it (.prj) or pass defaultSR'
+                          % (fromText or 'none', toText or 'none'))
+    if fromText == toText:
+        return x, y
+    try:
+        import pyproj
+    except ImportError:
+        pyproj = None
+    if pyproj is not None:
+        tr = pyproj.Transformer.from_crs (pyproj.CRS.from_user_input (fromText),
+                                          pyproj.CRS.from_user_input (toText), always_xy = True)
+        return tr.transform (x, y)
+
+    import arcpy
+    def spatialRef (sr):
+        if hasattr (sr, 'factoryCode'):
+            return sr
+        if isinstance (sr, int):
+            return arcpy.SpatialReference (sr)
+        ref = arcpy.SpatialReference ()
+        ref.loadFromString (srsText (sr))
+        return ref
+    pts = np.zeros (x.size, dtype = [('id', np.int32), ('x', np.float64), ('y', np.float64)])
+    pts['id'] = np.arange (x.size)
+    pts['x'] = x
+    pts['y'] = y
+    tmp = 'in_memory\\rspts'
+    tmpP = 'in_memory\\rsptsp'
+    for t in (tmp, tmpP):
+        if arcpy.Exists (t):
+            arcpy.Delete_management (t)
+    arcpy.da.NumPyArrayToFeatureClass (pts, tmp, ['x', 'y'], spatialRef (fromSR))
+    arcpy.Project_management (tmp, tmpP, spatialRef (toSR))
+    out = arcpy.da.FeatureClassToNumPyArray (tmpP, ['id', 'SHAPE@X', 'SHAPE@Y'])
+    out = out[np.argsort (out['id'])]
+    for t in (tmp, tmpP):
+        arcpy.Delete_management (t)
+    return out['SHAPE@X'], out['SHAPE@Y']
+
+
+def buildMap (srcHdr, srcSR, dstHdr, dstSR, method = 'BILINEAR', rowsPerChunk = 256):
+    """ Target-to-source resampling map.
+        Returns {'index': k x n source flat indices (-1 outside), 'weight': k x n weights}, n the
+        number of target cells (row major), k = 1 (NEAREST) or 4 (BILINEAR)."""
+    method = method.upper ()
+    if method not in methods:
+        raise ValueError ('Unknown resampling method: ' + method)
+    nrows, ncols = int (dstHdr['nrows']), int (dstHdr['ncols'])
+    scs, dcs = float (srcHdr['cellsize']), float (dstHdr['cellsize'])
+    sRows, sCols = int (srcHdr['nrows']), int (srcHdr['ncols'])
+    sTop = srcHdr['yllcorner'] + sRows * scs
+    dTop = dstHdr['yllcorner'] + nrows * dcs
+    idxType = np.int32 if sRows * sCols < 2 ** 31 else np.int64
+    k = 1 if method == 'NEAREST' else 4
+    index = np.full ((k, nrows * ncols), -1, dtype = idxType)
+    weight = np.zeros ((k, nrows * ncols), dtype = np.float32)
+    x = dstHdr['xllcorner'] + (np.arange (ncols) + 0.5) * dcs
+
+    for r0 in range (0, nrows, rowsPerChunk):
+        r1 = min (r0 + rowsPerChunk, nrows)
+        y = dTop - (np.arange (r0, r1) + 0.5) * dcs
+        xx, yy = np.meshgrid (x, y)
+        sx, sy = projectPoints (xx.ravel (), yy.ravel (), dstSR, srcSR)
+        u = (np.asarray (sx) - srcHdr['xllcorner']) / scs #column, in cells from the left edge
+        v = (sTop - np.asarray (sy)) / scs #row, in cells from the top edge
+        inside = (u >= 0) & (u < sCols) & (v >= 0) & (v < sRows)
+        sel = slice (r0 * ncols, r1 * ncols)
+        if method == 'NEAREST':
+            idx = np.floor (v).astype (np.int64) * sCols + np.floor (u).astype (np.int64)
+            index[0, sel] = np.where (inside, idx, -1)
+            weight[0, sel] = inside
+            continue
+        # bilinear between the four nearest cell centers, edge cells repeated
+        u -= 0.5
+        v -= 0.5
+        j0 = np.floor (u)
+        i0 = np.floor (v)
+        fu = u - j0
+        fv = v - i0
+        j0 = j0.astype (np.int64)
+        i0 = i0.astype (np.int64)
+        corners = [(0, 0, (1 - fu) * (1 - fv)), (0, 1, fu * (1 - fv)),
+                   (1, 0, (1 - fu) * fv), (1, 1, fu * fv)]
+        for c, (di, dj, w) in enumerate (corners):
+            i = np.clip (i0 + di, 0, sRows - 1)
+            j = np.clip (j0 + dj, 0, sCols - 1)
+            index[c, sel] = np.where (inside, i * sCols + j, -1)
+            weight[c, sel] = np.where (inside, w, 0)
+    return {'index': index, 'weight': weight, 'method': method,
+            'shape': (nrows, ncols), 'sourceShape': (sRows, sCols)}
+
+
+def loadMap (cacheFolder, srcHdr, srcSR, dstHdr, dstSR, method = 'BILINEAR'):
+    """ Resampling map from the cache folder, built and saved there when missing """
+    key = mapKey (srcHdr, srcSR, dstHdr, dstSR, method)
+    path = None
+    if cacheFolder:
+        if not os.path.exists (cacheFolder):
+            os.makedirs (cacheFolder)
+        path = os.path.join (cacheFolder, 'rsmap_' + key + '.npz')
+        if os.path.exists (path):
+            data = np.load (path)
+            return {'index': data['index'], 'weight': data['weight'], 'method': str (data['method']),
+                    'shape': tuple (data['shape']), 'sourceShape': tuple (data['sourceShape'])}
+    rsMap = buildMap (srcHdr, srcSR, dstHdr, dstSR, method)
+    if path is not None:
+        tmp = path[:-4] + '_tmp.npz'
+        np.savez (tmp, index = rsMap['index'], weight = rsMap['weight'], method = rsMap['method'],
+                  shape = rsMap['shape'], sourceShape = rsMap['sourceShape'])
+        if os.path.exists (path):
+            os.remove (path)
+        os.rename (tmp, path)
+    return rsMap
+
+
+def applyMap (rsMap, arrays, nodata, outNodata = -9999, cellsPerChunk = 250000):
+    """ Resamples arrays on the same source grid with one gather per chunk of target cells.
+        arrays: list of 2D source arrays; nodata: list of their nodata values (None for none).
+        Returns list of 2D target arrays: NEAREST keeps the dtype, BILINEAR gives float32."""
+    index, weight = rsMap['index'], rsMap['weight']
+    n = index.shape[1]
+    flat = [np.asarray (a).ravel () for a in arrays]
+    bilinear = rsMap['method'] == 'BILINEAR'
+    if bilinear:
+        stack = np.vstack ([a.astype (np.float64) for a in flat])
+        ok = np.vstack ([hrrRaster.nodataMask (a, {'NODATA_value': nd}) for a, nd in zip (flat, nodata)])
+        out = np.full ((len (flat), n), outNodata, dtype = np.float32)
+    else:
+        out = [np.full (n, outNodata, dtype = a.dtype) for a in flat]
+
+    for s0 in range (0, n, cellsPerChunk):
+        s1 = min (s0 + cellsPerChunk, n)
+        idx = index[:, s0:s1]
+        inside = idx[0] >= 0
+        safe = np.where (idx >= 0, idx, 0)
+        if not bilinear:
+            for a, o, nd in zip (flat, out, nodata):
+                v = a[safe[0]]
+                good = inside.copy ()
+                if nd is not None:
+                    good &= v != nd
+                o[s0:s1][good] = v[good]
+            continue
+        v = stack[:, safe] # rasters x 4 x cells
+        w = weight[np.newaxis, :, s0:s1] * ok[:, safe]
+        wsum = w.sum (axis = 1)
+        good = inside[np.newaxis, :] & (wsum > 0)
+        val = (np.where (w > 0, v, 0) * w).sum (axis = 1)
+        val[good] /= wsum[good]
+        out[:, s0:s1][good] = val[good]
+    shape = rsMap['shape']
+    return [o.reshape (shape) for o in out]
+
+
+def resampleRasters (inPaths, outPaths, targetHdr, targetSR, method = 'BILINEAR', cacheFolder = None,
+                     defaultSR = 4326):
+    """ Resamples rasters (ESRI ASCII or arcpy) onto the target grid and writes them to outPaths.
+        Rasters without a coordinate system (e.g. ASCII grids from R) get defaultSR.
+        Rasters on the same source grid share one map and one gather. """
+    groups = {}
+    for inPath, outPath in zip (inPaths, outPaths):
+        hdr = hrrRaster.readHeader (inPath)
+        sr = hdr.get ('spatialReference')
+        if sr is None or getattr (sr, 'name', '') == 'Unknown':
+            sr = defaultSR
+        key = gridKey (hdr, sr)
+        groups.setdefault (key, (hdr, sr, []))[2].append ((inPath, outPath))
+
+    outHdr = dict (targetHdr, NODATA_value = -9999, spatialReference = targetSR)
+    for hdr, sr, pairs in groups.values ():
+        rsMap = loadMap (cacheFolder, hdr, sr, targetHdr, targetSR, method)
+        arrays, nodata = [], []
+        for inPath, outPath in pairs:
+            arr, h = hrrRaster.readRaster (inPath, np.float64 if method.upper () == 'BILINEAR' else np.int32)
+            arrays.append (arr)
+            nodata.append (h.get ('NODATA_value'))
+        for (inPath, outPath), out in zip (pairs, applyMap (rsMap, arrays, nodata)):
+            hrrRaster.writeRaster (outPath, out, outHdr)
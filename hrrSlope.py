@@ -0,0 +1,264 @@
+"""
+Slope engine for HRR step 3 (replaces Slope, the 0.1% floor grids and ZonalStatisticsAsTable MEAN).
+
+The DEM is processed in tiles with a one cell halo on a thread pool. Each tile gets Horn's 3x3
+slope in percent rise (as ArcGIS Slope), the minimum slope floor is applied inline, and the tile
+is added straight to the zonal accumulator (hrrZonal), so no full-size slope grid is made unless
+one is asked for. As in ArcGIS, nodata neighbours (grid edge, masked cells) take the value of the
+centre cell.
+
+pathSlope gives the channel slope from the DEM profile along each catchment's longest flow path
+instead: it walks fdir over the path cells only and takes drop over length (or a fitted slope).
+
+Hydro-Geo-Spatial Research Lab
+Website: http://www.northeastern.edu/beighley/home/
+"""
+
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import numpy as np
+import hrrFlow, hrrRaster, hrrTopo, hrrZonal
+
+
+def hornSlope (block, cellX, cellY, nodata = None, floor = None):
+    """ Slope (percent rise) of the inner cells of a block with a one cell halo.
+        cellX may be a column of row cell widths (geographic grids, see geoCellSize).
+        NaN where the centre cell is nodata. floor: minimum slope, e.g. 0.1 (%)."""
+    z = np.array (block, dtype = np.float64)
+    if nodata is not None:
+        z[z == nodata] = np.nan
+    nr, nc = z.shape
+    c = z[1:-1, 1:-1]
+
+    def nb (dr, dc):
+        v = z[1 + dr:nr - 1 + dr, 1 + dc:nc - 1 + dc]
+        return np.where (np.isnan (v), c, v)
+
+    a, b, cc = nb (-1, -1), nb (-1, 0), nb (-1, 1)
+    d, f = nb (0, -1), nb (0, 1)
+    g, h, i = nb (1, -1), nb (1, 0), nb (1, 1)
+    dzdx = ((cc + 2 * f + i) - (a + 2 * d + g)) / (8.0 * cellX)
+    dzdy = ((g + 2 * h + i) - (a + 2 * b + cc)) / (8.0 * cellY)
+    slope = 100.0 * np.sqrt (dzdx * dzdx + dzdy * dzdy)
+    slope[np.isnan (c)] = np.nan
+    if floor is not None:
+        slope = np.maximum (slope, floor) #NaN stays NaN
+    return slope
+
+
+def geoCellSize (header, nrows = None):
+    """ Cell width (column of one value per row) and height in meters for a grid in decimal degrees """
+    if nrows is None:
+        nrows = header['nrows']
+    cs = header['cellsize']
+    top = header['yllcorner'] + nrows * cs
+    lat = np.radians (top - (np.arange (nrows) + 0.5) * cs)
+    cellX = cs * 111320.0 * np.cos (lat)
+    cellY = cs * 110574.0
+    return cellX[:, np.newaxis], cellY
+
+
+def arrayWindows (shape, tileSize):
+    """ (r0, r1, c0, c1) tiles covering a grid """
+    nrows, ncols = shape
+    for r0 in range (0, nrows, tileSize):
+        for c0 in range (0, ncols, tileSize):
+            yield r0, min (r0 + tileSize, nrows), c0, min (c0 + tileSize, ncols)
+
+
+def padWindow (arr, r0, r1, c0, c1, halo, fill):
+    """ Window of an array with halo cells, fill outside the array """
+    out = np.full ((r1 - r0 + 2 * halo, c1 - c0 + 2 * halo), fill, dtype = np.float64)
+    a0, a1 = max (r0 - halo, 0), min (r1 + halo, arr.shape[0])
+    b0, b1 = max (c0 - halo, 0), min (c1 + halo, arr.shape[1])
+    out[a0 - r0 + halo:a1 - r0 + halo, b0 - c0 + halo:b1 - c0 + halo] = arr[a0:a1, b0:b1]
+    return out
+
+
+def runTiles (jobs, work, zoneName, names, outSlope, numThreads, stats):
+    """ Runs work (job) -> (window, zones, {name: slope}) on a thread pool, accumulates the zonal
+        statistics in tile order and fills outSlope (array) when given """
+    if numThreads is None or numThreads < 1:
+        numThreads = multiprocessing.cpu_count ()
+    acc = hrrZonal.newAccumulator (names, stats)
+    pool = ThreadPool (numThreads)
+    try:
+        for window, zones, values in pool.imap (work, jobs):
+            hrrZonal.addBlock (acc, zones, values)
+            if outSlope is not None:
+                r0, r1, c0, c1 = window
+                outSlope[r0:r1, c0:c1] = values[names[0]]
+    finally:
+        pool.close ()
+        pool.join ()
+    return hrrZonal.finishTable (acc, zoneName)
+
+
+def zonalSlope (dem, zones, cellX, cellY = None, nodata = None, floor = 0.1, mask = None,
+                tileSize = 1024, numThreads = None, saveSlope = False, stats = None,
+                zoneField = 'GRIDCODE'):
+    """ Per-zone slope statistics of an in-memory DEM (fields slope_<STAT>).
+        zones: label array on the DEM grid (<= 0 not a zone). mask: only these DEM cells are used,
+        as ExtractByMask before Slope. cellX: number, or column of row widths (geoCellSize).
+        Returns (table, slope grid or None). """
+    if cellY is None:
+        cellY = cellX
+    if stats is None:
+        stats = ['MEAN']
+    fill = np.nan
+    if mask is not None or nodata is not None:
+        dem = np.array (dem, dtype = np.float64)
+        if nodata is not None:
+            dem[dem == nodata] = np.nan
+        if mask is not None:
+            dem[~mask] = np.nan
+    out = np.full (dem.shape, np.nan, dtype = np.float32) if saveSlope else None
+
+    def work (window):
+        r0, r1, c0, c1 = window
+        cx = cellX[r0:r1] if np.ndim (cellX) else cellX
+        slope = hornSlope (padWindow (dem, r0, r1, c0, c1, 1, fill), cx, cellY, None, floor)
+        return window, zones[r0:r1, c0:c1], {'slope': slope}
+
+    table = runTiles (list (arrayWindows (dem.shape, tileSize)), work, zoneField, ['slope'], out,
+                      numThreads, stats)
+    return table, out
+
+
+def zonalSlopeTiles (demStore, zoneStore, cellX, cellY = None, floor = 0.1, maskStore = None,
+                     numThreads = None, outStore = None, stats = None, zoneField = 'GRIDCODE'):
+    """ Same as zonalSlope on tiled stores (hrrRaster) with the same tiles, one tile plus halo in
+        memory per thread. Zone cells that are nodata or <= 0 are not zones; with maskStore, DEM cells
+        where the mask is nodata or <= 0 are left out. outStore: tiled store to write the slope grid
+        to (optional). Returns the table. """
+    if cellY is None:
+        cellY = cellX
+    if stats is None:
+        stats = ['MEAN']
+    if demStore['tileSize'] != zoneStore['tileSize'] or not hrrRaster.sameGrid (demStore['header'], zoneStore['header']):
+        raise ValueError ('DEM and zone stores must hold the same grid in the same tiles')
+    nodata = demStore['header'].get ('NODATA_value')
+    nti, ntj = hrrRaster.tileCount (demStore)
+    jobs = [(ti, tj) for ti in range (nti) for tj in range (ntj)]
+
+    def work (job):
+        ti, tj = job
+        block = np.array (hrrRaster.readBlock (demStore, ti, tj, 1), dtype = np.float64)
+        if nodata is not None:
+            block[block == nodata] = np.nan
+        if maskStore is not None:
+            mask = hrrRaster.readBlock (maskStore, ti, tj, 1)
+            block[(mask <= 0) | ~hrrRaster.nodataMask (mask, maskStore['header'])] = np.nan
+        r0, r1, c0, c1 = hrrRaster.tileWindow (demStore, ti, tj)
+        cx = cellX[r0:r1] if np.ndim (cellX) else cellX
+        slope = hornSlope (block, cx, cellY, None, floor)
+        if outStore is not None:
+            hrrRaster.writeBlock (outStore, ti, tj, np.where (np.isnan (slope),
+                                  outStore['header'].get ('NODATA_value', -9999), slope))
+        zones = hrrRaster.readBlock (zoneStore, ti, tj)
+        zones[~hrrRaster.nodataMask (zones, zoneStore['header'])] = 0
+        return (r0, r1, c0, c1), zones, {'slope': slope}
+
+    return runTiles (jobs, work, zoneField, ['slope'], None, numThreads, stats)
+
+
+def pathNetwork (fdir, cells, zone):
+    """ Downstream pointers among the given flat cells only (local positions, -1 where the flow
+        leaves the cells or the zone), and the row and D8 offsets of every cell """
+    nrows, ncols = fdir.shape
+    codes = fdir.ravel ()[cells]
+    dr = np.zeros (cells.size, dtype = np.int64)
+    dc = np.zeros (cells.size, dtype = np.int64)
+    for code, (r, c) in hrrFlow.D8.items ():
+        sel = codes == code
+        dr[sel] = r
+        dc[sel] = c
+    row = cells // ncols
+    r = row + dr
+    c = cells % ncols + dc
+    target = np.where ((r >= 0) & (r < nrows) & (c >= 0) & (c < ncols) & ((dr != 0) | (dc != 0)),
+                       r * ncols + c, -1)
+    down = hrrTopo.lookup (cells, np.arange (cells.size), target) #cells are sorted
+    has = down >= 0
+    has[has] = zone[down[has]] != zone[has]
+    down[has] = -1
+    return down, row, dr, dc
+
+
+def pathSlope (fdir, dem, zones, cellX, cellY = None, pathMask = None, nodata = None, floor = 0.1,
+               method = 'drop', zoneField = 'GRIDCODE'):
+    """ Channel slope of every zone along its longest flow path, from the DEM profile.
+        Only the path cells are visited: pathMask marks them (e.g. the rasterized LFP); without it
+        every cell of the zone is a candidate. In each zone the path starts at the candidate cell
+        farthest (along fdir) from the zone outlet and follows fdir out of the zone.
+        method: 'drop' = (elevation at the head - at the end) / path length, 'fit' = least squares
+        slope of elevation against distance along the path. Slopes in percent rise, at least floor.
+        cellX: number, or column of row widths (geoCellSize).
+        Returns structured array with fields zoneField, lfp_LENGTH, lfp_DROP, lfp_SLOPE. """
+    if cellY is None:
+        cellY = cellX
+    z = np.asarray (zones).ravel ()
+    elev = np.asarray (dem).ravel ()
+    keep = z > 0
+    if pathMask is not None:
+        keep &= np.asarray (pathMask).ravel ()
+    keep &= np.isfinite (elev)
+    if nodata is not None:
+        keep &= elev != nodata
+    cells = np.nonzero (keep)[0]
+    zone = z[cells].astype (np.int64)
+    elev = elev[cells].astype (np.float64)
+
+    down, row, dr, dc = pathNetwork (fdir, cells, zone)
+    cx = np.ravel (cellX)[row] if np.ndim (cellX) else cellX
+    step = np.hypot (dr * cellY, dc * cx)
+    order, bounds = hrrFlow.flowLevels (down, np.ones (cells.size, dtype = bool))
+    dist, upl = hrrFlow.flowLength (down, order, bounds, step)
+    del upl
+
+    # head: farthest cell of each zone; path: the cells downstream of it
+    byZone = np.lexsort ((-dist, zone))
+    first = np.ones (byZone.size, dtype = bool)
+    first[1:] = zone[byZone][1:] != zone[byZone][:-1]
+    heads = byZone[first]
+    onPath = np.zeros (cells.size, dtype = bool)
+    onPath[heads] = True
+    for k in range (len (bounds) - 1):
+        level = order[bounds[k]:bounds[k + 1]]
+        level = level[onPath[level] & (down[level] >= 0)]
+        onPath[down[level]] = True
+
+    gridcode = zone[heads]
+    length = dist[heads]
+    ends = np.nonzero (onPath & (down < 0))[0]
+    endElev = np.zeros (gridcode.size)
+    endElev[np.searchsorted (gridcode, zone[ends])] = elev[ends]
+    drop = elev[heads] - endElev
+
+    slope = np.full (gridcode.size, np.nan)
+    has = length > 0
+    if method == 'fit':
+        p = np.nonzero (onPath)[0]
+        k = np.searchsorted (gridcode, zone[p])
+        x = length[k] - dist[p] #distance from the head
+        y = elev[p]
+        n = np.bincount (k, minlength = gridcode.size).astype (np.float64)
+        sx = np.bincount (k, x, gridcode.size)
+        sy = np.bincount (k, y, gridcode.size)
+        sxx = np.bincount (k, x * x, gridcode.size)
+        sxy = np.bincount (k, x * y, gridcode.size)
+        den = n * sxx - sx * sx
+        has &= den > 0
+        slope[has] = -100.0 * (n[has] * sxy[has] - sx[has] * sy[has]) / den[has]
+    else:
+        slope[has] = 100.0 * drop[has] / length[has]
+    if floor is not None:
+        slope = np.where (np.isnan (slope), floor, np.maximum (slope, floor))
+
+    table = np.zeros (gridcode.size, dtype = [(zoneField, np.int32), ('lfp_LENGTH', np.float64),
+                                              ('lfp_DROP', np.float64), ('lfp_SLOPE', np.float64)])
+    table[zoneField] = gridcode
+    table['lfp_LENGTH'] = length
+    table['lfp_DROP'] = drop
+    table['lfp_SLOPE'] = slope
+    return table
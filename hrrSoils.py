@@ -0,0 +1,193 @@
+"""
+Layered soil properties for HRR step 4 (Python port of nc2ras_ks_soild.R and nc2ras_theta.R).
+
+The global soil data come as one netCDF file per soil layer (eight layers to 2.296 m). Each layer
+is opened lazily and only the rows and columns inside the catchment bounding box are read, one
+band of rows at a time. The depth weighted sums are accumulated layer by layer for the band, so
+one layer band is in memory at a time, and the finished band is written to a tiled store
+(hrrRaster), which step 4.1 reads directly.
+
+  k_s:     harmonic mean  = sum (d) / sum (d / k)
+  theta_s: weighted mean  = sum (d * theta) / 2.962
+  soilD:   sum (d * k / k)
+
+d are the layer thicknesses. By default the results are those of the R scripts: a cell is nodata
+when any layer has no data there (soilD also where a layer value is 0), and theta_s is divided by
+2.962 as in nc2ras_theta.R, not by the total depth 2.296. Two options change this:
+missing = 'layer' leaves the layers without data out of that cell only (soilD is then the depth
+of the layers with data), and divisor = None divides theta_s by the depth of its layers, a true
+weighted mean. Both change the model inputs.
+
+netCDF files are read with netCDF4 when it is installed, else with scipy (netCDF3 files).
+
+Hydro-Geo-Spatial Research Lab
+Website: http://www.northeastern.edu/beighley/home/
+"""
+
+import os, os.path
+import numpy as np
+import hrrRaster
+
+# thickness (m) of the eight soil layers: 0-0.045, 0.045-0.091, 0.091-0.166, 0.166-0.289,
+# 0.289-0.493, 0.493-0.829, 0.829-1.383 and 1.383-2.296 m
+layerDepths = [0.045, 0.046, 0.075, 0.123, 0.204, 0.336, 0.554, 0.913]
+
+# divisor of the theta_s depth weighted sum in nc2ras_theta.R
+thetaDivisor = 2.962
+
+lonNames = ('lon', 'longitude', 'x')
+latNames = ('lat', 'latitude', 'y')
+
+
+def layerFiles (folder):
+    """ netCDF files of a folder in name order (layer 1 first, as list.files in R) """
+    return [os.path.join (folder, f) for f in sorted (os.listdir (folder)) if f.endswith ('.nc')]
+
+
+def openLayer (path):
+    """ Opens a netCDF file for reading slices, netCDF4 or scipy """
+    try:
+        import netCDF4
+        nc = netCDF4.Dataset (path, 'r')
+        nc.set_auto_maskandscale (True)
+        return nc
+    except ImportError:
+        from scipy.io import netcdf_file
+        return netcdf_file (path, 'r', mmap = True, maskandscale = True)
+
+
+def coordinate (nc, names):
+    for name in names:
+        if name in nc.variables:
+            return np.array (nc.variables[name][:], dtype = np.float64)
+    raise ValueError ('No coordinate variable among ' + ', '.join (names))
+
+
+def layerGrid (nc):
+    """ Grid of a layer: (lon, lat) cell centers and the cell size """
+    lon = coordinate (nc, lonNames)
+    lat = coordinate (nc, latNames)
+    cs = abs (float (lon[1] - lon[0])) if lon.size > 1 else abs (float (lat[1] - lat[0]))
+    return lon, lat, cs
+
+
+def cropWindow (lon, lat, cs, bbox):
+    """ File rows and columns of the cells touching bbox (xmin, ymin, xmax, ymax), snapped out
+        as crop (snap = "out") in R. Returns (r0, r1, c0, c1, header); header is north up. """
+    xmin, ymin, xmax, ymax = bbox
+    cols = np.nonzero ((lon + cs / 2.0 > xmin) & (lon - cs / 2.0 < xmax))[0]
+    rows = np.nonzero ((lat + cs / 2.0 > ymin) & (lat - cs / 2.0 < ymax))[0]
+    if cols.size == 0 or rows.size == 0:
+        raise ValueError ('Catchment extent is outside the soil grid')
+    r0, r1, c0, c1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+    header = {'ncols': int (c1 - c0),
+              'nrows': int (r1 - r0),
+              'xllcorner': float (lon[c0:c1].min () - cs / 2.0),
+              'yllcorner': float (lat[r0:r1].min () - cs / 2.0),
+              'cellsize': cs,
+              'NODATA_value': -9999.0
+              }
+    return int (r0), int (r1), int (c0), int (c1), header
+
+
+def readBand (var, rows, c0, c1):
+    """ Rows (file order, ascending slice) of a layer as float64, NaN where there is no data """
+    data = var[rows[0]:rows[-1] + 1, c0:c1]
+    if np.ma.isMaskedArray (data):
+        data = data.astype (np.float64).filled (np.nan)
+    else:
+        data = np.array (data, dtype = np.float64)
+        fill = getattr (var, '_FillValue', getattr (var, 'missing_value', None))
+        if fill is not None:
+            data[data == fill] = np.nan
+    return data
+
+
+def layeredMean (paths, varName, bbox, outPath, mean = 'harmonic', depthPath = None, depths = None,
+                 tileSize = 2048, missing = 'cell', divisor = thetaDivisor):
+    """ Depth weighted mean of the soil layers over the catchment bounding box (degrees).
+        paths: netCDF file per layer, top layer first. mean: 'harmonic' (k_s) or 'arithmetic'
+        (theta_s). Writes the mean, and the soil depth when depthPath is given, to tiled stores.
+        missing: 'cell' (R) makes a cell nodata when a layer has no data there, 'layer' leaves
+        that layer out of the cell. divisor: divisor of the arithmetic sum, 2.962 as in R; None
+        for the depth of the layers. Returns the header of the cropped grid. """
+    if depths is None:
+        depths = layerDepths
+    if len (paths) != len (depths):
+        raise ValueError ('%d layer files for %d layer depths' % (len (paths), len (depths)))
+    if missing not in ('cell', 'layer'):
+        raise ValueError ('missing must be cell or layer, not ' + str (missing))
+    layers = [openLayer (p) for p in paths]
+    try:
+        lon, lat, cs = layerGrid (layers[0])
+        for nc in layers[1:]:
+            lon2, lat2, cs2 = layerGrid (nc)
+            if lon2.size != lon.size or lat2.size != lat.size or not np.allclose (lon2, lon) \
+               or not np.allclose (lat2, lat):
+                raise ValueError ('Soil layers are not on the same grid')
+        r0, r1, c0, c1, header = cropWindow (lon, lat, cs, bbox)
+        northUp = lat.size < 2 or lat[1] < lat[0]
+
+        store = hrrRaster.createTiles (outPath, header, np.float32, tileSize)
+        depthStore = None
+        if depthPath is not None:
+            depthStore = hrrRaster.createTiles (depthPath, header, np.float32, tileSize)
+        nti, ntj = hrrRaster.tileCount (store)
+        nodata = header['NODATA_value']
+
+        for ti in range (nti):
+            b0, b1 = hrrRaster.tileWindow (store, ti, 0)[:2] # output rows, north first
+            if northUp:
+                rows = np.arange (r0 + b0, r0 + b1)
+            else:
+                rows = np.arange (r1 - b1, r1 - b0)
+            total = np.zeros ((b1 - b0, c1 - c0))
+            soilD = np.zeros ((b1 - b0, c1 - c0))
+            complete = np.ones (total.shape, dtype = bool) # every layer has data
+            nonzero = np.ones (total.shape, dtype = bool) # and none is 0 (d * k / k in R)
+            for nc, d in zip (layers, depths):
+                band = readBand (nc.variables[varName], rows, c0, c1)
+                if not northUp:
+                    band = band[::-1]
+                ok = np.isfinite (band)
+                with np.errstate (divide = 'ignore'):
+                    if mean == 'harmonic':
+                        total[ok] += d / band[ok]
+                    else:
+                        total[ok] += d * band[ok]
+                soilD[ok] += d
+                complete &= ok
+                nonzero &= band != 0
+                del band, ok
+            if missing == 'cell':
+                has = complete
+                hasD = complete & nonzero
+            else:
+                has = hasD = soilD > 0
+            out = np.full (total.shape, nodata, dtype = np.float32)
+            if mean == 'harmonic':
+                out[has] = soilD[has] / total[has]
+            elif divisor is None:
+                out[has] = total[has] / soilD[has]
+            else:
+                out[has] = total[has] / divisor
+            for tj in range (ntj):
+                cc0, cc1 = hrrRaster.tileWindow (store, ti, tj)[2:]
+                hrrRaster.writeBlock (store, ti, tj, out[:, cc0:cc1])
+                if depthStore is not None:
+                    hrrRaster.writeBlock (depthStore, ti, tj, np.where (hasD, soilD, nodata)[:, cc0:cc1])
+    finally:
+        for nc in layers:
+            nc.close ()
+    return header
+
+
+def catchmentBox (catchments):
+    """ Bounding box (xmin, ymin, xmax, ymax) of the catchments in WGS84 degrees, with arcpy """
+    import arcpy
+    box = [np.inf, np.inf, -np.inf, -np.inf]
+    with arcpy.da.SearchCursor (catchments, ['SHAPE@'], spatial_reference = arcpy.SpatialReference (4326)) as rows:
+        for row in rows:
+            ext = row[0].extent
+            box = [min (box[0], ext.XMin), min (box[1], ext.YMin), max (box[2], ext.XMax), max (box[3], ext.YMax)]
+    return tuple (box)
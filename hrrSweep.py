@@ -0,0 +1,260 @@
+"""
+Stream networks of one basin at several threshold areas (A_thrhld) from one flow routing pass.
+
+The work that does not depend on the threshold is done once: the downstream pointers and the
+headwaters-to-outlets ordering of the fdir grid (hrrFlow), and the upstream + downstream flow
+length on the LFP network (upd, step 1 goal 2), which comes from the same ordering. Each threshold
+then only labels its stream links, a sweep over its stream cells.
+
+Networks of larger thresholds nest in those of smaller ones: a stream cell at a larger threshold
+is one at every smaller threshold, and so is a confluence, so each catchment of the finest level
+lies in exactly one catchment of a coarser level. The watershed grid is labeled for the finest
+level only. Coarser levels map its catchments to theirs (a pass over the units, then one gather
+per cell) and sum its zonal statistics (COUNT, MAX of facc and upd) over the nested catchments,
+without another pass over the grid. Nesting needs facc to grow downstream; a level where it does
+not hold is labeled on its own.
+
+Each level gets the unit table of step 2 part 1 (hrrTable form: HRR_ID, WID, Down_ID, NumUp,
+Up1ID..Up4ID, CumArea, Error) and the grid code of the catchment holding each unit one level up.
+
+Hydro-Geo-Spatial Research Lab
+Website: http://www.northeastern.edu/beighley/home/
+"""
+
+import os, os.path
+from collections import OrderedDict
+import numpy as np
+import hrrFlow, hrrLog, hrrRaster, hrrTable, hrrTopo, hrrZonal
+
+
+def lfpLength (down, valid, order, bounds, keep, step):
+    """ hrrFlow.updLength on the network of keep cells, from the ordering of the whole grid (a
+        topological order of the grid is one of any part of it). Flat array, -1 off the network. """
+    inOrder = np.zeros (down.size, dtype = bool)
+    inOrder[order] = True
+    keep = keep & valid & inOrder
+    sub = np.where (keep, down, -1)
+    has = sub >= 0
+    has[has] = keep[sub[has]]
+    sub[~has] = -1
+    cells = hrrFlow.levelSlices (order, bounds, keep)
+    subBounds = np.zeros (len (cells) + 1, dtype = np.int64)
+    subBounds[1:] = np.cumsum ([c.size for c in cells])
+    subOrder = np.concatenate (cells) if cells else np.zeros (0, dtype = np.int64)
+    downl, upl = hrrFlow.flowLength (sub, subOrder, subBounds, step)
+    downl += upl
+    del upl
+    downl[~keep] = -1
+    return downl
+
+
+def routing (fdir, facc, lfpThreshold, cellX, cellY = None, mask = None):
+    """ Threshold independent part: dictionary of down, valid, order, bounds (hrrFlow), facc and
+        upd (flat) and the grid shape """
+    down, valid = hrrFlow.downIndex (fdir, mask)
+    order, bounds = hrrFlow.flowLevels (down, valid)
+    flatFacc = np.asarray (facc, dtype = np.float64).ravel ()
+    upd = lfpLength (down, valid, order, bounds, flatFacc > lfpThreshold, hrrFlow.stepLength (fdir, cellX, cellY))
+    return {'down': down,
+            'valid': valid,
+            'order': order,
+            'bounds': bounds,
+            'facc': flatFacc,
+            'upd': upd,
+            'shape': fdir.shape
+            }
+
+
+def linkOutlets (link, down):
+    """ Outlet cell (last cell downstream) of links 1..n, flat index by link - 1 """
+    cells = np.nonzero (link)[0]
+    d = down[cells]
+    same = d >= 0
+    same[same] = link[d[same]] == link[cells[same]]
+    out = np.zeros (int (link.max ()) if cells.size else 0, dtype = np.int64)
+    out[link[cells[~same]] - 1] = cells[~same]
+    return out
+
+
+def downCodes (basin, down, outlets):
+    """ Grid code of the catchment below each link outlet, 0 where the flow leaves the grid """
+    d = down[outlets]
+    codes = np.zeros (outlets.size, dtype = np.int64)
+    codes[d >= 0] = basin[d[d >= 0]]
+    return codes
+
+
+def nestedParent (fineDown, fineOutlets, coarseLink):
+    """ Coarse grid code of every fine unit: the coarse link at its outlet, else the one of the
+        unit below it (0 if none) """
+    parent = coarseLink[fineOutlets].astype (np.int64)
+    unitLevels = hrrTopo.levels (fineDown)
+    for units in reversed (unitLevels):
+        d = fineDown[units]
+        need = (parent[units] == 0) & (d >= 0)
+        parent[units[need]] = parent[d[need]]
+    return parent
+
+
+def zonalLevel (basin, facc, upd, faccNodata = None):
+    """ COUNT and MAX of facc, MAX of upd for catchments 1..max (basin), arrays by code - 1 """
+    n = int (basin.max ())
+    stats = hrrZonal.zonalStats (basin, {'facc': facc, 'upd': upd}, ['COUNT', 'MAX'],
+                                 {'facc': faccNodata, 'upd': -1})
+    pos = stats['GRIDCODE'].astype (np.int64) - 1
+    count = np.zeros (n, dtype = np.int64)
+    maxFacc = np.full (n, np.nan)
+    maxUpd = np.full (n, np.nan)
+    count[pos] = stats['facc_COUNT']
+    maxFacc[pos] = stats['facc_MAX']
+    maxUpd[pos] = stats['upd_MAX']
+    return count, maxFacc, maxUpd
+
+
+def aggregate (parent, n, count, maxFacc, maxUpd):
+    """ Zonal statistics of n coarse catchments from those of the fine catchments they hold """
+    has = parent > 0
+    p = parent[has] - 1
+    cCount = np.bincount (p, weights = count[has], minlength = n).astype (np.int64)
+    cFacc = np.full (n, np.nan)
+    cUpd = np.full (n, np.nan)
+    np.fmax.at (cFacc, p, maxFacc[has])
+    np.fmax.at (cUpd, p, maxUpd[has])
+    return cCount, cFacc, cUpd
+
+
+def unitTable (gridCode, toCode, count, maxFacc, maxUpd):
+    """ Step 2 part 1 for one level, from the link grid: topology sorted on MAX, then on WID and
+        CumArea, with up and down IDs as HRR IDs. Returns table (hrrTable form). """
+    table = OrderedDict ()
+    table['GRIDCODE'] = gridCode.astype (np.int32)
+    table['FROM_NODE'] = gridCode.astype (np.int32)
+    table['TO_NODE'] = toCode.astype (np.int32)
+    table['COUNT'] = count.astype (np.int32)
+    table['MAX'] = np.nan_to_num (maxFacc)
+    table['LFP_MAX'] = np.nan_to_num (maxUpd)
+
+    topo = hrrTopo.buildTopology (gridCode, gridCode, toCode, [table['MAX']])
+    unitLevels = hrrTopo.levels (topo['down'])
+    cum = hrrTopo.accumulate (topo['down'], table['COUNT'], unitLevels).astype (np.float32)
+    wid = hrrTopo.assignWID (topo['down'], topo['sink'])
+    topo = hrrTopo.buildTopology (gridCode, gridCode, toCode, [wid, cum])
+
+    hrrID = topo['hrr'].astype (np.int32)
+    table['HRR_ID'] = hrrID
+    table['WID'] = hrrTopo.assignWID (topo['down'], topo['sink']).astype (np.int32)
+    table['Down_ID'] = hrrTopo.downValues (topo, hrrID)
+    table['NumUp'] = topo['numUp'].astype (np.int16)
+    upIDs = hrrTopo.upColumns (topo, hrrID, 4)
+    for k in range (4):
+        table['Up' + str (k + 1) + 'ID'] = upIDs[:, k]
+    table['CumArea'] = cum
+    table['Error'] = ((cum * 1.0 - table['MAX']) / cum).astype (np.float32)
+    return table
+
+
+def sweep (fdir, facc, thresholds, lfpThreshold, cellX, cellY = None, mask = None, faccNodata = None):
+    """ Stream networks for several thresholds (cells, facc >= threshold) from one routing pass.
+        Returns (route, levels): route from routing (); levels in increasing threshold, each a
+        dictionary of threshold, link and basin (2D int32), stats (COUNT, MAX facc, MAX upd by
+        grid code - 1, see levelZonal), table (unitTable) and parent (grid code one level up of
+        every unit, None on the last level). """
+    route = routing (fdir, facc, lfpThreshold, cellX, cellY, mask)
+    down, order, bounds, flatFacc = route['down'], route['order'], route['bounds'], route['facc']
+    inNet = route['valid'] & np.isfinite (flatFacc)
+    if faccNodata is not None:
+        inNet &= flatFacc != faccNodata
+
+    levels = []
+    fine = None
+    for threshold in sorted (set (thresholds)):
+        link = hrrFlow.streamLink (down, order, bounds, inNet & (flatFacc >= threshold))
+        outlets = linkOutlets (link, down)
+        basin = None
+        if fine is not None:
+            # catchments of the finest level mapped to this level, checked on the stream cells
+            parent = nestedParent (fine['down'], fine['outlets'], link)
+            stream = np.nonzero (link)[0]
+            if np.array_equal (parent[fine['link'][stream] - 1], link[stream]):
+                lut = np.concatenate ([[0], parent]).astype (np.int32)
+                basin = lut[fine['basin']]
+                stats = aggregate (parent, outlets.size, *fine['stats'])
+            else:
+                hrrLog.warning ('threshold ' + str (threshold) + ' does not nest (facc decreases downstream), labeled on its own')
+        if basin is None:
+            basin = hrrFlow.watershed (down, order, bounds, link)
+            stats = zonalLevel (basin, flatFacc, route['upd'], faccNodata)
+
+        gridCode = np.arange (1, outlets.size + 1, dtype = np.int64)
+        toCode = downCodes (basin, down, outlets)
+        level = {'threshold': threshold,
+                 'link': link.reshape (fdir.shape),
+                 'basin': basin.reshape (fdir.shape),
+                 'stats': stats,
+                 'table': unitTable (gridCode, toCode, *stats),
+                 'parent': None
+                 }
+        if levels:
+            levels[-1]['parent'] = basin[levels[-1]['outlets']]
+        level['outlets'] = outlets
+        levels.append (level)
+        if fine is None:
+            topo = hrrTopo.downstream (gridCode, toCode)
+            fine = {'link': link, 'basin': basin, 'outlets': outlets, 'down': topo, 'stats': stats}
+    for level in levels:
+        del level['outlets']
+    return route, levels
+
+
+def levelZonal (level):
+    """ Zonal statistics of a level as hrrZonal.zonalStats gives them over its basin grid
+        (GRIDCODE, facc_COUNT, facc_MAX, upd_MAX; NaN where a catchment has no data) """
+    count, maxFacc, maxUpd = level['stats']
+    table = np.zeros (count.size, dtype = [('GRIDCODE', np.int32), ('facc_COUNT', np.int64),
+                                           ('facc_MAX', np.float64), ('upd_MAX', np.float64)])
+    table['GRIDCODE'] = np.arange (1, count.size + 1)
+    table['facc_COUNT'] = count
+    table['facc_MAX'] = maxFacc
+    table['upd_MAX'] = maxUpd
+    return table
+
+
+def nestTable (fineTable, coarseTable, parent):
+    """ Map of the units of a level to the units of the next coarser level (hrrTable form):
+        GRIDCODE, HRR_ID, and the grid code and HRR ID of the coarse catchment (0 if none) """
+    table = OrderedDict ()
+    table['GRIDCODE'] = fineTable['GRIDCODE']
+    table['HRR_ID'] = fineTable['HRR_ID']
+    table['UP_GRIDCODE'] = parent.astype (np.int32)
+    coarseID = np.concatenate ([[0], coarseTable['HRR_ID']]).astype (np.int32)
+    table['UP_HRR_ID'] = coarseID[parent]
+    return table
+
+
+def lfpGrid (basin, upd, maxUpd, lfpTip):
+    """ Longest flow path cells of every catchment: (upd + lfpTip) > MAX upd of the catchment
+        (step 1, 'Get LFP raster'). 2D int32, 1 on the LFP, 0 elsewhere. """
+    lut = np.concatenate ([[np.inf], np.where (maxUpd > 0, maxUpd, np.inf)])
+    upd = upd.reshape (basin.shape)
+    return ((upd >= 0) & (upd + lfpTip > lut[basin])).astype (np.int32)
+
+
+def writeSweep (folder, route, levels, header, names = None, lfpTip = None):
+    """ Writes every level to folder/<name>: StrLink.asc, Watersheds.asc (0 = nodata),
+        HRR_units.csv, nest.csv (map to the next level) and, with lfpTip, lfp.asc """
+    if names is None:
+        names = ['T' + str (level['threshold']) for level in levels]
+    hdr = dict (header, NODATA_value = 0)
+    for k, (level, name) in enumerate (zip (levels, names)):
+        out = os.path.join (folder, name)
+        if not os.path.exists (out):
+            os.makedirs (out)
+        hrrRaster.writeAscii (os.path.join (out, 'StrLink.asc'), level['link'], hdr)
+        hrrRaster.writeAscii (os.path.join (out, 'Watersheds.asc'), level['basin'], hdr)
+        hrrTable.writeText (level['table'], os.path.join (out, 'HRR_units.csv'))
+        if level['parent'] is not None:
+            hrrTable.writeText (nestTable (level['table'], levels[k + 1]['table'], level['parent']),
+                                os.path.join (out, 'nest.csv'))
+        if lfpTip is not None:
+            lfp = lfpGrid (level['basin'], route['upd'], level['table']['LFP_MAX'], lfpTip)
+            hrrRaster.writeAscii (os.path.join (out, 'lfp.asc'), lfp, hdr)
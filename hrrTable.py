@@ -0,0 +1,111 @@
+"""
+In-memory columnar tables for the HRR setup (step 2 onwards).
+
+A table is an OrderedDict of column name -> NumPy array, all of the same length, in field order.
+Joins are done by index on the grid code (sorted lookup, see hrrTopo.lookup), so a whole table
+workflow runs in memory and the finished table is written to disk once. ArcGIS tables and feature
+classes are read and written with arcpy.da; text tables need no arcpy.
+
+Hydro-Geo-Spatial Research Lab
+Website: http://www.northeastern.edu/beighley/home/
+"""
+
+from collections import OrderedDict
+import numpy as np
+import hrrTopo
+
+# ArcGIS field type for each NumPy type, as used by AddField
+arcTypes = {'i2': 'SHORT', 'i4': 'LONG', 'i8': 'LONG', 'f4': 'FLOAT', 'f8': 'DOUBLE'}
+
+
+def gridCodeField (table):
+    """ Returns correct Grid Code column. Can be either GRIDCODE or GRID_CODE """
+    for name in table:
+        if name.upper () in ("GRID_CODE", "GRIDCODE"):
+            return name
+
+
+def numRows (table):
+    for name in table:
+        return table[name].size
+    return 0
+
+
+def fromArray (arr, skip = ()):
+    """ Table from a structured array """
+    table = OrderedDict ()
+    for name in arr.dtype.names:
+        if name not in skip:
+            table[name] = np.array (arr[name])
+    return table
+
+
+def fromArc (path, fields = None, skip = (), null_value = 0):
+    """ Reads an ArcGIS table or the attributes of a feature class (no geometry, no OID) """
+    import arcpy
+    if fields is None:
+        fields = [f.name for f in arcpy.ListFields (path) if f.type not in ('OID', 'Geometry')]
+    fields = [f for f in fields if f.upper () not in [s.upper () for s in skip]]
+    return fromArray (arcpy.da.TableToNumPyArray (path, fields, null_value = null_value))
+
+
+def geometryColumn (fc, token, scale = 1.0):
+    """ Grid codes and a geometry value (e.g. 'SHAPE@LENGTH', 'SHAPE@AREA') of a feature class,
+        times scale. Returns (codes, values). """
+    import arcpy
+    gc = None
+    for f in arcpy.ListFields (fc):
+        if f.name.upper () in ("GRID_CODE", "GRIDCODE"):
+            gc = f.name
+    arr = arcpy.da.FeatureClassToNumPyArray (fc, [gc, token])
+    return arr[gc].astype (np.int64), arr[token].astype (np.float64) * scale
+
+
+def joinColumns (table, key, otherKeys, columns, fill = 0):
+    """ Joins columns ({name: array} matched to otherKeys) to the table on column key.
+        Rows without a match get fill. The first match is used when a key repeats (as JoinField)."""
+    otherKeys = np.asarray (otherKeys, dtype = np.int64)
+    perm = np.argsort (otherKeys, kind = 'mergesort')
+    sortedKeys = otherKeys[perm]
+    # keep the first of repeated keys
+    first = np.ones (sortedKeys.size, dtype = bool)
+    first[1:] = sortedKeys[1:] != sortedKeys[:-1]
+    pos = hrrTopo.lookup (sortedKeys[first], perm[first], table[key])
+    found = pos >= 0
+    for name, values in columns.items ():
+        values = np.asarray (values)
+        col = np.full (pos.size, fill, dtype = values.dtype)
+        col[found] = values[pos[found]]
+        table[name] = col
+    return table
+
+
+def toStructured (table):
+    """ Structured array of the table, in column order """
+    arr = np.zeros (numRows (table), dtype = [(str (n), table[n].dtype) for n in table])
+    for n in table:
+        arr[n] = table[n]
+    return arr
+
+
+def writeArc (table, path):
+    """ Writes the table to a dbf or GDB table, with arcpy """
+    import arcpy
+    if arcpy.Exists (path):
+        arcpy.Delete_management (path)
+    arcpy.da.NumPyArrayToTable (toStructured (table), path)
+
+
+def writeText (table, path, delimiter = ','):
+    """ Writes the table to delimited text with a header row """
+    with open (path, 'w') as handle:
+        handle.write (delimiter.join (table.keys ()) + '\n')
+        cols = [table[n].tolist () for n in table]
+        for row in zip (*cols):
+            handle.write (delimiter.join ([str (v) for v in row]) + '\n')
+
+
+def readText (path, delimiter = ','):
+    """ Reads a table written with writeText """
+    arr = np.genfromtxt (path, delimiter = delimiter, names = True, dtype = None, encoding = None)
+    return fromArray (np.atleast_1d (arr))
@@ -0,0 +1,132 @@
+"""
+Tab delimited text writer for the HRR model input files (step 5: channels, planes,
+output_calibration).
+
+Columns are formatted whole, one column and one block of rows at a time, and each block is
+written with a single write call, instead of one write per value and per delimiter. By default a
+value is written as str (value), so the files are byte for byte the ones written value by value;
+a column can be given a % format (e.g. '%.6f') instead, applied to the whole column at once.
+writeStream takes the rows block by block, so memory stays constant whatever the number of units.
+
+Step 5 builds its table as one structured array from a schema (schemaTable, fillRows). The step
+5 lists held Python values, so a float column could hold integers (the -999 defaults and nulls,
+integers read from the table), written as integers and divided as integers (floor, Python 2).
+Each float column read from the table has a flag column (name + '#int') marking those values;
+divide and textColumn follow them, so the files are the ones the lists gave.
+
+Hydro-Geo-Spatial Research Lab
+Website: http://www.northeastern.edu/beighley/home/
+"""
+
+import numbers
+import numpy as np
+
+flagSuffix = '#int'
+
+
+def formatColumn (values, fmt = None):
+    """ Strings of a column (list or array). fmt None: str (value) of each value (Python values,
+        mixed int/float columns keep their type per value); else a % format for the column. """
+    if fmt is None:
+        if isinstance (values, np.ndarray):
+            values = values.tolist ()
+        return list (map (str, values))
+    return np.char.mod (fmt, np.asarray (values)).tolist ()
+
+
+def blockText (columns, formats = None, delimiter = '\t'):
+    """ Text of a block of rows: columns is a list of equally long columns """
+    if formats is None:
+        formats = [None] * len (columns)
+    cols = [formatColumn (c, f) for c, f in zip (columns, formats)]
+    if not cols or not cols[0]:
+        return ''
+    return '\n'.join (map (delimiter.join, zip (*cols))) + '\n'
+
+
+def writeColumns (handle, columns, formats = None, blockRows = 65536, delimiter = '\t'):
+    """ Writes columns (lists or arrays, all the same length) as delimited rows to an open file,
+        blockRows rows per write """
+    numRows = len (columns[0]) if columns else 0
+    for r0 in range (0, numRows, blockRows):
+        handle.write (blockText ([c[r0:r0 + blockRows] for c in columns], formats, delimiter))
+
+
+def writeStream (handle, blocks, formats = None, delimiter = '\t'):
+    """ Streaming writeColumns: blocks yields lists of columns for consecutive rows, so only one
+        block is held in memory. Returns the number of rows written. """
+    numRows = 0
+    for columns in blocks:
+        handle.write (blockText (columns, formats, delimiter))
+        numRows += len (columns[0]) if columns else 0
+    return numRows
+
+
+def flagged (column):
+    """ (name, field, type, default, file) schema column that gets an integer flag """
+    return column[2] == 'f8' and column[1] is not None
+
+
+def schemaTable (schema, numRec):
+    """ Structured array of numRec rows holding the schema defaults, with the integer flags """
+    dtype = [(c[0], c[2]) for c in schema] + [(c[0] + flagSuffix, bool) for c in schema if flagged (c)]
+    table = np.zeros (numRec, dtype = dtype)
+    for c in schema:
+        table[c[0]] = c[3]
+        if flagged (c):
+            table[c[0] + flagSuffix] = isinstance (c[3], numbers.Integral)
+    return table
+
+
+def fillRows (table, schema, rows, nullFields = (), keyField = 'hrrID', null = -999):
+    """ Puts rows (tuples of the schema columns with a field, in schema order) into the table, at
+        row key, one column at a time. Columns in nullFields get null (an integer) where the value
+        is not of the column type (None, or an integer in a float column); the other columns keep
+        the default where the value is None. """
+    names = [c[0] for c in schema if c[1] is not None]
+    flags = set (c[0] for c in schema if flagged (c))
+    values = list (zip (*rows))
+    ids = np.array (values[names.index (keyField)], dtype = np.int64)
+    for name, raw in zip (names, values):
+        if name == keyField:
+            continue
+        isInt = np.array ([isinstance (v, numbers.Integral) for v in raw], dtype = bool)
+        isFloat = np.array ([isinstance (v, float) for v in raw], dtype = bool)
+        col = np.array ([v if v is not None else np.nan for v in raw], dtype = np.float64)
+        if name in nullFields:
+            bad = ~isFloat if name in flags else ~isInt
+            col[bad] = null
+            isInt |= bad
+        else:
+            bad = ~(isInt | isFloat)
+            col[bad] = table[name][ids[bad]]
+            if name in flags:
+                isInt[bad] = table[name + flagSuffix][ids[bad]]
+        table[name][ids] = col
+        if name in flags:
+            table[name + flagSuffix][ids] = isInt
+    return table
+
+
+def divide (table, name, divisor):
+    """ Divides a column by an integer, flagged integers with floor division (Python 2 int / int) """
+    col = table[name]
+    if name + flagSuffix in (table.dtype.names or ()):
+        table[name] = np.where (table[name + flagSuffix], np.floor_divide (col, divisor), col / float (divisor))
+    else:
+        table[name] = col / float (divisor)
+
+
+def textColumn (table, name):
+    """ Column to write: the array, or for a flagged column a list of Python values with the
+        flagged ones as integers (mixed columns for writeColumns and hrrBinary.write) """
+    col = table[name]
+    if name + flagSuffix not in (table.dtype.names or ()):
+        return col
+    flag = table[name + flagSuffix]
+    if not flag.any ():
+        return col
+    values = col.tolist ()
+    for i in np.nonzero (flag)[0].tolist ():
+        values[i] = int (values[i])
+    return values
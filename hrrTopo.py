@@ -0,0 +1,168 @@
+"""
+Channel network topology for the HRR tables (step 2).
+
+Units are stored at dense positions 0..n-1 (position = row of the input arrays). Grid codes and
+from/to node labels are remapped to those positions with sorted lookups, so every array has one
+entry per unit however large the labels are. Upstream units are kept in compressed sparse row
+(CSR) form: the units draining into unit i are up[ptr[i]:ptr[i+1]], any number of them.
+
+Cumulative fields are pushed downstream one topological level at a time (all units of a level at
+once), so the work is a few array operations per level and not a Python step per unit.
+Watershed IDs come from pointer jumping on the downstream pointers (log of the network depth
+passes over the arrays).
+
+Hydro-Geo-Spatial Research Lab
+Website: http://www.northeastern.edu/beighley/home/
+"""
+
+import numpy as np
+import hrrFlow
+
+
+def lookup (sortedCodes, perm, codes, missing = -1):
+    """ Positions of codes, given sortedCodes = labels[perm]; missing where a code is not found """
+    codes = np.asarray (codes)
+    i = np.searchsorted (sortedCodes, codes)
+    i[i >= sortedCodes.size] = 0
+    found = sortedCodes[i] == codes if sortedCodes.size else np.zeros (codes.shape, dtype = bool)
+    out = np.full (codes.shape, missing, dtype = np.int64)
+    out[found] = perm[i[found]]
+    return out
+
+
+def downstream (fromNode, toNode):
+    """ Position of the unit downstream of each unit, -1 at outlets. The unit downstream is the one
+        whose from node is the to node of the current unit. """
+    fromNode = np.asarray (fromNode, dtype = np.int64)
+    perm = np.argsort (fromNode, kind = 'mergesort')
+    return lookup (fromNode[perm], perm, np.asarray (toNode, dtype = np.int64))
+
+
+def upstream (down, order):
+    """ CSR upstream adjacency. Units draining into unit i are up[ptr[i]:ptr[i+1]], listed in the
+        order given by order (e.g. sorted on MAX). Returns (ptr, up)."""
+    n = down.size
+    d = down[order]
+    has = d >= 0
+    src = order[has]
+    perm = np.argsort (d[has], kind = 'mergesort') #stable, keeps the order within each unit
+    up = src[perm]
+    ptr = np.zeros (n + 1, dtype = np.int64)
+    ptr[1:] = np.cumsum (np.bincount (d[has], minlength = n))
+    return ptr, up
+
+
+def buildTopology (gridCode, fromNode, toNode, sortKeys):
+    """ Topology of a channel network.
+        sortKeys: list of arrays to order units by, most significant first (e.g. [MAX] or
+        [WID, CumArea]); ties keep the input order.
+        Returns dictionary of arrays, all one entry per unit:
+        gridCode, down (position, -1 outlet), order (positions in sort order), hrr (1..n in sort
+        order), sink (1..m for outlets in sort order, else 0), ptr/up (CSR upstream), numUp."""
+    gridCode = np.asarray (gridCode, dtype = np.int64)
+    n = gridCode.size
+    down = downstream (fromNode, toNode)
+
+    order = np.lexsort ([np.asarray (k) for k in reversed (sortKeys)])
+    hrr = np.zeros (n, dtype = np.int64)
+    hrr[order] = np.arange (1, n + 1)
+
+    outlets = order[down[order] < 0]
+    sink = np.zeros (n, dtype = np.int64)
+    sink[outlets] = np.arange (1, outlets.size + 1)
+
+    ptr, up = upstream (down, order)
+    return {'gridCode': gridCode,
+            'down': down,
+            'order': order,
+            'hrr': hrr,
+            'sink': sink,
+            'ptr': ptr,
+            'up': up,
+            'numUp': np.diff (ptr)
+            }
+
+
+def upColumns (topo, values, numCols = 4, fill = 0):
+    """ First numCols upstream units as columns (n x numCols) of values (e.g. grid codes or
+        HRR IDs), fill where there are fewer upstream units. """
+    n = topo['ptr'].size - 1
+    cols = np.full ((n, numCols), fill, dtype = np.asarray (values).dtype)
+    ptr = topo['ptr']
+    for k in range (numCols):
+        has = topo['numUp'] > k
+        cols[has, k] = values[topo['up'][ptr[:-1][has] + k]]
+    return cols
+
+
+def downValues (topo, values, fill = 0):
+    """ values of the downstream unit, fill at outlets """
+    out = np.full (topo['down'].size, fill, dtype = np.asarray (values).dtype)
+    has = topo['down'] >= 0
+    out[has] = values[topo['down'][has]]
+    return out
+
+
+def downFromIDs (ids, downIDs):
+    """ Position of the downstream unit from ID columns (grid codes or HRR IDs); a down ID of 0 or
+        one not in ids is an outlet (-1). """
+    ids = np.asarray (ids, dtype = np.int64)
+    perm = np.argsort (ids, kind = 'mergesort')
+    return lookup (ids[perm], perm, np.asarray (downIDs, dtype = np.int64))
+
+
+def levels (down):
+    """ Units by topological level, headwaters first: list of position arrays """
+    order, bounds = hrrFlow.flowLevels (down, np.ones (down.size, dtype = bool), np.int64)
+    return [order[bounds[k]:bounds[k + 1]] for k in range (len (bounds) - 1)]
+
+
+def accumulate (down, values, unitLevels = None):
+    """ Cumulative values: own value plus the values of all units upstream.
+        values: array of n, or n x k for k fields at once. unitLevels from levels (down) can be
+        passed in when several accumulations use the same network."""
+    if unitLevels is None:
+        unitLevels = levels (down)
+    cum = np.array (values, dtype = np.float64)
+    for cells in unitLevels:
+        d = down[cells]
+        has = d >= 0
+        np.add.at (cum, d[has], cum[cells[has]])
+    return cum
+
+
+def outlets (down):
+    """ Position of the terminal outlet of every unit, by pointer jumping. ValueError if the
+        downstream table has a cycle (units that never reach an outlet). """
+    root = np.where (down >= 0, down, np.arange (down.size))
+    #a chain of n units is resolved in log2 (n) jumps
+    for k in range (int (down.size).bit_length () + 1):
+        nxt = root[root]
+        if np.array_equal (nxt, root):
+            break
+        root = nxt
+    loop = np.nonzero (down[root] >= 0)[0]
+    if loop.size:
+        raise ValueError ('Downstream table has a cycle: ' + str (loop.size) + ' units never reach an outlet'
+                          ' (positions ' + ', '.join (str (u) for u in loop[:10]) + (' ...' if loop.size > 10 else '') + ')')
+    return root
+
+
+def assignWID (down, outletWID):
+    """ Watershed ID of every unit: the ID its outlet holds in outletWID (e.g. sink numbers) """
+    return np.asarray (outletWID)[outlets (down)]
+
+
+def widRanges (wid, order = None):
+    """ Units grouped by watershed. order: units in HRR_ID order (default: positions).
+        Returns (wids, ptr, units): the units of watershed wids[k] are units[ptr[k]:ptr[k+1]] in
+        HRR_ID order. Once HRR IDs are sorted on WID, each group is the HRR_ID range
+        ptr[k]+1 .. ptr[k+1]. """
+    wid = np.asarray (wid)
+    if order is None:
+        order = np.arange (wid.size)
+    units = order[np.argsort (wid[order], kind = 'mergesort')]
+    wids, first, count = np.unique (wid[units], return_index = True, return_counts = True)
+    ptr = np.zeros (wids.size + 1, dtype = np.int64)
+    ptr[1:] = np.cumsum (count)
+    return wids, ptr, units
@@ -0,0 +1,255 @@
+"""
+Zonal statistics engine for the HRR setup (replaces one ZonalStatisticsAsTable call per statistic).
+
+All value rasters are summarised over the catchment label raster (Watersheds grid, label = GRIDCODE)
+in one pass. Each block of labels and values is reduced with bincount, so the statistics of every
+raster come from the same scan, and blocks can come from a whole array or from tiled stores
+(hrrRaster), one tile of the zone grid in memory at a time.
+
+Statistics: COUNT, SUM, MEAN, MIN, MAX (the default set) and MAJORITY. MAJORITY is for integer
+rasters such as land cover only: it counts (zone, value) pairs, one sort per block, so its cost
+grows with the distinct values in each zone. The result is one structured array keyed by GRIDCODE, with fields named <raster>_<STAT>.
+
+Hydro-Geo-Spatial Research Lab
+Website: http://www.northeastern.edu/beighley/home/
+"""
+
+import os.path, shutil
+import numpy as np
+import hrrRaster
+
+allStats = ['COUNT', 'SUM', 'MEAN', 'MIN', 'MAX', 'MAJORITY']
+numericStats = ['COUNT', 'SUM', 'MEAN', 'MIN', 'MAX'] # default: no MAJORITY
+
+
+def newAccumulator (names, stats):
+    """ Empty accumulator; grows as larger zone labels show up """
+    acc = {'size': 0, 'names': list (names), 'stats': stats, 'seen': np.zeros (0, dtype = np.int64)}
+    for name in names:
+        acc[name] = {'count': np.zeros (0, dtype = np.int64),
+                     'sum': np.zeros (0, dtype = np.float64),
+                     'min': np.zeros (0, dtype = np.float64),
+                     'max': np.zeros (0, dtype = np.float64),
+                     'major': [] #(zone, value) keys and their counts, one pair of arrays per block
+                     }
+    return acc
+
+
+def growAccumulator (acc, size):
+    """ Makes room for zone labels < size """
+    if size <= acc['size']:
+        return
+    extra = size - acc['size']
+    acc['seen'] = np.concatenate ([acc['seen'], np.zeros (extra, dtype = np.int64)])
+    for name in acc['names']:
+        a = acc[name]
+        a['count'] = np.concatenate ([a['count'], np.zeros (extra, dtype = np.int64)])
+        a['sum'] = np.concatenate ([a['sum'], np.zeros (extra)])
+        a['min'] = np.concatenate ([a['min'], np.full (extra, np.inf)])
+        a['max'] = np.concatenate ([a['max'], np.full (extra, -np.inf)])
+    acc['size'] = size
+
+
+def addBlock (acc, zones, values, nodata = None):
+    """ Adds one block to the accumulator.
+        zones: label array, labels <= 0 are not zones. values: {name: array} of the same shape.
+        nodata: {name: nodata value}; nodata and NaN cells are skipped, as with the DATA option."""
+    if nodata is None:
+        nodata = {}
+    z = np.asarray (zones).ravel ()
+    for name in acc['names']:
+        if np.size (values[name]) != z.size:
+            raise ValueError ('Value array ' + name + ' is not the size of the zone array')
+    inZone = z > 0
+    if not inZone.any ():
+        return
+    z = z[inZone].astype (np.int64)
+    growAccumulator (acc, int (z.max ()) + 1)
+    size = acc['size']
+    acc['seen'] += np.bincount (z, minlength = size)
+
+    for name in acc['names']:
+        v = np.asarray (values[name]).ravel ()[inZone]
+        ok = np.isfinite (v)
+        if nodata.get (name) is not None:
+            ok &= v != nodata[name]
+        zk = z[ok]
+        vk = v[ok].astype (np.float64)
+        a = acc[name]
+        a['count'] += np.bincount (zk, minlength = size)
+        a['sum'] += np.bincount (zk, weights = vk, minlength = size)
+        if 'MIN' in acc['stats']:
+            np.minimum.at (a['min'], zk, vk)
+        if 'MAX' in acc['stats']:
+            np.maximum.at (a['max'], zk, vk)
+        if 'MAJORITY' in acc['stats'] and vk.size:
+            iv = vk.astype (np.int64)
+            if not np.array_equal (iv, vk) or iv.min () < -2 ** 31 or iv.max () >= 2 ** 31:
+                raise ValueError ('MAJORITY needs an integer raster, ' + name + ' has other values')
+            #Count (zone, value) pairs: one key per pair, one sort
+            a['major'].append (np.unique (zk * 2 ** 32 + (iv + 2 ** 31), return_counts = True))
+
+
+def majority (parts, gridcode):
+    """ Most frequent value of each zone from the (keys, counts) of addBlock; ties go to the
+        lowest value. NaN for zones without pairs. """
+    keys = np.concatenate ([k for k, n in parts])
+    num = np.concatenate ([n for k, n in parts])
+    if len (parts) > 1:
+        keys, inv = np.unique (keys, return_inverse = True)
+        num = np.bincount (inv, weights = num).astype (np.int64)
+    zone = keys // 2 ** 32
+    value = keys % 2 ** 32 - 2 ** 31
+    order = np.lexsort ((value, -num, zone))
+    first = np.ones (order.size, dtype = bool)
+    first[1:] = zone[order][1:] != zone[order][:-1]
+    pick = order[first]
+    out = np.full (gridcode.size, np.nan)
+    out[np.searchsorted (gridcode, zone[pick])] = value[pick]
+    return out
+
+
+def finishTable (acc, zoneField = 'GRIDCODE'):
+    """ Structured array, one row per zone with data, keyed by zoneField """
+    gridcode = np.nonzero (acc['seen'])[0]
+    dtype = [(zoneField, np.int32)]
+    for name in acc['names']:
+        for stat in acc['stats']:
+            dtype.append (((name + '_' + stat)[:32], np.int64 if stat == 'COUNT' else np.float64))
+
+    table = np.zeros (gridcode.size, dtype = dtype)
+    table[zoneField] = gridcode
+    for name in acc['names']:
+        a = acc[name]
+        count = a['count'][gridcode]
+        has = count > 0
+        for stat in acc['stats']:
+            field = (name + '_' + stat)[:32]
+            if stat == 'COUNT':
+                table[field] = count
+                continue
+            col = np.full (gridcode.size, np.nan)
+            if stat == 'SUM':
+                col[has] = a['sum'][gridcode][has]
+            elif stat == 'MEAN':
+                col[has] = a['sum'][gridcode][has] / count[has]
+            elif stat == 'MIN':
+                col[has] = a['min'][gridcode][has]
+            elif stat == 'MAX':
+                col[has] = a['max'][gridcode][has]
+            elif stat == 'MAJORITY' and a['major']:
+                col[has] = majority (a['major'], gridcode)[has]
+            table[field] = col
+    return table
+
+
+def zonalStats (zones, values, stats = None, nodata = None, zoneField = 'GRIDCODE'):
+    """ Zonal statistics of several value arrays over one zone array, in one pass.
+        values: {name: array} of the zone array's shape. stats: default numericStats.
+        Returns structured array keyed by zoneField."""
+    if stats is None:
+        stats = numericStats
+    acc = newAccumulator (sorted (values.keys ()), stats)
+    addBlock (acc, zones, values, nodata)
+    return finishTable (acc, zoneField)
+
+
+def zonalStatsTiles (zoneStore, valueStores, stats = None, zoneField = 'GRIDCODE'):
+    """ Zonal statistics over tiled stores (hrrRaster.createTiles) on the same grid, one zone tile
+        and the same window of each value store in memory at a time. valueStores: {name: store}. """
+    if stats is None:
+        stats = numericStats
+    names = sorted (valueStores.keys ())
+    nodata = dict ((n, valueStores[n]['header'].get ('NODATA_value')) for n in names)
+    acc = newAccumulator (names, stats)
+    for ti, tj, zones in hrrRaster.iterBlocks (zoneStore):
+        zones = zones.astype (np.int64)
+        zones[~hrrRaster.nodataMask (zones, zoneStore['header'])] = 0
+        r0, r1, c0, c1 = hrrRaster.tileWindow (zoneStore, ti, tj)
+        addBlock (acc, zones, dict ((n, hrrRaster.readWindow (valueStores[n], r0, r1, c0, c1)) for n in names), nodata)
+    return finishTable (acc, zoneField)
+
+
+def zonalStatsRasters (zoneRaster, valueRasters, stats = None, zoneField = 'GRIDCODE', tileFolder = None,
+                       tileSize = 2048):
+    """ Zonal statistics from raster paths (ESRI ASCII grids, tiled stores or arcpy rasters) on the
+        same grid. valueRasters: {name: path}. ValueError if a value raster is on another grid (size,
+        corner or cell size), where ZonalStatisticsAsTable would resample it.
+        With tileFolder, rasters that are not tiled stores are first copied tile by tile to stores
+        there (removed afterwards), and the statistics are taken one tile at a time; if all rasters
+        are stores already, no copy is made. Otherwise the grids are read whole. """
+    paths = [zoneRaster] + list (valueRasters.values ())
+    if tileFolder is not None or all (hrrRaster.isTiles (p) for p in paths):
+        zHdr = hrrRaster.readHeader (zoneRaster)
+        for path in valueRasters.values ():
+            if not hrrRaster.sameGrid (zHdr, hrrRaster.readHeader (path)):
+                raise ValueError ('Raster ' + str (path) + ' is not on the grid of the zone raster ' + str (zoneRaster))
+        copies = []
+
+        def store (path, name, dtype):
+            if hrrRaster.isTiles (path):
+                return hrrRaster.openTiles (path)
+            copies.append (os.path.join (tileFolder, name + '_tiles'))
+            return hrrRaster.rasterToTiles (path, copies[-1], dtype, tileSize)
+
+        try:
+            zoneStore = store (zoneRaster, 'zones', np.float64)
+            valueStores = dict ((n, store (p, n, np.float64)) for n, p in valueRasters.items ())
+            return zonalStatsTiles (zoneStore, valueStores, stats, zoneField)
+        finally:
+            for path in copies:
+                shutil.rmtree (path, True)
+
+    zones, zHdr = hrrRaster.readRaster (zoneRaster, np.int64)
+    zones[~hrrRaster.nodataMask (zones, zHdr)] = 0
+    values = {}
+    nodata = {}
+    for name, path in valueRasters.items ():
+        values[name], hdr = hrrRaster.readRaster (path)
+        if not hrrRaster.sameGrid (zHdr, hdr):
+            raise ValueError ('Raster ' + str (path) + ' is not on the grid of the zone raster ' + str (zoneRaster))
+        nodata[name] = hdr.get ('NODATA_value')
+    return zonalStats (zones, values, stats, nodata, zoneField)
+
+
+def subTable (zonalTable, fields, rename = None, zoneField = 'GRIDCODE'):
+    """ New table with the zone field and the listed fields; rename: {old name: new name},
+        e.g. {'kSat_MEAN': 'kSat'} to fit dbf field names."""
+    if rename is None:
+        rename = {}
+    names = [zoneField] + list (fields)
+    dtype = [(rename.get (n, n), zonalTable.dtype[n]) for n in names]
+    out = np.zeros (zonalTable.size, dtype = dtype)
+    for n in names:
+        out[rename.get (n, n)] = zonalTable[n]
+    return out
+
+
+def saveTable (path, zonalTable):
+    """ Saves a zonal table as a dbf or GDB table, with arcpy """
+    import arcpy
+    if arcpy.Exists (path):
+        arcpy.Delete_management (path)
+    arcpy.da.NumPyArrayToTable (zonalTable, path)
+
+
+def joinTable (table, zonalTable, fields = None, rename = None, zoneField = 'GRIDCODE'):
+    """ Joins zonal statistics to an HRR table (dbf or GDB table) on the grid code, with arcpy """
+    import arcpy
+    if fields is not None:
+        zonalTable = subTable (zonalTable, fields, rename, zoneField)
+    gc = None
+    for f in arcpy.ListFields (table):
+        if f.name.upper () in ('GRID_CODE', 'GRIDCODE'):
+            gc = f.name
+    arcpy.da.ExtendTable (table, gc, zonalTable, zoneField, append_only = False)
+
+
+def writeTable (path, zonalTable, fmt = '%.8g'):
+    """ Writes a zonal table to comma delimited text """
+    names = zonalTable.dtype.names
+    with open (path, 'w') as handle:
+        handle.write (','.join (names) + '\n')
+        for row in zonalTable:
+            handle.write (','.join ([str (int (row[n])) if np.issubdtype (zonalTable.dtype[n], np.integer)
+                                     else fmt % row[n] for n in names]) + '\n')
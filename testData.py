@@ -0,0 +1,36 @@
+"""
+Synthetic inputs shared by the tests.
+"""
+
+import numpy as np
+import hrrFlow
+
+
+def randomDrainage (nrows, ncols, seed = 0):
+    """ fdir to the lowest lower neighbour of a tilted random DEM (0 in pits) and facc as the
+        number of cells upstream (ArcGIS FlowAccumulation) """
+    rng = np.random.RandomState (seed)
+    dem = rng.random_sample ((nrows, ncols)) * 3 + np.arange (nrows)[::-1, None] * 1.0
+    fdir = np.zeros ((nrows, ncols), dtype = np.int32)
+    for r in range (nrows):
+        for c in range (ncols):
+            best, drop = 0, 0.0
+            for code, (dr, dc) in hrrFlow.D8.items ():
+                rr, cc = r + dr, c + dc
+                if 0 <= rr < nrows and 0 <= cc < ncols:
+                    d = (dem[r, c] - dem[rr, cc]) / np.hypot (dr, dc)
+                elif rr >= nrows:
+                    d = 1e9 + code # off the south edge
+                else:
+                    continue
+                if d > drop:
+                    best, drop = code, d
+            fdir[r, c] = best
+    down, valid = hrrFlow.downIndex (fdir)
+    facc = np.zeros (fdir.size)
+    for k in np.nonzero (valid)[0]:
+        u = down[k]
+        while u >= 0:
+            facc[u] += 1
+            u = down[u]
+    return fdir, facc.reshape (fdir.shape)
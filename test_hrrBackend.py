@@ -0,0 +1,105 @@
+"""
+Checks the NumPy backend against the arcpy tools it stands in for: ExtractByRectangle (INSIDE) as a
+slice of the input, AddField and a join on the grid code, and RasterToPolygon + Dissolve on GRIDCODE
+as one polygon per zone covering the cell centers of that zone and no others.
+"""
+
+import json, os, shutil, tempfile, unittest
+from collections import OrderedDict
+import numpy as np
+import hrrBackend, hrrRaster, hrrTable
+
+
+def inside (geom, x, y):
+    """ Whether the point is in the (Multi)Polygon, even-odd over all rings """
+    polygons = [geom['coordinates']] if geom['type'] == 'Polygon' else geom['coordinates']
+    count = 0
+    for ring in [r for p in polygons for r in p]:
+        for (x0, y0), (x1, y1) in zip (ring[:-1], ring[1:]):
+            if (y0 > y) != (y1 > y) and x0 + (y - y0) * (x1 - x0) / (y1 - y0) > x:
+                count += 1
+    return count % 2 == 1
+
+
+def area (geom):
+    polygons = [geom['coordinates']] if geom['type'] == 'Polygon' else geom['coordinates']
+    total = 0.0
+    for ring in [r for p in polygons for r in p]:
+        xy = np.array (ring)
+        total += (xy[:-1, 0] * xy[1:, 1] - xy[1:, 0] * xy[:-1, 1]).sum () / 2.0
+    return total
+
+
+class NumpyBackendTest (unittest.TestCase):
+
+    def setUp (self):
+        self.folder = tempfile.mkdtemp ()
+        self.gp = hrrBackend.get ('numpy', workspace = self.folder)
+        self.header = {'ncols': 15, 'nrows': 12, 'xllcorner': 100.0, 'yllcorner': 200.0, 'cellsize': 30.0,
+                       'NODATA_value': -9999}
+
+    def tearDown (self):
+        shutil.rmtree (self.folder)
+
+    def write (self, name, arr, **header):
+        hrrRaster.writeAscii (os.path.join (self.folder, name + '.asc'), arr, dict (self.header, **header))
+
+    def features (self, name):
+        with open (os.path.join (self.folder, name), 'r') as handle:
+            return json.load (handle)['features']
+
+    def test_extract_by_extent (self):
+        arr = np.arange (180, dtype = np.float64).reshape (12, 15)
+        self.write ('big', arr)
+        # template from column 3 to 9 and row 2 to 7, corners half a cell off the grid
+        self.write ('small', np.zeros ((5, 6)), ncols = 6, nrows = 5, xllcorner = 100.0 + 3.4 * 30,
+                    yllcorner = 200.0 + 4.6 * 30)
+        self.gp.extractByExtent ('big', 'small', 'out')
+        out, hdr = self.gp.readRaster ('out')
+        np.testing.assert_array_equal (out, arr[2:7, 3:9])
+        self.assertAlmostEqual (hdr['xllcorner'], 190.0)
+        self.assertAlmostEqual (hdr['yllcorner'], 350.0)
+
+    def test_fields_and_join (self):
+        table = OrderedDict ([('GRIDCODE', np.array ([4, 2, 9])), ('Area', np.array ([1.5, 2.5, 3.5]))])
+        hrrTable.writeText (table, os.path.join (self.folder, 'HRR.csv'))
+        self.gp.addFields ('HRR.dbf', [('LC', 'SHORT'), ('Area', 'DOUBLE')])
+        zonal = np.array ([(2, 7, 0.25), (4, 3, 0.75)], dtype = [('GRIDCODE', np.int32), ('lc_MAJORITY', np.int32),
+                                                               ('lc_MEAN', np.float64)])
+        self.gp.joinFields ('HRR.dbf', zonal, ['lc_MAJORITY'], {'lc_MAJORITY': 'LC'})
+        out = self.gp.readTable ('HRR.dbf')
+        self.assertEqual (list (out.keys ()), ['GRIDCODE', 'Area', 'LC'])
+        self.assertEqual (out['LC'].tolist (), [3, 7, 0])
+        self.assertEqual (out['Area'].tolist (), [1.5, 2.5, 3.5])
+
+    def test_zone_features (self):
+        rng = np.random.RandomState (5)
+        labels = rng.randint (0, 4, (12, 15))
+        labels[4:9, 4:10] = 5
+        labels[6, 6] = 6 # hole in zone 5
+        labels[0, 0] = labels[1, 1] = 7 # corner only
+        labels[-1, -1] = -9999
+        self.write ('zones', labels)
+        self.gp.zoneFeatures ('zones', 'Catchments.json')
+        features = self.features ('Catchments.json')
+        codes = [f['properties']['GRIDCODE'] for f in features]
+        self.assertEqual (codes, sorted (set (labels[labels > 0].tolist ())))
+        cs = self.header['cellsize']
+        for f in features:
+            code, geom = f['properties']['GRIDCODE'], f['geometry']
+            self.assertAlmostEqual (area (geom), (labels == code).sum () * cs * cs)
+            for r in range (12):
+                for c in range (15):
+                    x, y = 100.0 + (c + 0.5) * cs, 200.0 + (12 - r - 0.5) * cs
+                    self.assertEqual (inside (geom, x, y), labels[r, c] == code)
+        geoms = dict ((f['properties']['GRIDCODE'], f['geometry']) for f in features)
+        self.assertEqual (geoms[6]['type'], 'Polygon')
+        self.assertEqual (geoms[7]['type'], 'MultiPolygon')
+        self.assertEqual (len (geoms[7]['coordinates']), 2)
+        self.assertEqual (geoms[5], {'type': 'Polygon', 'coordinates': [
+            [[220.0, 290.0], [400.0, 290.0], [400.0, 440.0], [220.0, 440.0], [220.0, 290.0]],
+            [[280.0, 380.0], [310.0, 380.0], [310.0, 350.0], [280.0, 350.0], [280.0, 380.0]]]})
+
+
+if __name__ == '__main__':
+    unittest.main ()
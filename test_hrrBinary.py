@@ -0,0 +1,73 @@
+"""
+Checks hrrBinary against the text tables of step 5: columns written to a binary table and made
+back into text must give the file the original step 5 loop writes (str of each value, tab
+delimited), and the memory-mapped columns must hold the same values.
+"""
+
+import os, shutil, tempfile, unittest
+import numpy as np
+import hrrBinary
+
+
+def textReference (columns, firstLine = None):
+    """ The step 5 writer: str of each value, tabs between columns, one line per row """
+    lines = [] if firstLine is None else [firstLine]
+    for row in zip (*columns):
+        lines.append ('\t'.join (str (v) for v in row) + '\n')
+    return ''.join (lines)
+
+
+class BinaryTest (unittest.TestCase):
+
+    def setUp (self):
+        self.folder = tempfile.mkdtemp ()
+        rng = np.random.RandomState (6)
+        n = 23
+        self.names = ['HRR_ID', 'slope', 'kSat', 'LC']
+        self.columns = [list (range (1, n + 1)),
+                        [float (v) for v in rng.random_sample (n)],
+                        [-999 if k % 5 == 0 else float (v) for k, v in enumerate (rng.random_sample (n) * 10)],
+                        [int (v) for v in rng.randint (1, 17, n)]]
+
+    def tearDown (self):
+        shutil.rmtree (self.folder)
+
+    def test_round_trip (self):
+        path = os.path.join (self.folder, 'planes.hrrb')
+        hrrBinary.write (path, self.names, self.columns)
+        table = hrrBinary.read (path)
+        self.assertEqual (list (table.keys ()), self.names)
+        self.assertEqual (table['HRR_ID'].dtype, np.int64)
+        self.assertEqual (table['kSat'].dtype, np.float64)
+        for name, values in zip (self.names, self.columns):
+            self.assertEqual (np.asarray (table[name]).tolist (), [float (v) if name == 'kSat' else v for v in values])
+        self.assertIn ('kSat' + hrrBinary.flagSuffix, hrrBinary.read (path, flags = True))
+
+        out = os.path.join (self.folder, 'planes.txt')
+        hrrBinary.toText (path, out, firstLine = '23\n', blockRows = 5)
+        with open (out, 'r') as handle:
+            self.assertEqual (handle.read (), textReference (self.columns, '23\n'))
+
+    def test_layout (self):
+        path = os.path.join (self.folder, 'channels.hrrb')
+        hrrBinary.write (path, self.names, self.columns)
+        numRows, schema = hrrBinary.readSchema (path)
+        self.assertEqual (numRows, 23)
+        for name, dtype, off, nbytes in schema:
+            self.assertEqual (off % 8, 0)
+            self.assertEqual (nbytes, 23 * np.dtype (dtype).itemsize)
+        with open (path, 'rb') as handle:
+            self.assertEqual (handle.read (8), hrrBinary.magic)
+
+    def test_errors (self):
+        with self.assertRaises (ValueError):
+            hrrBinary.write (os.path.join (self.folder, 'bad.hrrb'), ['a', 'b'], [[1, 2], [1.5]])
+        text = os.path.join (self.folder, 'planes.txt')
+        with open (text, 'w') as handle:
+            handle.write ('1\t2\n')
+        with self.assertRaises (ValueError):
+            hrrBinary.read (text)
+
+
+if __name__ == '__main__':
+    unittest.main ()
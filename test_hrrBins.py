@@ -0,0 +1,109 @@
+"""
+Checks hrrBins against unit averages taken cell by cell from the overlay weights, nodata cells
+left out and the weights of the others rescaled, and the bin file written and read back.
+
+The layouts are those hrrBins documents; main_P_ET_v1_GCM.f90 and bins written by it are not at
+hand to check them, so inputs that do not fit them must be refused, not read.
+"""
+
+import os, shutil, tempfile, unittest
+import numpy as np
+import hrrBins
+
+
+def reference (series, units, nodata):
+    """ (time steps x units) from [[(cell, weight), ...] per unit] """
+    out = np.zeros ((series.shape[0], len (units)))
+    for t in range (series.shape[0]):
+        for u, pairs in enumerate (units):
+            total = sum (w for c, w in pairs)
+            good = [(c, w) for c, w in pairs if series[t, c] != nodata]
+            wsum = sum (w for c, w in good)
+            if wsum > 0:
+                out[t, u] = sum (w * series[t, c] for c, w in good) * total / wsum
+    return out
+
+
+class BinsTest (unittest.TestCase):
+
+    def setUp (self):
+        rng = np.random.RandomState (4)
+        self.series = rng.random_sample ((50, 9)) * 5
+        self.series[rng.random_sample (self.series.shape) < 0.15] = -9999
+        self.series[:, 6] = -9999
+        # HRR_ID 1..5, unit 4 without cells, unit 5 only on the nodata cell
+        self.units = [[(0, 0.25), (3, 0.75)], [(1, 0.5), (2, 0.3), (8, 0.2)], [(4, 1.0)], [], [(6, 1.0)]]
+        self.folder = tempfile.mkdtemp ()
+        self.overlay = os.path.join (self.folder, 'Grid_overlay_TRMM.txt')
+        with open (self.overlay, 'w') as handle:
+            for u, pairs in enumerate (self.units):
+                if pairs:
+                    handle.write ('%d %d ' % (u + 1, len (pairs)) + ' '.join ('%d %.3f' % (c + 1, w) for c, w in pairs) + '\n')
+
+    def tearDown (self):
+        shutil.rmtree (self.folder)
+
+    def test_unit_averages (self):
+        ptr, cells, weights = hrrBins.readOverlay (self.overlay, 5)
+        self.assertEqual (ptr.tolist (), [0, 2, 5, 6, 6, 7])
+        out = hrrBins.unitAverages (self.series, ptr, cells, weights, -9999)
+        np.testing.assert_allclose (out, reference (self.series, self.units, -9999), rtol = 1e-12)
+        self.assertFalse (out[:, 3].any () or out[:, 4].any ())
+
+    def test_no_nodata_unchanged (self):
+        series = np.abs (self.series)
+        ptr, cells, weights = hrrBins.readOverlay (self.overlay, 5)
+        out = hrrBins.unitAverages (series, ptr, cells, weights, -9999)
+        has = np.diff (ptr) > 0
+        np.testing.assert_array_equal (out[:, has], np.add.reduceat (series[:, cells] * weights, ptr[:-1][has], axis = 1))
+        self.assertFalse (out[:, ~has].any ())
+
+    def test_make_bins (self):
+        inputFile = os.path.join (self.folder, 'input_P_ET.txt')
+        with open (inputFile, 'w') as handle:
+            handle.write ('5\n90\n\n2001\n0\n0\n')
+        metFile = os.path.join (self.folder, 'series.txt')
+        np.savetxt (metFile, self.series, fmt = '%.6f')
+        binPath = os.path.join (self.folder, 'P.bin')
+        n = hrrBins.makeBins (inputFile, self.overlay, metFile, binPath, blockSteps = 16, stepsPerRecord = 2,
+                              nodata = -9999)
+        self.assertEqual (n, 90)
+        bins = hrrBins.readBins (binPath, 5)
+        ref = np.repeat (reference (self.series, self.units, -9999), 2, axis = 0)[:90]
+        np.testing.assert_allclose (bins, ref, rtol = 1e-6, atol = 1e-5)
+
+    def write (self, name, text):
+        path = os.path.join (self.folder, name)
+        with open (path, 'w') as handle:
+            handle.write (text)
+        return path
+
+    def test_refused_overlays (self):
+        for text in ('1 2 3 0.5\n', '1 1 3 0.5\n', '1 x 3 1.0\n', '1 1 0 1.0\n', '1 1 3 1.0\n1 1 4 1.0\n',
+                     '9 1 3 1.0\n', '1 2 3 0.25 4 0.5\n'):
+            with self.assertRaises (ValueError):
+                hrrBins.readOverlay (self.write ('bad.txt', text), 5)
+        # weights rounded to 3 decimals by Step6 sum to 1 within the rounding
+        ptr, cells, weights = hrrBins.readOverlay (self.write ('ok.txt', '2 3 1 0.333 2 0.333 3 0.333\n'), 5)
+        self.assertEqual (ptr.tolist (), [0, 0, 3, 3, 3, 3])
+
+    def test_refused_series (self):
+        inputFile = self.write ('input_P_ET.txt', '5\n50\n\n2001\n0\n0\n')
+        binPath = os.path.join (self.folder, 'P.bin')
+        for name in ('3B42_daily.2001.01.01.7.bin', 'series.bin', 'series.dat'):
+            self.series.astype ('<f4').tofile (os.path.join (self.folder, name))
+            with self.assertRaises (ValueError):
+                hrrBins.makeBins (inputFile, self.overlay, os.path.join (self.folder, name), binPath)
+        narrow = os.path.join (self.folder, 'narrow.npy')
+        np.save (narrow, self.series[:, :8]) # overlay uses met cell 9
+        ragged = self.write ('ragged.txt', '1 2 3 4 5 6 7 8 9\n' * 3 + '1 2 3 4 5 6 7 8\n')
+        for metFile, blockSteps in ((narrow, 16), (ragged, 3)):
+            with self.assertRaises (ValueError):
+                hrrBins.makeBins (inputFile, self.overlay, metFile, binPath, blockSteps)
+        np.save (narrow, self.series.ravel ())
+        with self.assertRaises (ValueError):
+            hrrBins.makeBins (inputFile, self.overlay, narrow, binPath)
+
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,115 @@
+"""
+Checks hrrFlow against StreamLink, Watershed and FlowLength worked out cell by cell: each cell's
+neighbours are scanned for the ones flowing into it and flow paths are walked one step at a time.
+"""
+
+import unittest
+import numpy as np
+import hrrFlow
+from testData import randomDrainage
+
+
+def downCell (fdir, r, c):
+    """ (row, column) the cell drains to, None where it leaves the grid or has no direction """
+    step = hrrFlow.D8.get (int (fdir[r, c]))
+    if step is None:
+        return None
+    rr, cc = r + step[0], c + step[1]
+    if 0 <= rr < fdir.shape[0] and 0 <= cc < fdir.shape[1] and int (fdir[rr, cc]) in hrrFlow.D8:
+        return rr, cc
+    return None
+
+
+def referenceNetwork (fdir, facc, threshold):
+    """ link and basin grids; links keyed by their head cell """
+    nrows, ncols = fdir.shape
+    stream = (facc >= threshold) & np.isin (fdir, list (hrrFlow.D8.keys ()))
+    up = dict (((r, c), []) for r in range (nrows) for c in range (ncols))
+    for r in range (nrows):
+        for c in range (ncols):
+            d = downCell (fdir, r, c)
+            if d is not None and stream[r, c] and stream[d]:
+                up[d].append ((r, c))
+    link = np.zeros (fdir.shape, dtype = np.int64)
+    for r in range (nrows):
+        for c in range (ncols):
+            if stream[r, c]:
+                cell = (r, c)
+                while len (up[cell]) == 1:
+                    cell = up[cell][0]
+                link[r, c] = cell[0] * ncols + cell[1] + 1
+    basin = np.zeros (fdir.shape, dtype = np.int64)
+    for r in range (nrows):
+        for c in range (ncols):
+            cell = (r, c)
+            while cell is not None and not stream[cell]:
+                cell = downCell (fdir, cell[0], cell[1])
+            if cell is not None:
+                basin[r, c] = link[cell]
+    return link, basin
+
+
+def referenceUpd (fdir, keep, cs):
+    """ Downstream plus longest upstream flow length of each kept cell, -1 elsewhere """
+    nrows, ncols = fdir.shape
+    downl = np.zeros (fdir.shape)
+    upl = np.zeros (fdir.shape)
+    for r in range (nrows):
+        for c in range (ncols):
+            if not keep[r, c]:
+                continue
+            cell, dist = (r, c), 0.0
+            while True:
+                upl[cell] = max (upl[cell], dist)
+                d = downCell (fdir, cell[0], cell[1])
+                if d is None or not keep[d]:
+                    break
+                dr, dc = hrrFlow.D8[int (fdir[cell])]
+                dist += np.hypot (dr, dc) * cs
+                cell = d
+            downl[r, c] = dist
+    return np.where (keep, downl + upl, -1)
+
+
+def sameLabels (a, b):
+    """ Whether two label grids split the cells the same way (0 matching 0) """
+    pairs = set (zip (a.ravel ().tolist (), b.ravel ().tolist ()))
+    return len (pairs) == len (set (p[0] for p in pairs)) == len (set (p[1] for p in pairs)) and \
+        all ((p[0] == 0) == (p[1] == 0) for p in pairs)
+
+
+class FlowTest (unittest.TestCase):
+
+    def setUp (self):
+        self.fdir, self.facc = randomDrainage (40, 35, seed = 2)
+        self.fdir[10:13, 20:23] = 0 # a nodata patch the flow stops at
+
+    def test_stream_network (self):
+        for threshold in (3, 15, 50):
+            link, basin = hrrFlow.streamNetwork (self.fdir, self.facc, threshold)
+            refLink, refBasin = referenceNetwork (self.fdir, self.facc, threshold)
+            self.assertTrue (sameLabels (link, refLink))
+            self.assertTrue (sameLabels (basin, refBasin))
+            n = np.unique (link[link > 0]).size
+            self.assertEqual (sorted (np.unique (link[link > 0]).tolist ()), list (range (1, n + 1)))
+            # heads are numbered from the headwaters down: no link drains to a lower number
+            down, valid = hrrFlow.downIndex (self.fdir)
+            flat = link.ravel ()
+            cells = np.nonzero ((flat > 0) & (down >= 0))[0]
+            below = flat[down[cells]]
+            self.assertTrue (np.all ((below == 0) | (below >= flat[cells])))
+
+    def test_upd_length (self):
+        upd = hrrFlow.updLength (self.fdir, self.facc, 4, 90.0)
+        keep = (self.facc > 4) & np.isin (self.fdir, list (hrrFlow.D8.keys ()))
+        np.testing.assert_allclose (upd, referenceUpd (self.fdir, keep, 90.0), rtol = 1e-12)
+
+    def test_loop (self):
+        fdir = np.array ([[1, 16, 4], [4, 4, 4]], dtype = np.int32)
+        down, valid = hrrFlow.downIndex (fdir)
+        order, bounds = hrrFlow.flowLevels (down, valid)
+        self.assertEqual (sorted (order.tolist ()), [2, 3, 4, 5])
+
+
+if __name__ == '__main__':
+    unittest.main ()
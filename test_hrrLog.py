@@ -0,0 +1,59 @@
+"""
+Checks hrrLog: nested step paths, counted items, failed steps, warnings, the JSON lines log file and
+the summary by step.
+"""
+
+import os, io, shutil, tempfile, unittest
+import hrrLog
+
+
+class LogTest (unittest.TestCase):
+
+    def setUp (self):
+        self.folder = tempfile.mkdtemp ()
+        self.saved = (hrrLog.logFile, hrrLog.echo, os.environ.get ('HRR_LOG'))
+        hrrLog.configure (os.path.join (self.folder, 'log', 'steps.jsonl'), echoSteps = False)
+        del hrrLog.records[:]
+
+    def tearDown (self):
+        hrrLog.configure (self.saved[0], self.saved[1])
+        if self.saved[2] is not None:
+            os.environ['HRR_LOG'] = self.saved[2]
+        del hrrLog.records[:]
+        shutil.rmtree (self.folder)
+
+    def test_steps (self):
+        @hrrLog.step ('fill')
+        def fill (n):
+            hrrLog.count (n, 'units')
+            return n
+
+        with hrrLog.step ('Step5'):
+            fill (3)
+            fill (4)
+            hrrLog.warning ('2 cells are in flow direction loops and are skipped')
+            with self.assertRaises (ValueError):
+                with hrrLog.step ('write', 10, 'cells'):
+                    raise ValueError ('disk full')
+        self.assertEqual (os.environ['HRR_LOG'], hrrLog.logFile)
+        recs = hrrLog.readLog (hrrLog.logFile)
+        self.assertEqual ([r['step'] for r in recs], ['Step5/fill', 'Step5/fill', 'Step5', 'Step5/write', 'Step5'])
+        self.assertEqual (recs[2]['warning'], '2 cells are in flow direction loops and are skipped')
+        del recs[2]
+        self.assertEqual ([r['status'] for r in recs], ['ok', 'ok', 'ValueError', 'ok'])
+        self.assertEqual (recs[0]['items'], 3)
+        self.assertEqual (recs[0]['unit'], 'units')
+
+        rows = dict ((r['step'], r) for r in hrrLog.summary (hrrLog.records))
+        self.assertEqual (rows['Step5/fill']['calls'], 2)
+        self.assertEqual (rows['Step5/fill']['items'], 7)
+        self.assertIsNone (rows['Step5']['items'])
+        self.assertEqual (len (hrrLog.records), 5)
+
+        out = io.StringIO () if str is not bytes else io.BytesIO ()
+        hrrLog.report (hrrLog.records, out)
+        self.assertEqual (len (out.getvalue ().splitlines ()), 4)
+
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,88 @@
+"""
+Checks hrrOverlay against zone means taken over the fine label cells one by one, each label cell
+taking the coarse cell under its center with its area (Zonal Statistics on a resampled raster,
+the DATA option leaving nodata cells out).
+"""
+
+import shutil, tempfile, unittest
+import numpy as np
+import hrrOverlay
+
+
+def header (ncols, nrows, x, y, cs):
+    return {'ncols': ncols, 'nrows': nrows, 'xllcorner': x, 'yllcorner': y, 'cellsize': cs,
+            'NODATA_value': -9999}
+
+
+def reference (labels, lHdr, values, vHdr, nodata, geographic):
+    """ {zone: mean} looping over the label cells """
+    nrows, ncols = labels.shape
+    cs, vcs = lHdr['cellsize'], vHdr['cellsize']
+    top = lHdr['yllcorner'] + nrows * cs
+    vTop = vHdr['yllcorner'] + vHdr['nrows'] * vcs
+    num, den = {}, {}
+    for r in range (nrows):
+        y = top - (r + 0.5) * cs
+        area = np.cos (np.radians (y)) if geographic else 1.0
+        for c in range (ncols):
+            z = labels[r, c]
+            if z <= 0:
+                continue
+            i = int ((vTop - y) // vcs)
+            j = int ((lHdr['xllcorner'] + (c + 0.5) * cs - vHdr['xllcorner']) // vcs)
+            if not (0 <= i < vHdr['nrows'] and 0 <= j < vHdr['ncols']):
+                continue
+            den.setdefault (z, 0.0)
+            num.setdefault (z, 0.0)
+            if values[i, j] != nodata:
+                num[z] += area * values[i, j]
+                den[z] += area
+    return dict ((z, num[z] / den[z] if den[z] > 0 else np.nan) for z in den)
+
+
+class OverlayTest (unittest.TestCase):
+
+    def setUp (self):
+        rng = np.random.RandomState (2)
+        self.lHdr = header (30, 24, 10.0, 40.0, 0.1)
+        self.labels = (np.arange (24)[:, None] // 5 * 7 + np.arange (30)[None, :] // 4 + 1)
+        self.labels[rng.random_sample (self.labels.shape) < 0.05] = 0
+        self.vHdr = header (8, 7, 9.95, 39.9, 0.45)
+        self.values = rng.random_sample ((7, 8)) * 10
+        self.values[2, 3] = -9999
+        self.values[4, 1:4] = -9999
+        self.folder = tempfile.mkdtemp ()
+
+    def tearDown (self):
+        shutil.rmtree (self.folder)
+
+    def check (self, overlay, geographic):
+        means = hrrOverlay.zoneMeans (overlay, self.values, -9999)
+        ref = reference (self.labels, self.lHdr, self.values, self.vHdr, -9999, geographic)
+        self.assertEqual (overlay['zones'].tolist (), sorted (ref.keys ()))
+        np.testing.assert_allclose (means, [ref[z] for z in overlay['zones']], rtol = 1e-9)
+        np.testing.assert_allclose (np.bincount (overlay['row'], weights = overlay['weight']), 1.0)
+
+    def test_label_overlay (self):
+        for geographic in (False, True):
+            overlay = hrrOverlay.labelOverlay (self.labels, self.lHdr, 4326, self.vHdr, 4326, geographic,
+                                               rowsPerChunk = 5)
+            self.check (overlay, geographic)
+
+    def test_cache (self):
+        first = hrrOverlay.cachedLabelOverlay (self.folder, self.labels, self.lHdr, 4326, self.vHdr, 4326)
+        again = hrrOverlay.cachedLabelOverlay (self.folder, self.labels, self.lHdr, 4326, self.vHdr, 4326)
+        for k in ('zones', 'row', 'col', 'weight'):
+            np.testing.assert_array_equal (first[k], again[k])
+        self.check (again, False)
+
+    def test_from_pairs (self):
+        overlay = hrrOverlay.fromPairs ([5, 3, 5, 5], [2, 0, 2, 1], [1.0, 4.0, 2.0, 1.0], 4)
+        self.assertEqual (overlay['zones'].tolist (), [3, 5])
+        self.assertEqual (list (zip (overlay['row'].tolist (), overlay['col'].tolist ())), [(0, 0), (1, 1), (1, 2)])
+        np.testing.assert_allclose (overlay['weight'], [1.0, 0.25, 0.75])
+        np.testing.assert_allclose (hrrOverlay.zoneMeans (overlay, [1.0, 8.0, -9999, 2.0], -9999), [1.0, 8.0])
+
+
+if __name__ == '__main__':
+    unittest.main ()
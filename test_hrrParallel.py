@@ -0,0 +1,53 @@
+"""
+Checks hrrParallel against one serial run of a stage over the whole table: batches of whole
+watersheds in a process pool, merged back in row order, must give the same columns.
+"""
+
+import unittest
+from collections import OrderedDict
+import numpy as np
+import hrrParallel
+
+
+def numberUnits (job):
+    """ Stage as step 2 runs it: HRR IDs in WID order and per-watershed totals """
+    table, idOffset, widOffset = job
+    wid = table['WID']
+    order = np.argsort (wid, kind = 'mergesort')
+    hrrId = np.zeros (wid.size, dtype = np.int64)
+    hrrId[order] = np.arange (1, wid.size + 1) + idOffset
+    wids, local = np.unique (wid, return_inverse = True)
+    total = np.bincount (local, weights = table['Area'])[local]
+    return OrderedDict ([('HRR_ID', hrrId), ('WID', local + 1 + widOffset), ('A_sqkm', total)])
+
+
+class ParallelTest (unittest.TestCase):
+
+    def setUp (self):
+        rng = np.random.RandomState (9)
+        self.wid = rng.randint (1, 40, 500)
+        self.table = OrderedDict ([('WID', self.wid), ('Area', rng.random_sample (500))])
+
+    def test_batches (self):
+        batches = hrrParallel.widBatches (self.wid, 6)
+        self.assertEqual (len (batches), 6)
+        rows = np.concatenate ([b[0] for b in batches])
+        self.assertEqual (sorted (rows.tolist ()), list (range (500)))
+        for k, (rows, idOffset, widOffset) in enumerate (batches):
+            self.assertTrue (np.all (np.diff (rows) > 0))
+            self.assertEqual (idOffset, int ((self.wid < self.wid[rows].min ()).sum ()))
+            self.assertEqual (widOffset, np.unique (self.wid[self.wid < self.wid[rows].min ()]).size)
+            if k:
+                self.assertGreater (self.wid[rows].min (), self.wid[batches[k - 1][0]].max ())
+
+    def test_same_as_serial (self):
+        serial = numberUnits ((self.table, 0, 0))
+        for numProcs in (1, 2):
+            merged = hrrParallel.runByWatershed (numberUnits, self.table, self.wid, numProcs, batchesPerProc = 3)
+            self.assertEqual (list (merged.keys ()), list (serial.keys ()))
+            for name in serial:
+                np.testing.assert_allclose (merged[name], serial[name], rtol = 1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,95 @@
+"""
+Checks hrrPipeline against running every stage every time: a two stage chain of small scripts must
+end with the same files, and only the stages downstream of a change (input, parameter, script or a
+missing output) run again.
+"""
+
+import os, shutil, tempfile, unittest
+import hrrPipeline
+
+scriptA = '''inFile = 'input.txt'
+scale = 2
+outFile = 'mid.' + 'txt'
+with open (inFile) as handle:
+    value = int (handle.read ())
+with open (outFile, 'w') as handle:
+    handle.write (str (value * scale))
+'''
+
+scriptB = '''offset = 1
+with open ('mid.txt') as handle:
+    value = int (handle.read ())
+with open ('out.txt', 'w') as handle:
+    handle.write (str (value + offset))
+'''
+
+
+class PipelineTest (unittest.TestCase):
+
+    def setUp (self):
+        self.folder = tempfile.mkdtemp ()
+        self.write ('input.txt', '5')
+        self.write ('StepA.py', scriptA)
+        self.write ('StepB.py', scriptB)
+        self.state = self.path ('state.json')
+
+    def tearDown (self):
+        shutil.rmtree (self.folder)
+
+    def path (self, name):
+        return os.path.join (self.folder, name)
+
+    def write (self, name, text):
+        with open (self.path (name), 'w') as handle:
+            handle.write (text)
+
+    def read (self, name):
+        with open (self.path (name)) as handle:
+            return handle.read ()
+
+    def stages (self, scale = 2, offset = 1):
+        return [hrrPipeline.stage ('A', self.path ('StepA.py'), {'scale': scale}, [self.path ('input.txt')],
+                                   [self.path ('mid.txt')]),
+                hrrPipeline.stage ('B', self.path ('StepB.py'), {'offset': offset}, [self.path ('mid.txt')],
+                                   [self.path ('out.txt')])]
+
+    def runAll (self, **params):
+        force = params.pop ('force', ())
+        return hrrPipeline.runStages (self.stages (**params), self.state, force)
+
+    def test_incremental (self):
+        self.assertEqual (self.runAll (), ['A', 'B'])
+        self.assertEqual (self.read ('out.txt'), '11')
+        self.assertEqual (self.runAll (), [])
+        self.assertEqual (self.runAll (offset = 3), ['B'])
+        self.assertEqual (self.read ('out.txt'), '13')
+        self.write ('input.txt', '7')
+        self.assertEqual (self.runAll (offset = 3), ['A', 'B'])
+        self.assertEqual (self.read ('out.txt'), '17')
+        os.remove (self.path ('out.txt'))
+        self.assertEqual (self.runAll (offset = 3), ['B'])
+        self.write ('StepA.py', scriptA + '# edited\n')
+        self.assertEqual (self.runAll (offset = 3), ['A', 'B'])
+        self.assertEqual (self.runAll (offset = 3, force = ('A',)), ['A'])
+        self.assertEqual (hrrPipeline.runStages (self.stages (scale = 3, offset = 3), self.state, dryRun = True),
+                          ['A', 'B'])
+        self.assertEqual (self.read ('out.txt'), '17')
+
+    def test_failed_stage (self):
+        self.write ('input.txt', 'x')
+        with self.assertRaises (RuntimeError):
+            self.runAll ()
+        self.write ('input.txt', '5')
+        self.assertEqual (self.runAll (), ['A', 'B'])
+
+    def test_override (self):
+        source = hrrPipeline.overrideSource (scriptA, {'scale': 4, 'inFile': 'other.txt'})
+        lines = source.splitlines ()
+        self.assertEqual (lines[:4], ["inFile = 'input.txt'", "inFile = 'other.txt' # RunSteps",
+                                      'scale = 2', 'scale = 4 # RunSteps'])
+        with self.assertRaises (ValueError):
+            hrrPipeline.overrideSource (scriptA, {'missing': 1})
+
+
+if __name__ == '__main__':
+    unittest.main ()
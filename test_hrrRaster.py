@@ -0,0 +1,92 @@
+"""
+Checks the tiled raster store against the whole grid held in one array: blocks and windows (halo
+cells off the grid are nodata, as readWindow pads them), block iteration and write back, and
+ESRI ASCII grids streamed into a store and out again.
+"""
+
+import os, shutil, tempfile, unittest
+import numpy as np
+import hrrRaster
+
+
+def padded (arr, r0, r1, c0, c1, nodata):
+    """ arr[r0:r1, c0:c1] with nodata where the window is off the grid """
+    out = np.full ((r1 - r0, c1 - c0), nodata, dtype = arr.dtype)
+    a0, a1 = max (r0, 0), min (r1, arr.shape[0])
+    b0, b1 = max (c0, 0), min (c1, arr.shape[1])
+    out[a0 - r0:a1 - r0, b0 - c0:b1 - c0] = arr[a0:a1, b0:b1]
+    return out
+
+
+class TilesTest (unittest.TestCase):
+
+    def setUp (self):
+        self.folder = tempfile.mkdtemp ()
+        rng = np.random.RandomState (8)
+        self.arr = (rng.random_sample ((23, 30)) * 100).astype (np.float32)
+        self.header = {'ncols': 30, 'nrows': 23, 'xllcorner': 500.0, 'yllcorner': 100.0, 'cellsize': 10.0,
+                       'NODATA_value': -9999}
+
+    def tearDown (self):
+        shutil.rmtree (self.folder)
+
+    def store (self, tileSize = 8):
+        store = hrrRaster.createTiles (os.path.join (self.folder, 'grid_tiles'), self.header, np.float32, tileSize)
+        for ti, tj, block in hrrRaster.iterBlocks (store):
+            r0, r1, c0, c1 = hrrRaster.tileWindow (store, ti, tj)
+            hrrRaster.writeBlock (store, ti, tj, self.arr[r0:r1, c0:c1])
+        return store
+
+    def test_empty_store (self):
+        store = hrrRaster.createTiles (os.path.join (self.folder, 'empty'), self.header, np.int32, 16)
+        self.assertEqual (hrrRaster.tileCount (store), (2, 2))
+        self.assertTrue (np.all (hrrRaster.tilesToArray (store) == -9999))
+
+    def test_blocks_and_halos (self):
+        store = self.store ()
+        self.assertEqual (hrrRaster.tileCount (store), (3, 4))
+        np.testing.assert_array_equal (hrrRaster.tilesToArray (hrrRaster.openTiles (store['path'])), self.arr)
+        seen = np.zeros (self.arr.shape, dtype = np.int64)
+        for ti, tj, block in hrrRaster.iterBlocks (store, halo = 2):
+            r0, r1, c0, c1 = hrrRaster.tileWindow (store, ti, tj)
+            seen[r0:r1, c0:c1] += 1
+            np.testing.assert_array_equal (block, padded (self.arr, r0 - 2, r1 + 2, c0 - 2, c1 + 2, -9999))
+            h = hrrRaster.tileHeader (store, ti, tj, 2)
+            self.assertEqual ((h['nrows'], h['ncols']), block.shape)
+            self.assertAlmostEqual (h['xllcorner'], 500.0 + (c0 - 2) * 10.0)
+            self.assertAlmostEqual (h['yllcorner'], 100.0 + (23 - r1 - 2) * 10.0)
+        self.assertTrue (np.all (seen == 1))
+        # windows across tiles and past every edge of the grid
+        for window in ((-3, 5, -4, 12), (6, 26, 20, 34), (0, 23, 0, 30), (9, 10, 15, 16)):
+            np.testing.assert_array_equal (hrrRaster.readWindow (store, *window), padded (self.arr, *(window + (-9999,))))
+        self.assertEqual ([r.tolist () for r in hrrRaster.iterRows (store)], self.arr.tolist ())
+
+    def test_write_with_halo (self):
+        store = self.store ()
+        for ti, tj, block in hrrRaster.iterBlocks (store, halo = 1):
+            hrrRaster.writeBlock (store, ti, tj, block * 2, halo = 1)
+        np.testing.assert_array_equal (hrrRaster.tilesToArray (store), self.arr * 2)
+
+    def test_ascii_round_trip (self):
+        for arr, fmt in ((self.arr.astype (np.float64), '%.6g'), (np.arange (690).reshape (23, 30) - 5, '%d')):
+            asc = os.path.join (self.folder, 'grid.asc')
+            hrrRaster.writeAscii (asc, arr, self.header, fmt)
+            ref, hdr = hrrRaster.readAscii (asc)
+            for tileSize in (7, 64):
+                path = os.path.join (self.folder, 'grid%d' % tileSize)
+                store = hrrRaster.asciiToTiles (asc, path, arr.dtype, tileSize)
+                self.assertTrue (hrrRaster.isTiles (path))
+                np.testing.assert_array_equal (hrrRaster.tilesToArray (store), ref.astype (arr.dtype))
+                back = os.path.join (self.folder, 'back.asc')
+                hrrRaster.tilesToAscii (store, back, fmt)
+                out, outHdr = hrrRaster.readAscii (back)
+                np.testing.assert_array_equal (out, ref)
+                for key in hrrRaster.headerKeys:
+                    self.assertAlmostEqual (float (outHdr[key]), float (hdr[key]))
+                arr2, hdr2 = hrrRaster.readRaster (path)
+                np.testing.assert_array_equal (arr2, ref)
+                shutil.rmtree (path)
+
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,98 @@
+"""
+Checks hrrResample against resampling done cell by cell on the same coordinate system, as
+ProjectRaster does it: NEAREST takes the source cell under the target cell center, BILINEAR
+interpolates the four nearest source cell centers, nodata source cells left out.
+"""
+
+import os, shutil, tempfile, unittest
+import numpy as np
+import hrrRaster, hrrResample
+
+
+def header (ncols, nrows, x, y, cs):
+    return {'ncols': ncols, 'nrows': nrows, 'xllcorner': x, 'yllcorner': y, 'cellsize': cs,
+            'NODATA_value': -9999}
+
+
+def reference (src, srcHdr, dstHdr, method, nodata = None):
+    """ Target grid by looking up every target cell center in the source grid """
+    scs, dcs = float (srcHdr['cellsize']), float (dstHdr['cellsize'])
+    sRows, sCols = src.shape
+    sTop = srcHdr['yllcorner'] + sRows * scs
+    dTop = dstHdr['yllcorner'] + dstHdr['nrows'] * dcs
+    out = np.full ((dstHdr['nrows'], dstHdr['ncols']), -9999.0)
+    for r in range (dstHdr['nrows']):
+        for c in range (dstHdr['ncols']):
+            u = (dstHdr['xllcorner'] + (c + 0.5) * dcs - srcHdr['xllcorner']) / scs
+            v = (sTop - (dTop - (r + 0.5) * dcs)) / scs
+            if not (0 <= u < sCols and 0 <= v < sRows):
+                continue
+            if method == 'NEAREST':
+                val = src[int (v), int (u)]
+                if val != nodata:
+                    out[r, c] = val
+                continue
+            i0, j0 = int (np.floor (v - 0.5)), int (np.floor (u - 0.5))
+            fv, fu = v - 0.5 - i0, u - 0.5 - j0
+            num = den = 0.0
+            for di, dj, w in ((0, 0, (1 - fu) * (1 - fv)), (0, 1, fu * (1 - fv)),
+                              (1, 0, (1 - fu) * fv), (1, 1, fu * fv)):
+                val = src[min (max (i0 + di, 0), sRows - 1), min (max (j0 + dj, 0), sCols - 1)]
+                if val != nodata:
+                    num += w * val
+                    den += w
+            if den > 0:
+                out[r, c] = num / den
+    return out
+
+
+class ResampleTest (unittest.TestCase):
+
+    def setUp (self):
+        rng = np.random.RandomState (5)
+        self.src = rng.random_sample ((12, 15)) * 100
+        self.src[3, 4:7] = -9999
+        self.srcHdr = header (15, 12, 0.0, 0.0, 1.0)
+        self.dstHdr = header (40, 25, 0.7, 1.3, 0.33)
+        self.folder = tempfile.mkdtemp ()
+
+    def tearDown (self):
+        shutil.rmtree (self.folder)
+
+    def test_methods (self):
+        for method in hrrResample.methods:
+            rsMap = hrrResample.buildMap (self.srcHdr, 4326, self.dstHdr, 4326, method)
+            out = hrrResample.applyMap (rsMap, [self.src], [-9999])[0]
+            ref = reference (self.src, self.srcHdr, self.dstHdr, method, -9999)
+            np.testing.assert_allclose (out, ref, rtol = 1e-5, atol = 1e-3)
+
+    def test_cache (self):
+        first = hrrResample.loadMap (self.folder, self.srcHdr, 4326, self.dstHdr, 4326, 'BILINEAR')
+        self.assertEqual (len (os.listdir (self.folder)), 1)
+        again = hrrResample.loadMap (self.folder, self.srcHdr, 4326, self.dstHdr, 4326, 'BILINEAR')
+        np.testing.assert_array_equal (first['index'], again['index'])
+        np.testing.assert_array_equal (first['weight'], again['weight'])
+
+    def test_missing_coordinate_system (self):
+        x, y = np.array ([0.5]), np.array ([0.5])
+        self.assertEqual (hrrResample.projectPoints (x, y, 'EPSG:4326', 4326), (x, y))
+        for fromSR, toSR in ((None, 4326), (4326, None), (None, None), ('', '')):
+            with self.assertRaises (ValueError):
+                hrrResample.projectPoints (x, y, fromSR, toSR)
+        with self.assertRaises (ValueError):
+            hrrResample.buildMap (self.srcHdr, 4326, self.dstHdr, None, 'NEAREST')
+
+    def test_resample_rasters (self):
+        inPath = os.path.join (self.folder, 'lc.asc')
+        outPath = os.path.join (self.folder, 'lcp.asc')
+        lc = np.where (self.src == -9999, -9999, self.src // 10).astype (np.int32)
+        hrrRaster.writeAscii (inPath, lc, self.srcHdr)
+        hrrResample.resampleRasters ([inPath], [outPath], self.dstHdr, 4326, 'NEAREST')
+        out, hdr = hrrRaster.readRaster (outPath)
+        np.testing.assert_array_equal (out, reference (lc, self.srcHdr, self.dstHdr, 'NEAREST', -9999))
+        with self.assertRaises (ValueError):
+            hrrResample.resampleRasters ([inPath], [outPath], self.dstHdr, None, 'NEAREST')
+
+
+if __name__ == '__main__':
+    unittest.main ()
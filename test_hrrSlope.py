@@ -0,0 +1,104 @@
+"""
+Checks hrrSlope against ArcGIS Slope (PERCENT_RISE) computed cell by cell with Horn's formula,
+nodata neighbours taking the centre value, and against zonal means of that slope grid.
+"""
+
+import shutil, tempfile, unittest
+import numpy as np
+import hrrRaster, hrrSlope
+
+
+def hornReference (dem, cs, floor = 0.1):
+    """ Slope grid in percent rise, NaN at nodata (NaN) cells """
+    nrows, ncols = dem.shape
+    out = np.full (dem.shape, np.nan)
+    for r in range (nrows):
+        for c in range (ncols):
+            e = dem[r, c]
+            if np.isnan (e):
+                continue
+            def z (dr, dc):
+                rr, cc = r + dr, c + dc
+                if 0 <= rr < nrows and 0 <= cc < ncols and not np.isnan (dem[rr, cc]):
+                    return dem[rr, cc]
+                return e
+            dzdx = ((z (-1, 1) + 2 * z (0, 1) + z (1, 1)) - (z (-1, -1) + 2 * z (0, -1) + z (1, -1))) / (8.0 * cs)
+            dzdy = ((z (1, -1) + 2 * z (1, 0) + z (1, 1)) - (z (-1, -1) + 2 * z (-1, 0) + z (-1, 1))) / (8.0 * cs)
+            out[r, c] = max (100.0 * np.hypot (dzdx, dzdy), floor)
+    return out
+
+
+def zoneMeans (zones, slope):
+    codes = np.unique (zones[zones > 0])
+    cells = [slope[(zones == z) & ~np.isnan (slope)] for z in codes]
+    return codes, np.array ([v.mean () if v.size else np.nan for v in cells])
+
+
+def toStore (folder, name, arr, tileSize, nodata):
+    header = {'ncols': arr.shape[1], 'nrows': arr.shape[0], 'xllcorner': 0.0, 'yllcorner': 0.0,
+              'cellsize': 30.0, 'NODATA_value': nodata}
+    store = hrrRaster.createTiles (folder + '/' + name, header, arr.dtype, tileSize)
+    for ti, tj, block in hrrRaster.iterBlocks (store):
+        r0, r1, c0, c1 = hrrRaster.tileWindow (store, ti, tj)
+        hrrRaster.writeBlock (store, ti, tj, arr[r0:r1, c0:c1])
+    return store
+
+
+class SlopeTest (unittest.TestCase):
+
+    def setUp (self):
+        rng = np.random.RandomState (3)
+        self.dem = (rng.random_sample ((37, 41)) * 20 + np.arange (41) * 0.5).astype (np.float64)
+        self.dem[5:8, 10:14] = np.nan
+        self.zones = (np.arange (37)[:, None] // 9 * 5 + np.arange (41)[None, :] // 9 + 1).astype (np.int64)
+        self.zones[:, 0] = 0
+        self.lfp = rng.random_sample (self.dem.shape) < 0.3
+        self.folder = tempfile.mkdtemp ()
+
+    def tearDown (self):
+        shutil.rmtree (self.folder)
+
+    def test_zonal_slope (self):
+        table, slope = hrrSlope.zonalSlope (self.dem, self.zones, 30.0, tileSize = 8, numThreads = 2, saveSlope = True)
+        ref = hornReference (self.dem, 30.0)
+        np.testing.assert_allclose (slope, ref, rtol = 1e-6)
+        codes, means = zoneMeans (self.zones, ref)
+        self.assertEqual (table['GRIDCODE'].tolist (), codes.tolist ())
+        np.testing.assert_allclose (table['slope_MEAN'], means, rtol = 1e-9)
+
+    def test_masked_slope (self):
+        table, slope = hrrSlope.zonalSlope (self.dem, self.zones, 30.0, mask = self.lfp, tileSize = 8)
+        ref = hornReference (np.where (self.lfp, self.dem, np.nan), 30.0)
+        codes, means = zoneMeans (self.zones, ref)
+        keep = ~np.isnan (means)
+        np.testing.assert_allclose (table['slope_MEAN'][np.isin (table['GRIDCODE'], codes[keep])], means[keep], rtol = 1e-9)
+
+    def test_tiles_match_array (self):
+        dem = np.where (np.isnan (self.dem), -9999, self.dem).astype (np.float32)
+        demStore = toStore (self.folder, 'dem', dem, 16, -9999)
+        zoneStore = toStore (self.folder, 'zones', np.where (self.zones > 0, self.zones, -1).astype (np.int32), 16, -1)
+        lfpStore = toStore (self.folder, 'lfp', np.where (self.lfp, 1, 255).astype (np.int32), 16, 255)
+        for maskStore, mask in ((None, None), (lfpStore, self.lfp)):
+            tiles = hrrSlope.zonalSlopeTiles (demStore, zoneStore, 30.0, maskStore = maskStore, numThreads = 2)
+            array, s = hrrSlope.zonalSlope (dem.astype (np.float64), self.zones, 30.0, nodata = -9999, mask = mask)
+            self.assertEqual (tiles['GRIDCODE'].tolist (), array['GRIDCODE'].tolist ())
+            np.testing.assert_allclose (tiles['slope_MEAN'], array['slope_MEAN'], rtol = 1e-5)
+
+    def test_path_slope (self):
+        # one zone, channel along row 2 flowing east (fdir 1) out of the grid, 1 m drop per cell
+        fdir = np.full ((5, 6), 4, dtype = np.int32)
+        fdir[2, :] = 1
+        dem = np.tile (np.arange (6, 0, -1, dtype = np.float64), (5, 1)) + 50
+        zones = np.ones ((5, 6), dtype = np.int64)
+        path = np.zeros ((5, 6), dtype = bool)
+        path[2, :] = True
+        table = hrrSlope.pathSlope (fdir, dem, zones, 100.0, pathMask = path)
+        self.assertAlmostEqual (table['lfp_LENGTH'][0], 500.0)
+        self.assertAlmostEqual (table['lfp_DROP'][0], 5.0)
+        self.assertAlmostEqual (table['lfp_SLOPE'][0], 1.0)
+        fit = hrrSlope.pathSlope (fdir, dem, zones, 100.0, pathMask = path, method = 'fit')
+        self.assertAlmostEqual (fit['lfp_SLOPE'][0], 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,91 @@
+"""
+Checks hrrSoils against the formulas of nc2ras_ks_soild.R and nc2ras_theta.R applied to whole
+layers, NaN standing for NA (any NA in a cell gives NA).
+"""
+
+import os, shutil, tempfile, unittest
+import numpy as np
+from scipy.io import netcdf_file
+import hrrRaster, hrrSoils
+
+d = np.array (hrrSoils.layerDepths)
+
+
+def writeLayers (folder, varName, layers, lon, lat):
+    """ One netCDF file per layer, lat ascending as in the global files, -9999 fill value """
+    paths = []
+    for i, layer in enumerate (layers):
+        path = os.path.join (folder, '%s_%d.nc' % (varName, i + 1))
+        nc = netcdf_file (path, 'w')
+        nc.createDimension ('lat', lat.size)
+        nc.createDimension ('lon', lon.size)
+        nc.createVariable ('lat', 'd', ('lat',))[:] = lat
+        nc.createVariable ('lon', 'd', ('lon',))[:] = lon
+        var = nc.createVariable (varName, 'f', ('lat', 'lon'))
+        var._FillValue = np.float32 (-9999)
+        var[:] = np.where (np.isnan (layer), -9999, layer)
+        nc.close ()
+        paths.append (path)
+    return paths
+
+
+class SoilsTest (unittest.TestCase):
+
+    def setUp (self):
+        rng = np.random.RandomState (11)
+        self.lon = np.arange (20) * 0.5 + 10.25
+        self.lat = np.arange (14) * 0.5 - 3.75
+        self.ksat = rng.random_sample ((8, 14, 20)) * 50 + 1
+        self.ksat[3, 2, 5] = np.nan
+        self.ksat[:, 7, 9] = np.nan
+        self.ksat[6, 4, 4] = 0
+        self.theta = rng.random_sample ((8, 14, 20)) * 0.3 + 0.2
+        self.theta[0, 10, 1] = np.nan
+        self.folder = tempfile.mkdtemp ()
+        self.bbox = (self.lon[0] - 0.25, self.lat[0] - 0.25, self.lon[-1] + 0.25, self.lat[-1] + 0.25)
+
+    def tearDown (self):
+        shutil.rmtree (self.folder)
+
+    def layered (self, name, layers, mean, **options):
+        paths = writeLayers (self.folder, name, layers, self.lon, self.lat)
+        out = os.path.join (self.folder, name + '.tiles')
+        depth = os.path.join (self.folder, name + '_soilD.tiles')
+        hrrSoils.layeredMean (paths, name, self.bbox, out, mean, depth, tileSize = 8, **options)
+        grids = []
+        for path in (out, depth):
+            arr, hdr = hrrRaster.readRaster (path, np.float64)
+            arr[arr == hdr['NODATA_value']] = np.nan
+            grids.append (arr[::-1]) # back to lat ascending
+        return grids
+
+    def assertGrid (self, out, ref):
+        np.testing.assert_array_equal (np.isnan (out), np.isnan (ref))
+        np.testing.assert_allclose (out[~np.isnan (ref)], ref[~np.isnan (ref)], rtol = 1e-5)
+
+    def test_r_ksat (self):
+        ksat, soilD = self.layered ('k_s', self.ksat, 'harmonic')
+        with np.errstate (divide = 'ignore', invalid = 'ignore'):
+            ref = 2.296 / (d[:, None, None] / self.ksat).sum (axis = 0)
+            refD = (d[:, None, None] * self.ksat / self.ksat).sum (axis = 0)
+        self.assertGrid (ksat, ref)
+        self.assertGrid (soilD, refD)
+        self.assertEqual (ksat[4, 4], 0)
+        self.assertTrue (np.isnan (soilD[4, 4]))
+
+    def test_r_theta (self):
+        theta, soilD = self.layered ('theta_s', self.theta, 'arithmetic')
+        self.assertGrid (theta, (d[:, None, None] * self.theta).sum (axis = 0) / 2.962)
+
+    def test_options (self):
+        theta, soilD = self.layered ('theta_s', self.theta, 'arithmetic', missing = 'layer', divisor = None)
+        ok = ~np.isnan (self.theta)
+        w = d[:, None, None] * ok
+        self.assertGrid (theta, (w * np.where (ok, self.theta, 0)).sum (axis = 0) / w.sum (axis = 0))
+        self.assertGrid (soilD, w.sum (axis = 0))
+        with self.assertRaises (ValueError):
+            self.layered ('theta_s', self.theta, 'arithmetic', missing = 'skip')
+
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,40 @@
+"""
+Checks hrrSweep against one hrrFlow.streamNetwork / updLength run and one hrrZonal.zonalStats
+pass per threshold, as step 1 does for a single A_thrhld.
+"""
+
+import unittest
+import numpy as np
+import hrrFlow, hrrSweep, hrrZonal
+from testData import randomDrainage
+
+
+class SweepTest (unittest.TestCase):
+
+    def test_levels (self):
+        fdir, facc = randomDrainage (45, 50)
+        thresholds = [5, 20, 60]
+        route, levels = hrrSweep.sweep (fdir, facc, thresholds, 3, 90.0)
+        upd = hrrFlow.updLength (fdir, facc, 3, 90.0)
+        np.testing.assert_allclose (route['upd'].reshape (fdir.shape), upd)
+        self.assertEqual ([l['threshold'] for l in levels], thresholds)
+        for level in levels:
+            link, basin = hrrFlow.streamNetwork (fdir, facc, level['threshold'])
+            np.testing.assert_array_equal (level['link'], link)
+            np.testing.assert_array_equal (level['basin'], basin)
+            zonal = hrrZonal.zonalStats (basin, {'facc': facc, 'upd': upd}, ['COUNT', 'MAX'], {'upd': -1})
+            sweepZonal = hrrSweep.levelZonal (level)
+            for name in ('GRIDCODE', 'facc_COUNT', 'facc_MAX', 'upd_MAX'):
+                np.testing.assert_allclose (sweepZonal[name], zonal[name], err_msg = name)
+            self.assertEqual (level['table']['COUNT'].tolist (), zonal['facc_COUNT'].tolist ())
+
+    def test_nesting (self):
+        fdir, facc = randomDrainage (30, 35, 1)
+        route, levels = hrrSweep.sweep (fdir, facc, [4, 30], 2, 1.0)
+        fine, coarse = levels
+        lut = np.concatenate ([[0], fine['parent']])
+        np.testing.assert_array_equal (lut[fine['basin']], coarse['basin'])
+
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,57 @@
+"""
+Checks hrrTable joins against JoinField done row by row (first matching row of the join table,
+unmatched rows get the fill value) and the text tables against a write and read back.
+"""
+
+import os, shutil, tempfile, unittest
+from collections import OrderedDict
+import numpy as np
+import hrrTable
+
+
+def joinReference (keys, otherKeys, values, fill):
+    out = []
+    for k in keys:
+        match = [v for o, v in zip (otherKeys, values) if o == k]
+        out.append (match[0] if match else fill)
+    return out
+
+
+class TableTest (unittest.TestCase):
+
+    def test_join (self):
+        rng = np.random.RandomState (4)
+        table = OrderedDict ([('GRID_CODE', rng.permutation (60) + 1), ('A', rng.random_sample (60))])
+        otherKeys = rng.randint (0, 80, 90)
+        values = rng.randint (1, 1000, 90).astype (np.int32)
+        hrrTable.joinColumns (table, hrrTable.gridCodeField (table), otherKeys, {'B': values}, fill = -1)
+        self.assertEqual (table['B'].tolist (), joinReference (table['GRID_CODE'], otherKeys, values, -1))
+        self.assertEqual (table['B'].dtype, np.int32)
+        self.assertEqual (list (table.keys ()), ['GRID_CODE', 'A', 'B'])
+
+    def test_structured (self):
+        table = OrderedDict ([('GRIDCODE', np.array ([3, 1, 2])), ('Area', np.array ([0.5, 1.5, 2.5]))])
+        arr = hrrTable.toStructured (table)
+        self.assertEqual (arr.dtype.names, ('GRIDCODE', 'Area'))
+        back = hrrTable.fromArray (arr, skip = ('Area',))
+        self.assertEqual (list (back.keys ()), ['GRIDCODE'])
+        self.assertEqual (hrrTable.numRows (back), 3)
+
+    def test_text (self):
+        folder = tempfile.mkdtemp ()
+        try:
+            path = os.path.join (folder, 'HRR.csv')
+            table = OrderedDict ([('GRIDCODE', np.array ([3, 1, 2])), ('L_km', np.array ([0.125, 1.5, 2.0])),
+                                  ('Order', np.array ([1, 1, 2]))])
+            hrrTable.writeText (table, path)
+            back = hrrTable.readText (path)
+            self.assertEqual (list (back.keys ()), list (table.keys ()))
+            for name in table:
+                self.assertEqual (back[name].tolist (), table[name].tolist ())
+            self.assertTrue (np.issubdtype (back['Order'].dtype, np.integer))
+        finally:
+            shutil.rmtree (folder)
+
+
+if __name__ == '__main__':
+    unittest.main ()
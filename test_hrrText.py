@@ -0,0 +1,158 @@
+"""
+Checks the step 5 table (hrrText.schemaTable / fillRows / divide / textColumn) against the text
+the original step 5 wrote value by value from Python lists, with Python 2 integer division:
+integer defaults and nulls of float columns stay integers (-999, -999 / 24 = -42), and
+hrrBinary gives the same text back.
+"""
+
+import os, io, shutil, tempfile, unittest
+import numpy as np
+import hrrText, hrrBinary
+
+# schema and null fields of Step5_HRRtoText_21.py
+schema = [('hrrID', 'HRR_ID', 'i8', 0, 'all'),
+          ('gridCode', 'GRIDCODE', 'i8', 0, 'all'),
+          ('length_p1', 'LP_KM', 'f8', -999, 'planes'),
+          ('slope_p1', 'SLOPE_CAT', 'f8', 0.1, 'planes'),
+          ('n_surface', None, 'f8', 0.8, 'planes'),
+          ('kSat', 'KSAT', 'f8', -999, 'planes'),
+          ('effPor', 'EFFPOR', 'f8', -999, 'planes'),
+          ('depthp', 'DEPTH', 'f8', 3.2, 'planes'),
+          ('lcp', 'LC', 'i8', -999, 'planes'),
+          ('downID', 'DOWN_ID', 'i8', -999, 'channels'),
+          ('numUp', 'NUMUP', 'i8', -999, 'channels'),
+          ('up1', 'UP1ID', 'i8', -999, 'channels'),
+          ('up2', 'UP2ID', 'i8', -999, 'channels'),
+          ('up3', 'UP3ID', 'i8', -999, 'channels'),
+          ('up4', 'UP4ID', 'i8', -999, 'channels'),
+          ('a_km2', 'A_SQKM', 'f8', 999, 'channels'),
+          ('cumA_km2', 'CUMA_SQKM', 'f8', 999, 'channels'),
+          ('len_ch', 'LC_LFP_KM', 'f8', -999, 'channels'),
+          ('slope_ch', 'SLOPE_STR', 'f8', 0.001, 'channels'),
+          ('n', None, 'f8', 0.035, 'channels'),
+          ('width_ch', None, 'f8', -999, 'channels'),
+          ('q_r', None, 'f8', -999, 'channels'),
+          ('guageA', None, 'i8', -999, 'output')
+          ]
+nullFields = ['slope_ch', 'slope_p1', 'kSat', 'effPor', 'depthp', 'lcp']
+powerColumns = ('width_ch', 'q_r') # NumPy and Python pow may differ in the last bit
+
+
+def div2 (a, b):
+    """ Python 2 a / b """
+    return a // b if isinstance (a, int) and isinstance (b, int) else a / b
+
+
+def baselineText (records, group):
+    """ Text of one file as the list based step 5 wrote it (nullCheck, calcChannelsLists, str) """
+    numRec = len (records) + 1
+    lists = dict ((c[0], [c[3]] * numRec) for c in schema)
+    for rec in records:
+        for c in schema:
+            if c[1] is not None:
+                lists[c[0]][rec['HRR_ID']] = rec[c[1]]
+    for i in range (numRec):
+        for name in nullFields:
+            kind = int if name == 'lcp' else float
+            if not isinstance (lists[name][i], kind):
+                lists[name][i] = -999
+        lists['length_p1'][i] = lists['length_p1'][i] * 1000
+        lists['len_ch'][i] = lists['len_ch'][i] * 1000
+        lists['slope_p1'][i] = div2 (lists['slope_p1'][i], 100)
+        lists['slope_ch'][i] = div2 (lists['slope_ch'][i], 100)
+        lists['kSat'][i] = div2 (lists['kSat'][i], 24)
+        lists['width_ch'][i] = 1.956 * lists['cumA_km2'][i] ** 0.413
+        lists['q_r'][i] = 0.01 * 0.089 * lists['cumA_km2'][i] ** 0.958
+        lists['guageA'][i] = int (lists['cumA_km2'][i])
+    names = [c[0] for c in schema if c[4] in ('all', group)]
+    return ''.join ('\t'.join (str (lists[n][i]) for n in names) + '\n' for i in range (1, numRec)), names
+
+
+def schemaText (records, group, binFolder = None):
+    """ Text of one file from the structured table, as Step5 makes it """
+    numRec = len (records) + 1
+    table = hrrText.schemaTable (schema, numRec)
+    table['hrrID'] = np.arange (numRec)
+    rows = [tuple (rec[c[1]] for c in schema if c[1] is not None) for rec in records]
+    hrrText.fillRows (table, schema, rows, nullFields)
+    table['length_p1'] *= 1000
+    table['len_ch'] *= 1000
+    hrrText.divide (table, 'slope_p1', 100)
+    hrrText.divide (table, 'slope_ch', 100)
+    hrrText.divide (table, 'kSat', 24)
+    table['width_ch'] = 1.956 * table['cumA_km2'] ** 0.413
+    table['q_r'] = 0.01 * 0.089 * table['cumA_km2'] ** 0.958
+    table['guageA'] = table['cumA_km2'].astype (np.int64)
+    table = table[1:]
+    names = [c[0] for c in schema if c[4] in ('all', group)]
+    columns = [hrrText.textColumn (table, n) for n in names]
+    handle = io.StringIO () if str is not bytes else io.BytesIO ()
+    hrrText.writeColumns (handle, columns, blockRows = 7)
+    if binFolder is not None:
+        path = os.path.join (binFolder, group + '.hrrb')
+        hrrBinary.write (path, names, columns)
+    return handle.getvalue ()
+
+
+def randomRecords (n, seed = 0):
+    rng = np.random.RandomState (seed)
+    recs = []
+    for i in range (1, n + 1):
+        pick = rng.randint (0, 4)
+        recs.append ({'HRR_ID': i, 'GRIDCODE': int (rng.randint (1, 10 ** 6)),
+                      'LP_KM': [float (rng.random_sample () * 5), 3, 0.5, 2.0][pick],
+                      'SLOPE_CAT': [float (rng.random_sample () * 20), None, 7, 1.0][pick],
+                      'KSAT': [float (rng.random_sample () * 100), None, 48.0, 12][pick],
+                      'EFFPOR': [float (rng.random_sample ()), None, 0.25, 1][pick],
+                      'DEPTH': [2.296, None, 1.5, 3][pick],
+                      'LC': [int (rng.randint (1, 20)), None, 5, 7][pick],
+                      'DOWN_ID': int (rng.randint (0, n)), 'NUMUP': int (rng.randint (0, 3)),
+                      'UP1ID': int (rng.randint (0, n)), 'UP2ID': 0, 'UP3ID': 0, 'UP4ID': 0,
+                      'A_SQKM': [float (rng.random_sample () * 50), 12.0, 4, 0.75][pick],
+                      'CUMA_SQKM': [float (rng.random_sample () * 5000), 1000.5, 81, 3.0][pick],
+                      'LC_LFP_KM': [float (rng.random_sample () * 9), 1.25, 2, 0.0][pick],
+                      'SLOPE_STR': [float (rng.random_sample () * 3), None, 2, 0.5][pick]})
+    return recs
+
+
+class Step5TextTest (unittest.TestCase):
+
+    def setUp (self):
+        self.records = randomRecords (60)
+        self.folder = tempfile.mkdtemp ()
+
+    def tearDown (self):
+        shutil.rmtree (self.folder)
+
+    def compare (self, text, baseline, names):
+        lines, refLines = text.splitlines (), baseline.splitlines ()
+        self.assertEqual (len (lines), len (refLines))
+        for line, ref in zip (lines, refLines):
+            for name, v, r in zip (names, line.split ('\t'), ref.split ('\t')):
+                if name in powerColumns:
+                    self.assertAlmostEqual (float (v) / float (r), 1.0, 14)
+                else:
+                    self.assertEqual (v, r, name)
+
+    def test_baseline_text (self):
+        for group in ('planes', 'channels', 'output'):
+            baseline, names = baselineText (self.records, group)
+            self.compare (schemaText (self.records, group), baseline, names)
+
+    def test_integer_defaults (self):
+        rec = dict (self.records[0], SLOPE_CAT = None, KSAT = None, EFFPOR = None, DEPTH = None, LC = None)
+        text = schemaText ([rec], 'planes').split ('\t')
+        # null slope, kSat, effPor, depth and LC: -999 / 100, -999 / 24 in Python 2
+        self.assertEqual (text[3:], ['-10', '0.8', '-42', '-999', '-999', '-999\n'])
+
+    def test_binary_round_trip (self):
+        for group in ('planes', 'channels'):
+            text = schemaText (self.records, group, self.folder)
+            out = os.path.join (self.folder, group + '.txt')
+            hrrBinary.toText (os.path.join (self.folder, group + '.hrrb'), out)
+            with open (out, 'r') as handle:
+                self.assertEqual (handle.read (), text)
+
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,64 @@
+"""
+Checks hrrTopo against a walk down the from/to node table one unit at a time, as the original
+step 2 loops did.
+"""
+
+import unittest
+import numpy as np
+import hrrTopo
+
+
+def randomNetwork (n, numOutlets, seed = 0):
+    """ Random tree: grid codes shuffled, each unit drains to one with a larger rank """
+    rng = np.random.RandomState (seed)
+    codes = rng.permutation (n) * 3 + 11
+    toNode = np.zeros (n, dtype = np.int64)
+    for rank in range (n - numOutlets):
+        toNode[rank] = codes[rng.randint (rank + 1, n)]
+    return codes, codes.copy (), toNode
+
+
+def walk (fromNode, toNode):
+    """ down, outlet and cumulative count of every unit by walking each path """
+    pos = dict ((c, k) for k, c in enumerate (fromNode))
+    down = np.array ([pos.get (t, -1) for t in toNode])
+    root = np.zeros (down.size, dtype = np.int64)
+    cum = np.zeros (down.size)
+    for k in range (down.size):
+        u = k
+        cum[u] += 1
+        while down[u] >= 0:
+            u = down[u]
+            cum[u] += 1
+        root[k] = u
+    return down, root, cum
+
+
+class TopoTest (unittest.TestCase):
+
+    def test_against_walk (self):
+        gridCode, fromNode, toNode = randomNetwork (500, 7)
+        down, root, cum = walk (fromNode, toNode)
+        self.assertEqual (hrrTopo.downstream (fromNode, toNode).tolist (), down.tolist ())
+        self.assertEqual (hrrTopo.outlets (down).tolist (), root.tolist ())
+        self.assertEqual (hrrTopo.accumulate (down, np.ones (down.size)).tolist (), cum.tolist ())
+
+        topo = hrrTopo.buildTopology (gridCode, fromNode, toNode, [cum])
+        for i in range (down.size):
+            up = topo['up'][topo['ptr'][i]:topo['ptr'][i + 1]]
+            self.assertEqual (sorted (up.tolist ()), np.nonzero (down == i)[0].tolist ())
+            self.assertEqual (topo['numUp'][i], up.size)
+        wid = hrrTopo.assignWID (down, topo['sink'])
+        self.assertEqual (wid.tolist (), topo['sink'][root].tolist ())
+
+    def test_cycle (self):
+        down = np.array ([1, 2, 0, -1, 3])
+        with self.assertRaises (ValueError):
+            hrrTopo.outlets (down)
+        with self.assertRaises (ValueError):
+            hrrTopo.outlets (np.array ([-1, 1]))
+        self.assertEqual (hrrTopo.outlets (np.array ([1, 2, 3, -1, 3])).tolist (), [3, 3, 3, 3, 3])
+
+
+if __name__ == '__main__':
+    unittest.main ()
@@ -0,0 +1,129 @@
+"""
+Checks hrrZonal against per-zone statistics computed cell by cell, as ZonalStatisticsAsTable
+(DATA option) gives them: nodata cells skipped, MAJORITY ties to the lowest value.
+"""
+
+import os, shutil, tempfile, unittest
+from collections import Counter
+import numpy as np
+import hrrRaster, hrrZonal
+
+
+def reference (zones, values, nodata):
+    """ {zone: {stat: value}} by looping over the cells of each zone """
+    out = {}
+    for z in np.unique (zones[zones > 0]):
+        v = values[(zones == z) & (values != nodata)]
+        if v.size == 0:
+            out[z] = {'COUNT': 0}
+            continue
+        counts = Counter (v.tolist ())
+        top = max (counts.values ())
+        out[z] = {'COUNT': v.size, 'SUM': v.sum (), 'MEAN': v.mean (), 'MIN': v.min (), 'MAX': v.max (),
+                  'MAJORITY': min (k for k, c in counts.items () if c == top)}
+    return out
+
+
+class ZonalTest (unittest.TestCase):
+
+    def setUp (self):
+        rng = np.random.RandomState (7)
+        self.zones = rng.randint (0, 40, (60, 50))
+        self.lc = rng.randint (1, 6, (60, 50)).astype (np.int32)
+        self.lc[rng.random_sample (self.lc.shape) < 0.1] = -9999
+        self.zones[:5, :5] = 41 # zone with nodata only
+        self.lc[:5, :5] = -9999
+
+    def checkTable (self, table, stats):
+        ref = reference (self.zones, self.lc, -9999)
+        self.assertEqual (table['GRIDCODE'].tolist (), sorted (ref.keys ()))
+        for row in table:
+            r = ref[row['GRIDCODE']]
+            self.assertEqual (row['lc_COUNT'], r['COUNT'])
+            for stat in stats:
+                if stat == 'COUNT':
+                    continue
+                if r['COUNT'] == 0:
+                    self.assertTrue (np.isnan (row['lc_' + stat]))
+                else:
+                    self.assertAlmostEqual (row['lc_' + stat], r[stat], 9)
+
+    def test_default_stats (self):
+        table = hrrZonal.zonalStats (self.zones, {'lc': self.lc}, None, {'lc': -9999})
+        self.assertNotIn ('lc_MAJORITY', table.dtype.names)
+        self.checkTable (table, hrrZonal.numericStats)
+
+    def test_majority (self):
+        stats = ['COUNT', 'MAJORITY']
+        table = hrrZonal.zonalStats (self.zones, {'lc': self.lc}, stats, {'lc': -9999})
+        self.checkTable (table, stats)
+
+    def test_majority_blocks (self):
+        acc = hrrZonal.newAccumulator (['lc'], ['COUNT', 'MAJORITY'])
+        for r0 in range (0, 60, 16):
+            hrrZonal.addBlock (acc, self.zones[r0:r0 + 16], {'lc': self.lc[r0:r0 + 16]}, {'lc': -9999})
+        self.checkTable (hrrZonal.finishTable (acc), ['COUNT', 'MAJORITY'])
+
+    def test_majority_needs_integers (self):
+        dem = self.lc + 0.5
+        with self.assertRaises (ValueError):
+            hrrZonal.zonalStats (self.zones, {'dem': dem}, ['MAJORITY'])
+
+    def test_shape_mismatch (self):
+        with self.assertRaises (ValueError):
+            hrrZonal.zonalStats (self.zones, {'lc': self.lc[:-1]}, ['MEAN'])
+
+
+class ZonalRastersTest (unittest.TestCase):
+
+    def setUp (self):
+        self.folder = tempfile.mkdtemp ()
+        self.header = {'ncols': 20, 'nrows': 10, 'xllcorner': 0.0, 'yllcorner': 0.0, 'cellsize': 30.0,
+                       'NODATA_value': -9999}
+
+    def tearDown (self):
+        shutil.rmtree (self.folder)
+
+    def write (self, name, arr, **header):
+        path = os.path.join (self.folder, name)
+        hrrRaster.writeAscii (path, arr, dict (self.header, **header))
+        return path
+
+    def test_same_grid (self):
+        zones = self.write ('zones.asc', np.arange (200).reshape (10, 20) // 7 + 1)
+        values = self.write ('v.asc', np.arange (200, dtype = np.float64).reshape (10, 20))
+        table = hrrZonal.zonalStatsRasters (zones, {'v': values}, ['COUNT', 'MEAN'])
+        self.assertEqual (table['v_COUNT'].sum (), 200)
+
+    def test_tiles (self):
+        rng = np.random.RandomState (2)
+        zones = self.write ('zones.asc', rng.randint (-1, 30, (10, 20)), NODATA_value = -1)
+        lc = rng.randint (1, 6, (10, 20))
+        lc[rng.random_sample (lc.shape) < 0.2] = -9999
+        values = {'lc': self.write ('lc.asc', lc), 'v': self.write ('v.asc', rng.randint (0, 1000, (10, 20)) - 500)}
+        stats = ['COUNT', 'MEAN', 'MAX', 'MAJORITY']
+        whole = hrrZonal.zonalStatsRasters (zones, values, stats)
+        for tileSize in (3, 7, 64):
+            tiles = hrrZonal.zonalStatsRasters (zones, values, stats, tileFolder = self.folder, tileSize = tileSize)
+            self.assertEqual (tiles.dtype, whole.dtype)
+            for name in whole.dtype.names:
+                np.testing.assert_allclose (tiles[name], whole[name], rtol = 1e-12)
+        self.assertEqual (sorted (os.listdir (self.folder)), ['lc.asc', 'v.asc', 'zones.asc'])
+        # stores are read as they are
+        stores = dict ((n, os.path.join (self.folder, n + '_store')) for n in ('zones', 'lc', 'v'))
+        for n, path in stores.items ():
+            hrrRaster.rasterToTiles (os.path.join (self.folder, n + '.asc'), path, np.float64, 4)
+        tiles = hrrZonal.zonalStatsRasters (stores['zones'], {'lc': stores['lc'], 'v': stores['v']}, stats)
+        for name in whole.dtype.names:
+            np.testing.assert_allclose (tiles[name], whole[name], rtol = 1e-12)
+
+    def test_other_grid (self):
+        zones = self.write ('zones.asc', np.ones ((10, 20), dtype = np.int32))
+        for name, header in (('shift.asc', {'xllcorner': 15.0}), ('cell.asc', {'cellsize': 90.0})):
+            values = self.write (name, np.ones ((10, 20)), **header)
+            with self.assertRaises (ValueError):
+                hrrZonal.zonalStatsRasters (zones, {'v': values}, ['MEAN'])
+
+
+if __name__ == '__main__':
+    unittest.main ()